@@ -7,13 +7,31 @@ import secrets
 from functools import wraps
 import time
 import threading
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 import re
 import requests
-from datetime import datetime, timedelta
+import unicodedata
+import base64
+import json
+from bisect import bisect_left, bisect_right, insort
+from itertools import islice
+from datetime import datetime, timedelta, timezone
+import heapq
+import hmac
+import hashlib
+import math
+import socket
+import ipaddress
+from urllib.parse import urljoin, urlsplit
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from json_providers import json_default, select_json_provider
+
+# Proveedor JSON (json_providers.py): auto | orjson | stdlib
+JSON_PROVIDER = os.environ.get('JSON_PROVIDER', 'auto').lower()
 
 # Inicializar Flask
 app = Flask(__name__)
+app.json = select_json_provider(JSON_PROVIDER)(app)
 CORS(app)
 
 # Configuración de seguridad
@@ -135,6 +153,7 @@ PLAN_CONFIG = {
         'daily_limit': 200,
         'session_limit': 10,
         'rate_limit_per_minute': 15,
+        'suggestions_per_minute': 60,  # ✅ NUEVO: autocompletado (límite propio)
         'concurrent_requests': 1,
         'daily_streams_limit': 10,
         'features': {
@@ -157,6 +176,7 @@ PLAN_CONFIG = {
         'daily_limit': 30000,
         'session_limit': 2000,
         'rate_limit_per_minute': 120,
+        'suggestions_per_minute': 600,  # ✅ NUEVO: autocompletado (límite propio)
         'concurrent_requests': 3,
         'daily_streams_limit': 0,
         'features': {
@@ -182,6 +202,13 @@ SESSION_TIMEOUT = 3600  # 1 hora en segundos
 # Track requests por usuario para rate limiting
 user_request_times = defaultdict(list)
 request_lock = threading.Lock()
+# ✅ NUEVO: Las sugerencias de búsqueda usan su propio contador por minuto
+suggestion_request_times = defaultdict(list)
+# bucket -> (tiempos por usuario, clave del límite en PLAN_CONFIG)
+RATE_LIMIT_BUCKETS = {
+    'requests': (user_request_times, 'rate_limit_per_minute'),
+    'suggestions': (suggestion_request_times, 'suggestions_per_minute')
+}
 
 # IP-based rate limiting
 ip_request_times = defaultdict(list)
@@ -440,18 +467,21 @@ def notify_limit_reached(user_data, limit_type, current_usage, limit, reset_time
 def normalize_movie_data(movie_data, doc_id=None):
     if doc_id:
         movie_data['id'] = doc_id
+    # Leer 'details' una sola vez
+    details = movie_data.get('details') or {}
+    genres = details.get('genres')
     normalized = {
         'id': movie_data.get('id'),
         'title': movie_data.get('title', ''),
         'poster': movie_data.get('image_url', ''),
         'description': movie_data.get('sinopsis', ''),
-        'year': movie_data.get('details', {}).get('year', '') if movie_data.get('details') else movie_data.get('year', ''),
-        'genre': ', '.join(movie_data.get('details', {}).get('genres', [])) if movie_data.get('details') and movie_data.get('details', {}).get('genres') else movie_data.get('genre', ''),
-        'rating': movie_data.get('details', {}).get('rating', '') if movie_data.get('details') else movie_data.get('rating', ''),
+        'year': details.get('year', '') if details else movie_data.get('year', ''),
+        'genre': ', '.join(genres) if genres else movie_data.get('genre', ''),
+        'rating': details.get('rating', '') if details else movie_data.get('rating', ''),
         'original_title': movie_data.get('original_title', ''),
-        'actors': movie_data.get('details', {}).get('actors', []) if movie_data.get('details') else [],
-        'duration': movie_data.get('details', {}).get('duration', '') if movie_data.get('details') else '',
-        'director': movie_data.get('details', {}).get('director', '') if movie_data.get('details') else '',
+        'actors': details.get('actors', []),
+        'duration': details.get('duration', ''),
+        'director': details.get('director', ''),
         'play_links': movie_data.get('play_links', []),
         # ✅ NUEVOS CAMPOS AGREGADOS
         'type': movie_data.get('type', ''),  # Para identificar si es Anime
@@ -467,30 +497,25 @@ def normalize_series_data(series_data, doc_id=None):
     # Asegurar que seasons sea una lista
     seasons_data = series_data.get('seasons', {})
     normalized_seasons = []
-    
+
     if isinstance(seasons_data, dict):
-        for season_key, season_info in seasons_data.items():
-            if isinstance(season_info, dict):
-                season = {
-                    'season_number': season_info.get('season_number', 0),
-                    'episode_count': season_info.get('episode_count', 0),
-                    'year': season_info.get('year', ''),
-                    'episodes': normalize_episodes_data(season_info.get('episodes', {}))
-                }
-                normalized_seasons.append(season)
+        normalized_seasons = normalize_seasons_data(seasons_data)
     elif isinstance(seasons_data, list):
         normalized_seasons = seasons_data
-    
+
+    # Leer 'details' una sola vez
+    details = series_data.get('details') or {}
+    genres = details.get('genres')
     normalized = {
         'id': series_data.get('id'),
         'title': series_data.get('title', ''),
         'poster': series_data.get('image_url', ''),
         'description': series_data.get('sinopsis', ''),
-        'year': series_data.get('details', {}).get('year', '') if series_data.get('details') else series_data.get('year', ''),
-        'genre': ', '.join(series_data.get('details', {}).get('genres', [])) if series_data.get('details') and series_data.get('details', {}).get('genres') else series_data.get('genre', ''),
-        'rating': series_data.get('details', {}).get('rating', '') if series_data.get('details') else series_data.get('rating', ''),
+        'year': details.get('year', '') if details else series_data.get('year', ''),
+        'genre': ', '.join(genres) if genres else series_data.get('genre', ''),
+        'rating': details.get('rating', '') if details else series_data.get('rating', ''),
         'total_seasons': len(normalized_seasons),
-        'status': series_data.get('details', {}).get('status', '') if series_data.get('details') else '',
+        'status': details.get('status', ''),
         'seasons': normalized_seasons,
         'type': series_data.get('type', ''),
         'add': series_data.get('add', '')
@@ -671,19 +696,20 @@ def validate_channel_structure(data):
     
     return errors
 
-# FUNCIÓN PARA NORMALIZAR ID
-def normalize_id(title):
-    """Normaliza un título para crear un ID válido"""
-    import unicodedata
-    import re
-    
-    # Convertir a minúsculas y normalizar
-    normalized = title.lower()
-    # Quitar acentos
-    normalized = ''.join(
+# FUNCIÓN PARA PLEGAR TEXTO (minúsculas y sin acentos)
+def fold_text(text):
+    """Convierte a minúsculas y quita acentos (misma normalización que normalize_id)"""
+    normalized = str(text).lower()
+    return ''.join(
         c for c in unicodedata.normalize('NFD', normalized)
         if unicodedata.category(c) != 'Mn'
     )
+
+# FUNCIÓN PARA NORMALIZAR ID
+def normalize_id(title):
+    """Normaliza un título para crear un ID válido"""
+    # Convertir a minúsculas y quitar acentos
+    normalized = fold_text(title)
     # Reemplazar espacios y caracteres especiales
     normalized = re.sub(r'[^a-z0-9\s-]', '', normalized)
     normalized = re.sub(r'[\s-]+', '-', normalized)
@@ -759,6 +785,202 @@ def limit_content_info(content_data, content_type):
     
     return limited_data
 
+# =============================================
+# CACHÉ DE NORMALIZACIÓN
+# =============================================
+
+class LRUCache:
+    """Caché LRU thread-safe con expiración (TTL) opcional"""
+
+    def __init__(self, max_size, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            value, stored_at = item
+            if self.ttl is not None and time.time() - stored_at >= self.ttl:
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.time())
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            item = self._data.pop(key, None)
+            return item[0] if item else None
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+class SingleFlight:
+    """Agrupa cálculos concurrentes de la misma clave: uno solo ejecuta y el resto espera su resultado"""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, compute):
+        """Devuelve (resultado, compartido) donde compartido indica que otro hilo hizo el cálculo"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = {'event': threading.Event(), 'result': None, 'error': None}
+                self._calls[key] = call
+        if not leader:
+            call['event'].wait()
+            if call['error'] is not None:
+                raise call['error']
+            return call['result'], True
+        try:
+            call['result'] = compute()
+        except Exception as e:
+            call['error'] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call['event'].set()
+        return call['result'], False
+
+NORMALIZATION_CACHE_SIZE = int(os.environ.get('NORMALIZATION_CACHE_SIZE', 5000))
+
+# (colección, doc_id) -> {'version': update_time, 'full': vista completa,
+#                         'restricted': vista plan free, 'cost'/'restricted_cost': segundos de CPU}
+normalization_cache = LRUCache(NORMALIZATION_CACHE_SIZE)
+normalization_stats = {
+    'hits': 0,
+    'misses': 0,
+    'plan_view_hits': 0,
+    'plan_view_builds': 0,
+    'cpu_spent_seconds': 0.0,
+    'cpu_saved_seconds': 0.0
+}
+normalization_stats_lock = threading.Lock()
+
+CONTENT_NORMALIZERS = {
+    'peliculas': normalize_movie_data,
+    'contenido': normalize_series_data,
+    'canales': normalize_channel_data
+}
+
+# Tipo de contenido usado por limit_content_info según la colección
+CONTENT_TYPES = {
+    'peliculas': 'pelicula',
+    'contenido': 'serie',
+    'canales': 'canal'
+}
+CONTENT_COLLECTIONS = {content_type: name for name, content_type in CONTENT_TYPES.items()}
+
+def is_plan_restricted(user_data):
+    """Indica si el usuario recibe la vista limitada del plan free"""
+    return user_data.get('plan_type') == 'free' and not user_data.get('is_admin')
+
+def copy_cached_view(value):
+    """Copia profunda de una vista normalizada (solo dicts/listas son mutables)"""
+    if isinstance(value, dict):
+        return {key: copy_cached_view(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [copy_cached_view(item) for item in value]
+    return value
+
+def normalize_content(collection_name, doc_id, update_time, load_data, plan_restricted=False):
+    """Normaliza un documento de contenido reutilizando la versión en caché.
+
+    La entrada se reutiliza mientras update_time no cambie. Junto a la vista
+    completa se guarda la vista limitada del plan free, de modo que el recorte
+    por plan es una búsqueda en caché. Devuelve None si un documento de
+    'contenido' no es una serie válida (sin seasons).
+    """
+    key = (collection_name, doc_id)
+    entry = normalization_cache.get(key)
+    spent = 0.0
+    saved = 0.0
+
+    if entry is not None and update_time is not None and entry['version'] == update_time:
+        hit = True
+        saved += entry['cost']
+    else:
+        hit = False
+        start = time.thread_time()
+        data = load_data()
+        if collection_name == 'contenido' and not data.get('seasons'):
+            normalized = None
+        else:
+            normalized = CONTENT_NORMALIZERS[collection_name](data, doc_id)
+        cost = time.thread_time() - start
+        spent += cost
+        entry = {
+            'version': update_time,
+            'full': normalized,
+            'cost': cost,
+            'restricted': None,
+            'restricted_cost': 0.0
+        }
+        if update_time is not None:
+            normalization_cache.set(key, entry)
+
+    view = entry['full']
+    plan_view_hit = False
+    if view is not None and plan_restricted:
+        if entry['restricted'] is None:
+            start = time.thread_time()
+            entry['restricted'] = limit_content_info(view, CONTENT_TYPES[collection_name])
+            entry['restricted_cost'] = time.thread_time() - start
+            spent += entry['restricted_cost']
+        else:
+            plan_view_hit = True
+            saved += entry['restricted_cost']
+        view = entry['restricted']
+
+    with normalization_stats_lock:
+        normalization_stats['hits' if hit else 'misses'] += 1
+        if plan_restricted and view is not None:
+            normalization_stats['plan_view_hits' if plan_view_hit else 'plan_view_builds'] += 1
+        normalization_stats['cpu_spent_seconds'] += spent
+        normalization_stats['cpu_saved_seconds'] += saved
+
+    # ✅ NUEVO: copia profunda; los endpoints agregan claves como 'tipo' y
+    # select_best_link/el recorte por plan modifican play_links, seasons, etc.
+    return copy_cached_view(view) if view is not None else None
+
+def normalize_snapshot(collection_name, doc, plan_restricted=False):
+    """Normaliza un DocumentSnapshot de Firestore usando la caché"""
+    return normalize_content(collection_name, doc.id, doc.update_time, doc.to_dict, plan_restricted)
+
+def invalidate_normalized_content(collection_name, doc_id):
+    """Elimina de la caché las vistas normalizadas (completa y por plan) de un documento"""
+    normalization_cache.pop((collection_name, doc_id))
+
+def get_normalization_cache_stats():
+    """Estadísticas de la caché de normalización"""
+    with normalization_stats_lock:
+        stats = dict(normalization_stats)
+    lookups = stats['hits'] + stats['misses']
+    stats['size'] = len(normalization_cache)
+    stats['max_size'] = NORMALIZATION_CACHE_SIZE
+    stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0
+    stats['cpu_spent_seconds'] = round(stats['cpu_spent_seconds'], 6)
+    stats['cpu_saved_seconds'] = round(stats['cpu_saved_seconds'], 6)
+    return stats
+
 # NUEVA FUNCIÓN: Verificación de dominio permitido
 def check_domain_restriction(user_data):
     """Verificar si el dominio de origen está permitido para este token"""
@@ -892,7 +1114,7 @@ def check_ip_rate_limit(ip_address):
     return None
 
 # Función para verificar rate limiting por usuario
-def check_user_rate_limit(user_data):
+def check_user_rate_limit(user_data, bucket='requests'):
     # Admin no tiene rate limiting
     if user_data.get('is_admin'):
         return None
@@ -901,20 +1123,21 @@ def check_user_rate_limit(user_data):
     plan_type = user_data.get('plan_type', 'free')
     current_time = time.time()
     plan_config = PLAN_CONFIG[plan_type]
+    request_times, limit_key = RATE_LIMIT_BUCKETS[bucket]
     with request_lock:
-        user_request_times[user_id] = [
-            req_time for req_time in user_request_times[user_id] 
+        request_times[user_id] = [
+            req_time for req_time in request_times[user_id] 
             if current_time - req_time < 60
         ]
-        if len(user_request_times[user_id]) >= plan_config['rate_limit_per_minute']:
+        if len(request_times[user_id]) >= plan_config[limit_key]:
             return {
                 "error": "Límite de requests por minuto excedido",
-                "limit_type": "rate_limit",
-                "current_usage": len(user_request_times[user_id]),
-                "limit": plan_config['rate_limit_per_minute'],
+                "limit_type": "rate_limit" if bucket == 'requests' else f"rate_limit_{bucket}",
+                "current_usage": len(request_times[user_id]),
+                "limit": plan_config[limit_key],
                 "wait_time": 60
             }, 429
-        user_request_times[user_id].append(current_time)
+        request_times[user_id].append(current_time)
     return None
 
 # NUEVA FUNCIÓN: Verificar y actualizar límites de streams
@@ -990,6 +1213,7 @@ def check_stream_limits(user_data):
             update_data['daily_streams_reset_timestamp'] = current_time
         
         user_ref.update(update_data)
+        record_usage_stat(plan_type, 'total_streams')
         return None
         
     except Exception as e:
@@ -1072,6 +1296,8 @@ def check_usage_limits(user_data):
         if 'session_start_timestamp' not in user_info:
             update_data['session_start_timestamp'] = current_time
         user_ref.update(update_data)
+        record_usage_stat(plan_type, 'total_requests')
+        record_usage_event('requests', plan_type, endpoint=request.endpoint)
         return None
     except Exception as e:
         print(f"Error verificando límites de uso: {e}")
@@ -1083,17 +1309,33 @@ def check_usage_limits(user_data):
 
 # Decorador para requerir autenticación
 def token_required(f):
+    return authenticate_request(f, charge_usage=True)
+
+def token_required_uncharged(rate_limit_bucket):
+    """Como token_required, pero sin consumir cuota diaria/sesión.
+
+    Aplica solo el rate limit del bucket indicado (RATE_LIMIT_BUCKETS), que
+    no comparte contador con las peticiones normales.
+    """
+    def decorator(f):
+        return authenticate_request(f, charge_usage=False, rate_limit_bucket=rate_limit_bucket)
+    return decorator
+
+def get_request_token():
+    """Token de la petición (?token= o header Authorization: Bearer), o None"""
+    if request.args.get('token'):
+        return request.args.get('token')
+    if 'Authorization' in request.headers:
+        try:
+            return request.headers['Authorization'].split(" ")[1]
+        except IndexError:
+            pass
+    return None
+
+def authenticate_request(f, charge_usage=True, rate_limit_bucket='requests'):
     @wraps(f)
     def decorated(*args, **kwargs):
-        token = None
-        if request.args.get('token'):
-            token = request.args.get('token')
-        elif 'Authorization' in request.headers:
-            auth_header = request.headers['Authorization']
-            try:
-                token = auth_header.split(" ")[1]
-            except IndexError:
-                pass
+        token = get_request_token()
         if not token:
             return jsonify({"error": "Token de acceso requerido"}), 401
         if len(token) < 10 or len(token) > 500:
@@ -1127,7 +1369,10 @@ def token_required(f):
             if domain_check:
                 return jsonify(domain_check[0]), domain_check[1]
             
-            limit_check = check_usage_limits(user_data)
+            if charge_usage:
+                limit_check = check_usage_limits(user_data)
+            else:
+                limit_check = check_user_rate_limit(user_data, rate_limit_bucket)
             if limit_check:
                 return jsonify(limit_check[0]), limit_check[1]
             return f(user_data, *args, **kwargs)
@@ -1136,24 +1381,32 @@ def token_required(f):
             return jsonify({"error": "Error de autenticación"}), 500
     return decorated
 
+# Verificación de características del plan (reutilizable dentro de un endpoint)
+def plan_feature_denied(user_data, feature_name):
+    """Devuelve la respuesta 403 si el plan no incluye la característica, o None"""
+    # Admin siempre tiene acceso a todas las características
+    if user_data.get('is_admin'):
+        return None
+    plan_type = user_data.get('plan_type', 'free')
+    features = PLAN_CONFIG[plan_type]['features']
+    if not features.get(feature_name, False):
+        return jsonify({
+            "error": f"Esta característica no está disponible en tu plan {plan_type}",
+            "feature_required": feature_name,
+            "upgrade_required": True,
+            "current_plan": plan_type,
+            "required_plan": "premium"
+        }), 403
+    return None
+
 # Middleware para verificar características del plan
 def check_plan_feature(feature_name):
     def decorator(f):
         @wraps(f)
         def decorated_function(user_data, *args, **kwargs):
-            # Admin siempre tiene acceso a todas las características
-            if user_data.get('is_admin'):
-                return f(user_data, *args, **kwargs)
-            plan_type = user_data.get('plan_type', 'free')
-            features = PLAN_CONFIG[plan_type]['features']
-            if not features.get(feature_name, False):
-                return jsonify({
-                    "error": f"Esta característica no está disponible en tu plan {plan_type}",
-                    "feature_required": feature_name,
-                    "upgrade_required": True,
-                    "current_plan": plan_type,
-                    "required_plan": "premium"
-                }), 403
+            denied = plan_feature_denied(user_data, feature_name)
+            if denied:
+                return denied
             return f(user_data, *args, **kwargs)
         return decorated_function
     return decorator
@@ -1165,6 +1418,7 @@ def check_plan_feature(feature_name):
 # Middleware de seguridad global
 @app.before_request
 def before_request():
+    ensure_link_monitoring_started()
     ip_address = request.remote_addr
     ip_limit_check = check_ip_rate_limit(ip_address)
     if ip_limit_check:
@@ -1202,189 +1456,2483 @@ def validate_username(username):
     pattern = r'^[a-zA-Z0-9_-]+$'
     return re.match(pattern, username) is not None
 
-@app.route('/api/auth/register', methods=['POST'])
-def public_register():
-    """Registro público para usuarios nuevos (siempre plan FREE)"""
-    try:
-        data = request.get_json()
-        if not data:
-            return jsonify({"error": "Datos JSON requeridos"}), 400
-        
-        username = data.get('username')
-        email = data.get('email')
-        password = data.get('password')  # Opcional para futura autenticación
-        
-        if not username or not email:
-            return jsonify({"error": "Username y email son requeridos"}), 400
-        
-        if not validate_username(username):
-            return jsonify({"error": "Username inválido"}), 400
-        
-        if not validate_email(email):
-            return jsonify({"error": "Email inválido"}), 400
-        
-        # Verificar si el usuario ya existe
-        users_ref = db.collection(TOKENS_COLLECTION)
-        existing_user = users_ref.where('email', '==', email).limit(1).stream()
-        if any(existing_user):
-            return jsonify({"error": "El email ya está registrado"}), 400
-        
-        # Generar token único
-        token = generate_unique_token()
-        current_time = time.time()
-        
-        # CREAR USUARIO SIEMPRE CON PLAN FREE
-        user_data = {
-            'username': username,
-            'email': email,
-            'token': token,
-            'active': True,
-            'is_admin': False,
-            'plan_type': 'free',  # SIEMPRE FREE POR DEFECTO
-            'created_at': firestore.SERVER_TIMESTAMP,
-            'last_used': None,
-            'total_usage_count': 0,
-            'daily_usage_count': 0,
-            'session_usage_count': 0,
-            'daily_streams_used': 0,
-            'total_streams_count': 0,
-            'daily_reset_timestamp': current_time,
-            'daily_streams_reset_timestamp': current_time,
-            'session_start_timestamp': current_time,
-            'max_requests_per_day': PLAN_CONFIG['free']['daily_limit'],
-            'max_requests_per_session': PLAN_CONFIG['free']['session_limit'],
-            'max_daily_streams': PLAN_CONFIG['free']['daily_streams_limit'],
-            'features': PLAN_CONFIG['free']['features'],
-            'allowed_domains': [],  # Sin restricciones iniciales
-            'is_frontend_token': False
-        }
-        
-        # Guardar usuario
-        user_ref = users_ref.document()
-        user_ref.set(user_data)
-        
-        return jsonify({
-            "success": True,
-            "message": "Usuario registrado exitosamente",
-            "user": {
-                "user_id": user_ref.id,
-                "username": username,
-                "email": email,
-                "token": token,
-                "plan_type": "free"
-            },
-            "limits": {
-                "daily": PLAN_CONFIG['free']['daily_limit'],
-                "session": PLAN_CONFIG['free']['session_limit'],
-                "daily_streams": PLAN_CONFIG['free']['daily_streams_limit']
-            }
-        }), 201
-        
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+# =============================================
+# CONSULTAS CONCURRENTES A FIRESTORE
+# =============================================
 
-@app.route('/api/auth/login', methods=['POST'])
-def public_login():
-    """Login público usando token (para app móvil)"""
-    try:
-        data = request.get_json()
-        if not data:
-            return jsonify({"error": "Datos JSON requeridos"}), 400
-        
-        token = data.get('token')
-        
-        if not token:
-            return jsonify({"error": "Token requerido"}), 400
-        
-        # Verificar token en la base de datos
-        users_ref = db.collection(TOKENS_COLLECTION)
-        query = users_ref.where('token', '==', token).limit(1).stream()
-        
-        user_data = None
-        user_id = None
-        for doc in query:
-            user_data = doc.to_dict()
-            user_id = doc.id
-            break
-        
-        if not user_data:
-            return jsonify({"error": "Token inválido"}), 401
-        
-        if not user_data.get('active', True):
-            return jsonify({"error": "Cuenta desactivada"}), 401
-        
-        # Actualizar último acceso
-        users_ref.document(user_id).update({
-            'last_used': firestore.SERVER_TIMESTAMP
-        })
-        
-        # Preparar respuesta
-        user_response = {
-            "user_id": user_id,
-            "username": user_data.get('username'),
-            "email": user_data.get('email'),
-            "token": token,
-            "plan_type": user_data.get('plan_type', 'free'),
-            "is_admin": user_data.get('is_admin', False),
-            "active": user_data.get('active', True)
-        }
-        
-        return jsonify({
-            "success": True,
-            "message": "Login exitoso",
-            "user": user_response
-        })
-        
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+QUERY_POOL_SIZE = int(os.environ.get('QUERY_POOL_SIZE', 8))
+QUERY_TIMEOUT = float(os.environ.get('QUERY_TIMEOUT', 5))  # segundos por consulta
 
-@app.route('/api/auth/verify', methods=['GET'])
-def verify_token():
-    """Verificar si un token es válido"""
-    token = request.args.get('token')
-    
-    if not token:
-        return jsonify({"error": "Token requerido"}), 400
-    
-    try:
-        users_ref = db.collection(TOKENS_COLLECTION)
-        query = users_ref.where('token', '==', token).limit(1).stream()
-        
-        for doc in query:
-            user_data = doc.to_dict()
-            if user_data.get('active', True):
-                return jsonify({
-                    "success": True,
-                    "valid": True,
-                    "user": {
-                        "user_id": doc.id,
-                        "username": user_data.get('username'),
-                        "plan_type": user_data.get('plan_type', 'free')
-                    }
-                })
-        
-        return jsonify({
-            "success": True,
-            "valid": False,
-            "message": "Token inválido o cuenta inactiva"
-        })
-        
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+# Pool compartido y acotado para consultas independientes (no anidar tareas)
+query_executor = ThreadPoolExecutor(max_workers=QUERY_POOL_SIZE, thread_name_prefix='firestore-query')
+
+def run_concurrent_queries(tasks, timeout=QUERY_TIMEOUT):
+    """Ejecuta consultas independientes en paralelo y combina sus resultados.
+
+    tasks es {nombre: función sin argumentos}. Devuelve (resultados, degradadas):
+    una consulta que falla o excede el timeout se omite en lugar de bloquear
+    la respuesta completa.
+
+    cancel() solo descarta tareas que aún no empezaron: cada tarea debe pasar
+    su propio timeout al RPC (stream_query, count_query) para no retener un
+    hilo del pool después de que la respuesta ya se degradó.
+    """
+    futures = {name: query_executor.submit(task) for name, task in tasks.items()}
+    deadline = time.time() + timeout
+    results = {}
+    degraded = []
+    for name, future in futures.items():
+        try:
+            results[name] = future.result(timeout=max(0, deadline - time.time()))
+        except FuturesTimeoutError:
+            future.cancel()
+            degraded.append(name)
+            print(f"⚠️ Consulta '{name}' excedió {timeout}s, respuesta degradada")
+        except Exception as e:
+            degraded.append(name)
+            print(f"⚠️ Consulta '{name}' falló, respuesta degradada: {e}")
+    return results, degraded
+
+def stream_query(query, timeout=QUERY_TIMEOUT):
+    """Materializa un query dentro del hilo del pool (el RPC se corta al vencer el timeout)"""
+    return lambda: list(query.stream(timeout=timeout))
 
 # =============================================
-# ENDPOINTS DE CONEXIÓN Y RECONEXIÓN
+# CONTADORES DE COLECCIONES
 # =============================================
 
-@app.route('/api/connection/status', methods=['GET'])
-def connection_status():
-    """Verificar estado de la conexión Firebase"""
-    try:
-        firebase_healthy = check_firebase_connection()
-        current_time = time.time()
-        
-        status_info = {
-            "success": True,
+COUNT_CACHE_TTL = int(os.environ.get('COUNT_CACHE_TTL', 60))  # segundos
+
+# Consultas de conteo exacto (agregación count(), 1 lectura por cada 1000 entradas de índice)
+COUNT_QUERIES = {
+    'peliculas': lambda: db.collection('peliculas'),
+    # Solo series con temporadas: has_seasons lo mantienen las escrituras de la API
+    # y backfill_series_flags para documentos escritos por otros medios
+    'contenido': lambda: db.collection('contenido').where(filter=firestore.FieldFilter('has_seasons', '==', True)),
+    'canales': lambda: db.collection('canales')
+}
+
+def series_has_seasons(data):
+    """Mismo criterio que los listados: una serie sin temporadas (None, {} o []) no cuenta"""
+    return bool(data.get('seasons'))
+
+# clave -> (valor, obtenido_en)
+collection_counts = {}
+collection_counts_lock = threading.Lock()
+
+def count_query(query, timeout=QUERY_TIMEOUT):
+    """Ejecuta una agregación count() y devuelve el entero (RPC con timeout)"""
+    result = query.count(alias='total').get(timeout=timeout)
+    return int(result[0][0].value)
+
+def get_collection_count(key, query_factory=None, ttl=None):
+    """Conteo exacto cacheado en memoria con TTL corto.
+
+    key identifica el conteo (nombre de colección o una tupla para conteos
+    filtrados); query_factory construye el query si no está en COUNT_QUERIES.
+    """
+    ttl = COUNT_CACHE_TTL if ttl is None else ttl
+    with collection_counts_lock:
+        cached = collection_counts.get(key)
+    if cached is not None and time.time() - cached[1] < ttl:
+        return cached[0]
+    value = count_query((query_factory or COUNT_QUERIES[key])())
+    with collection_counts_lock:
+        collection_counts[key] = (value, time.time())
+    return value
+
+def adjust_collection_count(key, delta):
+    """Ajusta un conteo cacheado tras un alta/baja sin volver a consultar Firestore"""
+    with collection_counts_lock:
+        cached = collection_counts.get(key)
+        if cached is not None:
+            collection_counts[key] = (max(0, cached[0] + delta), cached[1])
+
+def invalidate_collection_count(key):
+    with collection_counts_lock:
+        collection_counts.pop(key, None)
+
+# =============================================
+# ESTADÍSTICAS DE USO AGREGADAS POR PLAN
+# =============================================
+
+STATS_COLLECTION = 'api_stats'
+USAGE_STATS_DOC_ID = 'usage'
+USAGE_STATS_FLUSH_INTERVAL = int(os.environ.get('USAGE_STATS_FLUSH_INTERVAL', 30))  # segundos
+USAGE_STATS_RECONCILE_INTERVAL = int(os.environ.get('USAGE_STATS_RECONCILE_INTERVAL', 21600))  # 6 horas
+# Tiempo máximo que un proceso retiene la reconciliación antes de que otro pueda retomarla
+USAGE_STATS_RECONCILE_LEASE = int(os.environ.get('USAGE_STATS_RECONCILE_LEASE', 3600))  # segundos
+USAGE_STAT_FIELDS = ['users', 'total_requests', 'total_streams']
+
+# Incrementos aún no escritos en el documento de contadores:
+# segundo en que se registraron -> plan -> campo -> delta
+usage_stats_pending = {}
+usage_stats_lock = threading.Lock()
+
+def usage_stats_ref():
+    return db.collection(STATS_COLLECTION).document(USAGE_STATS_DOC_ID)
+
+def record_usage_stat(plan_type, field, delta=1, recorded_at=None):
+    """Acumula un incremento en memoria; se escribe en lote con flush_usage_stats"""
+    plan = plan_type if plan_type in PLAN_CONFIG else 'free'
+    second = int(time.time()) if recorded_at is None else recorded_at
+    with usage_stats_lock:
+        plans = usage_stats_pending.setdefault(second, {})
+        values = plans.setdefault(plan, {})
+        values[field] = values.get(field, 0) + delta
+
+def record_plan_change(user_info, old_plan, new_plan):
+    """Mueve un usuario y su uso acumulado de un plan a otro"""
+    if old_plan == new_plan:
+        return
+    moved = {
+        'users': 1,
+        'total_requests': user_info.get('total_usage_count', 0),
+        'total_streams': user_info.get('total_streams_count', 0)
+    }
+    for field, value in moved.items():
+        record_usage_stat(old_plan, field, -value)
+        record_usage_stat(new_plan, field, value)
+
+def sum_usage_deltas(pending, since=0):
+    """Suma por plan y campo los incrementos registrados a partir del segundo `since`"""
+    totals = {}
+    for recorded_at, plans in pending.items():
+        if recorded_at < since:
+            continue
+        for plan, values in plans.items():
+            for field, delta in values.items():
+                if delta:
+                    totals.setdefault(plan, {})
+                    totals[plan][field] = totals[plan].get(field, 0) + delta
+    return totals
+
+def get_pending_usage_stats(since=0):
+    with usage_stats_lock:
+        pending = {recorded_at: {plan: dict(values) for plan, values in plans.items()}
+                   for recorded_at, plans in usage_stats_pending.items()}
+    totals = sum_usage_deltas(pending, since)
+    return {plan: totals.get(plan, {}) for plan in PLAN_CONFIG}
+
+@firestore.transactional
+def write_usage_deltas(transaction, stats_ref, pending):
+    """Aplica los incrementos pendientes respetando la reconciliación en curso o la última.
+
+    - Los registrados antes de `reconciled_from` ya los contó el recorrido de
+      usuarios de la última reconciliación: se descartan.
+    - Los registrados desde `reconciling_since` se suman además a
+      `since_reconcile_start`, para que la reconciliación en curso los añada
+      a su recorrido en lugar de pisarlos.
+    """
+    snapshot = stats_ref.get(transaction=transaction)
+    stored = (snapshot.to_dict() if snapshot.exists else None) or {}
+    totals = sum_usage_deltas(pending, stored.get('reconciled_from', 0))
+    update = {
+        plan: {field: firestore.Increment(delta) for field, delta in values.items()}
+        for plan, values in totals.items()
+    }
+    reconciling_since = stored.get('reconciling_since')
+    if reconciling_since is not None:
+        since_start = sum_usage_deltas(pending, reconciling_since)
+        if since_start:
+            update['since_reconcile_start'] = {
+                plan: {field: firestore.Increment(delta) for field, delta in values.items()}
+                for plan, values in since_start.items()
+            }
+    if update:
+        transaction.set(stats_ref, update, merge=True)
+
+def flush_usage_stats():
+    """Escribe los incrementos pendientes con una sola escritura (firestore.Increment)"""
+    if not db:
+        return
+    with usage_stats_lock:
+        pending = dict(usage_stats_pending)
+        usage_stats_pending.clear()
+    if not pending:
+        return
+    try:
+        write_usage_deltas(db.transaction(), usage_stats_ref(), pending)
+    except Exception:
+        # Conservar los incrementos (con su segundo de registro) para el próximo intento
+        for recorded_at, plans in pending.items():
+            for plan, values in plans.items():
+                for field, delta in values.items():
+                    record_usage_stat(plan, field, delta, recorded_at=recorded_at)
+        raise
+
+def compute_usage_stats_from_users():
+    """Recorre api_users completo (solo para reconciliar) y devuelve los totales por plan.
+
+    Los usuarios antiguos sin plan_type cuentan como free; se les escribe
+    plan_type='free' para que la consulta de usuarios activos por plan los
+    encuentre igual que este recorrido.
+    """
+    stats = {plan: {field: 0 for field in USAGE_STAT_FIELDS} for plan in PLAN_CONFIG}
+    fields = ['plan_type', 'total_usage_count', 'total_streams_count']
+    batch, pending_writes, backfilled = db.batch(), 0, 0
+    for doc in db.collection(TOKENS_COLLECTION).select(fields).stream():
+        user_info = doc.to_dict()
+        plan = user_info.get('plan_type')
+        if plan is None:
+            batch.update(doc.reference, {'plan_type': 'free'})
+            pending_writes += 1
+            backfilled += 1
+            if pending_writes >= 400:
+                batch.commit()
+                batch, pending_writes = db.batch(), 0
+        plan = plan if plan in PLAN_CONFIG else 'free'
+        stats[plan]['users'] += 1
+        stats[plan]['total_requests'] += user_info.get('total_usage_count', 0) or 0
+        stats[plan]['total_streams'] += user_info.get('total_streams_count', 0) or 0
+    if pending_writes:
+        batch.commit()
+    if backfilled:
+        print(f"📊 plan_type='free' asignado a {backfilled} usuarios sin plan")
+    return stats
+
+@firestore.transactional
+def store_reconciled_usage_stats(transaction, stats_ref, stats, reconcile_from):
+    """Sobrescribe los contadores con el recorrido más lo registrado desde su inicio.
+
+    Devuelve None si otra reconciliación empezó después de esta.
+    """
+    snapshot = stats_ref.get(transaction=transaction)
+    stored = (snapshot.to_dict() if snapshot.exists else None) or {}
+    if stored.get('reconciling_since') != reconcile_from:
+        return None
+    since_start = stored.get('since_reconcile_start') or {}
+    reconciled = {
+        plan: {field: stats[plan][field] + (since_start.get(plan) or {}).get(field, 0) for field in USAGE_STAT_FIELDS}
+        for plan in PLAN_CONFIG
+    }
+    transaction.set(stats_ref, {
+        **reconciled,
+        'reconciled_from': reconcile_from,
+        'reconciled_at': firestore.SERVER_TIMESTAMP
+    })
+    return reconciled
+
+@firestore.transactional
+def claim_usage_reconcile(transaction, stats_ref, reconcile_from, force):
+    """Reserva la reconciliación para este proceso; False si otro la tiene o es reciente.
+
+    La marca `reconciling_since` hace de lease para todo el despliegue: solo
+    un proceso recorre api_users por intervalo, no cada worker.
+    """
+    snapshot = stats_ref.get(transaction=transaction)
+    stored = (snapshot.to_dict() if snapshot.exists else None) or {}
+    reconciling_since = stored.get('reconciling_since')
+    if reconciling_since is not None and reconcile_from - reconciling_since < USAGE_STATS_RECONCILE_LEASE:
+        return False
+    last = stored.get('reconciled_from')
+    if not force and last is not None and reconcile_from - last < USAGE_STATS_RECONCILE_INTERVAL * 0.9:
+        return False
+    transaction.set(stats_ref, {
+        'reconciling_since': reconcile_from,
+        'since_reconcile_start': firestore.DELETE_FIELD
+    }, merge=True)
+    return True
+
+def reconcile_usage_stats(force=False):
+    """Recalcula los contadores desde los usuarios y los sobrescribe.
+
+    Antes del recorrido se marca `reconciling_since`; los incrementos
+    registrados desde ese segundo (en cualquier worker) se acumulan aparte y
+    se suman al resultado, y los anteriores que aún no se hubieran escrito se
+    descartan porque el recorrido ya los incluye.
+
+    No es exacto: un incremento registrado mientras dura el recorrido se
+    cuenta dos veces si el recorrido leyó al usuario después de actualizarse
+    (el error queda acotado a la actividad de esa ventana y lo corrige la
+    siguiente reconciliación). Devuelve None si otro proceso tiene la
+    reconciliación o la hizo hace menos de un intervalo (salvo force).
+    """
+    if not db:
+        return None
+    start = time.time()
+    reconcile_from = int(start)
+    stats_ref = usage_stats_ref()
+    if not claim_usage_reconcile(db.transaction(), stats_ref, reconcile_from, force):
+        return None
+    stats = compute_usage_stats_from_users()
+    reconciled = store_reconciled_usage_stats(db.transaction(), stats_ref, stats, reconcile_from)
+    if reconciled is None:
+        print("⚠️ Reconciliación de estadísticas de uso descartada: otra empezó después")
+        return None
+    print(f"📊 Estadísticas de uso reconciliadas en {time.time() - start:.2f}s")
+    return reconciled
+
+# Una sola reconciliación en curso por proceso
+usage_reconcile_lock = threading.Lock()
+
+def _reconcile_usage_in_background(force):
+    try:
+        reconcile_usage_stats(force)
+    except Exception as e:
+        print(f"❌ Error reconciliando estadísticas de uso: {e}")
+    finally:
+        usage_reconcile_lock.release()
+
+def schedule_usage_reconcile(force=False):
+    """Lanza la reconciliación en segundo plano (nunca en el hilo de la petición); False si ya hay una"""
+    if not usage_reconcile_lock.acquire(blocking=False):
+        return False
+    threading.Thread(target=_reconcile_usage_in_background, args=(force,), daemon=True).start()
+    return True
+
+def active_users_query(plan_type):
+    """Usuarios del plan con actividad en las últimas 24h (requiere índice compuesto plan_type + last_used)"""
+    def build():
+        since = datetime.now(timezone.utc) - timedelta(days=1)
+        return (
+            db.collection(TOKENS_COLLECTION)
+            .where(filter=firestore.FieldFilter('plan_type', '==', plan_type))
+            .where(filter=firestore.FieldFilter('last_used', '>=', since))
+        )
+    return build
+
+def usage_stats_initializing(stored):
+    return 'reconciled_from' not in stored
+
+def current_usage_stats():
+    """Contadores por plan: documento agregado (1 lectura) + incrementos pendientes.
+
+    Devuelve (documento almacenado, {plan: {campo: valor}}). Si aún no hay
+    una reconciliación completa se programa en segundo plano y los valores
+    son parciales: usage_stats_initializing(stored) lo indica.
+    """
+    stats_doc = usage_stats_ref().get()
+    stored = (stats_doc.to_dict() if stats_doc.exists else None) or {}
+    if usage_stats_initializing(stored):
+        schedule_usage_reconcile()
+    pending = get_pending_usage_stats(since=stored.get('reconciled_from', 0))
+    merged = {
+        plan: {
+            field: (stored.get(plan) or {}).get(field, 0) + pending[plan].get(field, 0)
+            for field in USAGE_STAT_FIELDS
+        }
+        for plan in PLAN_CONFIG
+    }
+    return stored, merged
+
+# =============================================
+# SERIES TEMPORALES DE USO (ROLLUPS)
+# =============================================
+
+USAGE_ROLLUPS_COLLECTION = 'usage_rollups'
+ROLLUP_FLUSH_INTERVAL = int(os.environ.get('ROLLUP_FLUSH_INTERVAL', 30))  # segundos
+# Resolución -> tamaño del bucket en segundos
+ROLLUP_RESOLUTIONS = {'minute': 60, 'hour': 3600}
+# Resolución -> segundos que se conserva cada documento (campo expires_at, política TTL de Firestore)
+ROLLUP_RETENTION = {'minute': 2 * 86400, 'hour': 90 * 86400}
+ROLLUP_METRICS = ['requests', 'streams']
+# Dimensión -> mapa dentro de cada métrica
+ROLLUP_DIMENSIONS = {'plan': 'by_plan', 'endpoint': 'by_endpoint', 'content': 'by_content'}
+# Métrica -> dimensiones que se registran para ella
+ROLLUP_METRIC_DIMENSIONS = {'requests': ['plan', 'endpoint'], 'streams': ['plan', 'content']}
+ROLLUP_MAX_POINTS = 1440
+ROLLUP_BATCH_SIZE = 400  # escrituras por lote (máximo de Firestore: 500)
+
+# (resolución, inicio del bucket) -> métrica -> {'total': n, 'by_plan': {...}, ...}
+rollup_pending = {}
+rollup_lock = threading.Lock()
+
+def rollup_bucket_start(timestamp, resolution):
+    size = ROLLUP_RESOLUTIONS[resolution]
+    return int(timestamp // size * size)
+
+def rollup_doc_id(resolution, bucket_start):
+    """ID legible y ordenable: 'hour_202610181300'"""
+    return f"{resolution}_{datetime.fromtimestamp(bucket_start, timezone.utc).strftime('%Y%m%d%H%M')}"
+
+def merge_rollup_counters(target, source):
+    """Suma recursivamente los contadores de source en target"""
+    for key, value in source.items():
+        if isinstance(value, dict):
+            merge_rollup_counters(target.setdefault(key, {}), value)
+        else:
+            target[key] = target.get(key, 0) + value
+
+def record_usage_event(metric, plan_type, endpoint=None, content_id=None):
+    """Acumula un evento en los buckets de minuto y hora; se escribe con flush_usage_rollups"""
+    now = time.time()
+    dimensions = {'plan': plan_type if plan_type in PLAN_CONFIG else 'free'}
+    if endpoint:
+        dimensions['endpoint'] = endpoint
+    if content_id:
+        dimensions['content'] = content_id
+    event = {'total': 1}
+    for dimension, value in dimensions.items():
+        event[ROLLUP_DIMENSIONS[dimension]] = {value: 1}
+    with rollup_lock:
+        for resolution in ROLLUP_RESOLUTIONS:
+            bucket = rollup_pending.setdefault((resolution, rollup_bucket_start(now, resolution)), {})
+            merge_rollup_counters(bucket.setdefault(metric, {}), event)
+
+def rollup_increments(counters):
+    """Convierte contadores en firestore.Increment para un set(merge=True)"""
+    return {
+        key: rollup_increments(value) if isinstance(value, dict) else firestore.Increment(value)
+        for key, value in counters.items()
+    }
+
+def flush_usage_rollups():
+    """Escribe los buckets pendientes, un documento por bucket, en lotes"""
+    if not db:
+        return
+    with rollup_lock:
+        pending = list(rollup_pending.items())
+        rollup_pending.clear()
+    if not pending:
+        return
+    written = 0
+    try:
+        for start in range(0, len(pending), ROLLUP_BATCH_SIZE):
+            chunk = pending[start:start + ROLLUP_BATCH_SIZE]
+            batch = db.batch()
+            for (resolution, bucket_start), metrics in chunk:
+                document = {
+                    'resolution': resolution,
+                    'bucket_start': bucket_start,
+                    'expires_at': datetime.fromtimestamp(bucket_start + ROLLUP_RETENTION[resolution], timezone.utc)
+                }
+                document.update({metric: rollup_increments(counters) for metric, counters in metrics.items()})
+                batch.set(
+                    db.collection(USAGE_ROLLUPS_COLLECTION).document(rollup_doc_id(resolution, bucket_start)),
+                    document,
+                    merge=True
+                )
+            batch.commit()
+            written += len(chunk)
+    except Exception:
+        # Conservar los buckets no escritos para el próximo intento
+        with rollup_lock:
+            for key, metrics in pending[written:]:
+                merge_rollup_counters(rollup_pending.setdefault(key, {}), metrics)
+        raise
+
+def get_pending_rollups(resolution, from_start, to_start):
+    """Buckets aún no escritos dentro del rango: inicio -> métricas"""
+    result = {}
+    with rollup_lock:
+        for (bucket_resolution, bucket_start), metrics in rollup_pending.items():
+            if bucket_resolution == resolution and from_start <= bucket_start <= to_start:
+                merge_rollup_counters(result.setdefault(bucket_start, {}), metrics)
+    return result
+
+def query_usage_rollups(metric, resolution, from_start, to_start):
+    """Contadores de una métrica por bucket (documentos + pendientes): inicio -> contadores.
+
+    Requiere índice compuesto resolution + bucket_start.
+    """
+    query = (
+        db.collection(USAGE_ROLLUPS_COLLECTION)
+        .where(filter=firestore.FieldFilter('resolution', '==', resolution))
+        .where(filter=firestore.FieldFilter('bucket_start', '>=', from_start))
+        .where(filter=firestore.FieldFilter('bucket_start', '<=', to_start))
+        .order_by('bucket_start')
+        .select(['bucket_start', metric])
+    )
+    buckets = {}
+    for doc in query.stream():
+        data = doc.to_dict()
+        buckets[data['bucket_start']] = data.get(metric) or {}
+    for bucket_start, metrics in get_pending_rollups(resolution, from_start, to_start).items():
+        merge_rollup_counters(buckets.setdefault(bucket_start, {}), metrics.get(metric, {}))
+    return buckets
+
+# =============================================
+# LISTADO DE USUARIOS PARA ADMINISTRACIÓN
+# =============================================
+
+ADMIN_USERS_DEFAULT_LIMIT = 50
+ADMIN_USERS_MAX_LIMIT = 500
+
+# Proyección del listado: todos los campos del usuario salvo el token
+ADMIN_USER_LIST_FIELDS = [
+    'username', 'email', 'active', 'is_admin', 'plan_type', 'created_at', 'last_used',
+    'total_usage_count', 'daily_usage_count', 'session_usage_count',
+    'daily_streams_used', 'total_streams_count',
+    'daily_reset_timestamp', 'daily_streams_reset_timestamp', 'session_start_timestamp',
+    'max_requests_per_day', 'max_requests_per_session', 'max_daily_streams', 'features',
+    'allowed_domains', 'is_frontend_token', 'allowed_collections',
+    'can_create_content', 'can_edit_content', 'can_delete_content', 'frontend_permissions',
+    'plan_updated_at', 'last_token_regenerated', 'regenerated_by_admin'
+]
+
+def parse_bool_param(name):
+    """Lee un parámetro booleano (true/false, 1/0); None si no viene"""
+    value = request.args.get(name)
+    if value is None or value == '':
+        return None
+    value = value.strip().lower()
+    if value in ('true', '1', 'yes', 'si', 'sí'):
+        return True
+    if value in ('false', '0', 'no'):
+        return False
+    raise ValueError(f"Parámetro '{name}' inválido: use true o false")
+
+def parse_datetime_param(name):
+    """Lee una fecha ISO 8601 o un timestamp Unix; None si no viene"""
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromtimestamp(float(value), timezone.utc)
+    except (OverflowError, OSError):
+        # inf, 1e20...: fuera del rango de fechas representable
+        raise ValueError(f"Parámetro '{name}' fuera de rango")
+    except ValueError:
+        try:
+            parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            raise ValueError(f"Parámetro '{name}' inválido: use ISO 8601 o timestamp Unix")
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+def build_admin_users_query(filters, last_used_from, last_used_to):
+    """Construye el query filtrado del listado de usuarios.
+
+    Con rango de last_used se ordena por last_used (más reciente primero) y
+    luego por ID; en otro caso solo por ID. Devuelve (query, campos de orden).
+    """
+    query = db.collection(TOKENS_COLLECTION)
+    for field, value in filters.items():
+        query = query.where(filter=firestore.FieldFilter(field, '==', value))
+    if last_used_from or last_used_to:
+        if last_used_from:
+            query = query.where(filter=firestore.FieldFilter('last_used', '>=', last_used_from))
+        if last_used_to:
+            query = query.where(filter=firestore.FieldFilter('last_used', '<=', last_used_to))
+        query = (
+            query.order_by('last_used', direction=firestore.Query.DESCENDING)
+            .order_by('__name__', direction=firestore.Query.DESCENDING)
+        )
+        return query, ['last_used', '__name__']
+    return query.order_by('__name__'), ['__name__']
+
+def admin_user_cursor(doc, order_fields):
+    """Cursor opaco con los valores de orden del último usuario de la página"""
+    values = []
+    for field in order_fields:
+        if field == '__name__':
+            values.append(doc.id)
+        else:
+            values.append(doc.get(field))
+    return encode_cursor(values)
+
+def admin_user_cursor_position(cursor, order_fields):
+    """Convierte un cursor en el dict que espera start_after; None si es inválido"""
+    values = decode_cursor(cursor)
+    if not isinstance(values, list) or len(values) != len(order_fields):
+        return None
+    position = {}
+    try:
+        for field, value in zip(order_fields, values):
+            if field == '__name__':
+                position[field] = db.collection(TOKENS_COLLECTION).document(str(value))
+            else:
+                position[field] = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+    return position
+
+def admin_user_info(doc):
+    """Datos de un usuario para el listado, con límites y tiempos de reinicio"""
+    user_info = doc.to_dict()
+    user_info['user_id'] = doc.id
+    user_info.pop('token', None)
+    plan_type = user_info.get('plan_type', 'free')
+    if plan_type not in PLAN_CONFIG:
+        plan_type = 'free'
+    user_info['plan_type'] = plan_type
+    plan_config = PLAN_CONFIG[plan_type]
+    user_info['plan_limits'] = {
+        'daily': plan_config['daily_limit'],
+        'session': plan_config['session_limit'],
+        'daily_streams': plan_config['daily_streams_limit']
+    }
+    current_time = time.time()
+    daily_reset = user_info.get('daily_reset_timestamp', current_time)
+    session_start = user_info.get('session_start_timestamp', current_time)
+    streams_reset = user_info.get('daily_streams_reset_timestamp', current_time)
+    user_info['limits_info'] = {
+        'daily_reset_in_seconds': int(max(0, 86400 - (current_time - daily_reset))),
+        'session_reset_in_seconds': int(max(0, SESSION_TIMEOUT - (current_time - session_start))),
+        'streams_reset_in_seconds': int(max(0, 86400 - (current_time - streams_reset))),
+        'daily_usage': user_info.get('daily_usage_count', 0),
+        'session_usage': user_info.get('session_usage_count', 0),
+        'daily_streams_used': user_info.get('daily_streams_used', 0),
+        'total_streams_count': user_info.get('total_streams_count', 0),
+        'daily_limit': user_info.get('max_requests_per_day', plan_config['daily_limit']),
+        'session_limit': user_info.get('max_requests_per_session', plan_config['session_limit']),
+        'daily_streams_limit': user_info.get('max_daily_streams', plan_config['daily_streams_limit'])
+    }
+    return user_info
+
+# =============================================
+# CATÁLOGO EN MEMORIA
+# =============================================
+
+CATALOG_COLLECTIONS = ['peliculas', 'contenido', 'canales']
+# Con listeners (on_snapshot) cada worker recibe los cambios de cualquier proceso en segundos;
+# la recarga periódica completa solo se usa si el listener no está disponible
+CATALOG_WATCH_ENABLED = os.environ.get('CATALOG_WATCH_ENABLED', 'true').lower() == 'true'
+CATALOG_WATCH_TIMEOUT = int(os.environ.get('CATALOG_WATCH_TIMEOUT', 60))  # segundos para el snapshot inicial
+CATALOG_WATCH_RETRY_INTERVAL = int(os.environ.get('CATALOG_WATCH_RETRY_INTERVAL', 300))  # segundos
+CATALOG_REFRESH_INTERVAL = int(os.environ.get('CATALOG_REFRESH_INTERVAL', 1800))  # 30 minutos
+
+# colección -> {doc_id: {'data': dict, 'update_time': ..., 'create_time': ...}}
+catalog_documents = {name: {} for name in CATALOG_COLLECTIONS}
+catalog_loaded_at = {name: 0 for name in CATALOG_COLLECTIONS}
+# Se incrementa con cada cambio; sirve para invalidar cachés derivadas
+catalog_versions = {name: 0 for name in CATALOG_COLLECTIONS}
+# Protege el catálogo y todos los índices derivados
+catalog_lock = threading.RLock()
+catalog_load_locks = {name: threading.Lock() for name in CATALOG_COLLECTIONS}
+catalog_listeners = []
+# colección -> Watch de Firestore y evento del primer snapshot recibido
+catalog_watches = {}
+catalog_watch_ready = {name: threading.Event() for name in CATALOG_COLLECTIONS}
+# colección -> momento a partir del cual se vuelve a intentar abrir el listener
+catalog_watch_retry_at = {name: 0 for name in CATALOG_COLLECTIONS}
+
+def register_catalog_listener(listener):
+    """Registra un índice: listener(collection_name, doc_id, old_entry, new_entry)"""
+    catalog_listeners.append(listener)
+    return listener
+
+def notify_catalog_change(collection_name, doc_id, old_entry, new_entry):
+    """Propaga un alta/cambio/baja del catálogo a los índices (con catalog_lock tomado)"""
+    catalog_versions[collection_name] += 1
+    for listener in catalog_listeners:
+        try:
+            listener(collection_name, doc_id, old_entry, new_entry)
+        except Exception as e:
+            print(f"⚠️ Error actualizando índice {listener.__name__} para {collection_name}/{doc_id}: {e}")
+
+def make_catalog_entry(doc):
+    return {
+        'data': doc.to_dict(),
+        'update_time': doc.update_time,
+        'create_time': doc.create_time
+    }
+
+def backfill_series_flags(entries):
+    """Corrige has_seasons en los documentos de contenido donde falta o no coincide con seasons"""
+    stale = [
+        (doc_id, series_has_seasons(entry['data'])) for doc_id, entry in entries.items()
+        if entry['data'].get('has_seasons') != series_has_seasons(entry['data'])
+    ]
+    if not stale:
+        return
+    for start in range(0, len(stale), 400):
+        batch = db.batch()
+        for doc_id, has_seasons in stale[start:start + 400]:
+            batch.update(db.collection('contenido').document(doc_id), {'has_seasons': has_seasons})
+        batch.commit()
+    invalidate_collection_count('contenido')
+    print(f"📚 has_seasons corregido en {len(stale)} documentos de contenido")
+
+def replace_catalog_collection(collection_name, docs):
+    """Sustituye la colección por el conjunto completo `docs` notificando solo lo que cambió"""
+    changes = 0
+    with catalog_lock:
+        current = catalog_documents[collection_name]
+        for doc_id, entry in docs.items():
+            old_entry = current.get(doc_id)
+            if old_entry is None or old_entry['update_time'] != entry['update_time']:
+                current[doc_id] = entry
+                notify_catalog_change(collection_name, doc_id, old_entry, entry)
+                changes += 1
+        for doc_id in [doc_id for doc_id in current if doc_id not in docs]:
+            notify_catalog_change(collection_name, doc_id, current.pop(doc_id), None)
+            changes += 1
+        catalog_loaded_at[collection_name] = time.time()
+    if collection_name == 'contenido':
+        # La carga ya leyó todos los documentos: solo se escriben los desajustados
+        try:
+            backfill_series_flags(docs)
+        except Exception as e:
+            print(f"⚠️ Error corrigiendo has_seasons: {e}")
+    return changes
+
+def load_catalog_collection(collection_name):
+    """Carga (o recarga) una colección completa y notifica solo los documentos que cambiaron"""
+    start = time.time()
+    docs = {doc.id: make_catalog_entry(doc) for doc in db.collection(collection_name).stream()}
+    changes = replace_catalog_collection(collection_name, docs)
+    print(f"📚 Catálogo '{collection_name}' cargado: {len(docs)} docs, {changes} cambios en {time.time() - start:.2f}s")
+
+def apply_catalog_changes(collection_name, changes):
+    """Aplica los DocumentChange de un listener (altas, cambios y bajas de cualquier proceso)"""
+    with catalog_lock:
+        current = catalog_documents[collection_name]
+        for change in changes:
+            doc = change.document
+            if change.type.name == 'REMOVED':
+                old_entry = current.pop(doc.id, None)
+                if old_entry is not None:
+                    notify_catalog_change(collection_name, doc.id, old_entry, None)
+                continue
+            entry = make_catalog_entry(doc)
+            old_entry = current.get(doc.id)
+            # Las escrituras de este proceso ya se aplicaron con catalog_upsert_snapshot
+            if old_entry is None or old_entry['update_time'] != entry['update_time']:
+                current[doc.id] = entry
+                notify_catalog_change(collection_name, doc.id, old_entry, entry)
+        catalog_loaded_at[collection_name] = time.time()
+
+def make_catalog_snapshot_callback(collection_name):
+    """Callback de on_snapshot: el primer snapshot sustituye la colección; los siguientes aplican cambios"""
+    ready = catalog_watch_ready[collection_name]
+    def on_snapshot(docs, changes, read_time):
+        try:
+            if not ready.is_set():
+                entries = {doc.id: make_catalog_entry(doc) for doc in docs}
+                changed = replace_catalog_collection(collection_name, entries)
+                print(f"📚 Catálogo '{collection_name}' sincronizado por listener: {len(entries)} docs, {changed} cambios")
+                ready.set()
+            else:
+                apply_catalog_changes(collection_name, changes)
+        except Exception as e:
+            print(f"❌ Error aplicando cambios del listener de '{collection_name}': {e}")
+    return on_snapshot
+
+def catalog_is_live(collection_name):
+    """True si un listener activo mantiene la colección al día entre procesos"""
+    watch = catalog_watches.get(collection_name)
+    return watch is not None and catalog_watch_ready[collection_name].is_set() and watch.is_active
+
+def catalog_watch_due(collection_name):
+    """True si hay que (re)abrir el listener: habilitado, no activo y fuera del periodo de espera"""
+    return (
+        CATALOG_WATCH_ENABLED
+        and not catalog_is_live(collection_name)
+        and time.time() >= catalog_watch_retry_at[collection_name]
+    )
+
+def start_catalog_watch(collection_name):
+    """Abre (o reabre) el listener de la colección y espera su primer snapshot; False si no es posible"""
+    previous = catalog_watches.pop(collection_name, None)
+    if previous is not None:
+        try:
+            previous.unsubscribe()
+        except Exception:
+            pass
+    ready = catalog_watch_ready[collection_name]
+    ready.clear()
+    try:
+        watch = db.collection(collection_name).on_snapshot(make_catalog_snapshot_callback(collection_name))
+    except Exception as e:
+        print(f"⚠️ Listener de '{collection_name}' no disponible, se usa recarga periódica: {e}")
+        catalog_watch_retry_at[collection_name] = time.time() + CATALOG_WATCH_RETRY_INTERVAL
+        return False
+    if not ready.wait(CATALOG_WATCH_TIMEOUT):
+        print(f"⚠️ Listener de '{collection_name}' sin snapshot inicial en {CATALOG_WATCH_TIMEOUT}s, se usa recarga periódica")
+        catalog_watch_retry_at[collection_name] = time.time() + CATALOG_WATCH_RETRY_INTERVAL
+        try:
+            watch.unsubscribe()
+        except Exception:
+            pass
+        return False
+    catalog_watches[collection_name] = watch
+    return True
+
+def sync_catalog_collection(collection_name):
+    """Abre el listener si toca intentarlo; si no se puede, recarga la colección completa"""
+    if not (catalog_watch_due(collection_name) and start_catalog_watch(collection_name)):
+        load_catalog_collection(collection_name)
+
+def _refresh_catalog_in_background(collection_name):
+    try:
+        sync_catalog_collection(collection_name)
+    except Exception as e:
+        print(f"❌ Error recargando catálogo '{collection_name}': {e}")
+    finally:
+        catalog_load_locks[collection_name].release()
+
+def ensure_catalog_loaded(collection_name):
+    """Garantiza que la colección esté en memoria.
+
+    Con CATALOG_WATCH_ENABLED un listener on_snapshot mantiene la colección al
+    día, incluidas las escrituras de otros workers. Sin listener (o mientras se
+    reabre uno caído) la primera carga es síncrona y las recargas se hacen en
+    segundo plano mientras se sigue sirviendo la versión actual.
+    """
+    if catalog_is_live(collection_name):
+        return
+    loaded_at = catalog_loaded_at[collection_name]
+    if time.time() - loaded_at < CATALOG_REFRESH_INTERVAL and not catalog_watch_due(collection_name):
+        return
+    load_lock = catalog_load_locks[collection_name]
+    if loaded_at:
+        if load_lock.acquire(blocking=False):
+            threading.Thread(
+                target=_refresh_catalog_in_background, args=(collection_name,), daemon=True
+            ).start()
+        return
+    with load_lock:
+        if not catalog_loaded_at[collection_name]:
+            sync_catalog_collection(collection_name)
+
+def ensure_catalogs_loaded(*collection_names):
+    """Como ensure_catalog_loaded, pero las primeras cargas de varias colecciones van en paralelo"""
+    pending = [name for name in collection_names if not catalog_loaded_at[name]]
+    if len(pending) > 1:
+        for future in [query_executor.submit(ensure_catalog_loaded, name) for name in pending]:
+            future.result()
+    for name in collection_names:
+        ensure_catalog_loaded(name)
+
+def catalog_upsert_snapshot(collection_name, doc):
+    """Actualiza el catálogo con un DocumentSnapshot recién escrito"""
+    if not doc.exists:
+        catalog_remove(collection_name, doc.id)
+        return
+    entry = make_catalog_entry(doc)
+    with catalog_lock:
+        old_entry = catalog_documents[collection_name].get(doc.id)
+        catalog_documents[collection_name][doc.id] = entry
+        notify_catalog_change(collection_name, doc.id, old_entry, entry)
+
+def catalog_remove(collection_name, doc_id):
+    """Elimina un documento del catálogo"""
+    with catalog_lock:
+        old_entry = catalog_documents[collection_name].pop(doc_id, None)
+        if old_entry is not None:
+            notify_catalog_change(collection_name, doc_id, old_entry, None)
+
+def refresh_catalog_document(collection_name, doc_id):
+    """Relee un documento tras escribirlo (resuelve SERVER_TIMESTAMP) y lo sincroniza"""
+    try:
+        catalog_upsert_snapshot(collection_name, db.collection(collection_name).document(doc_id).get())
+    except Exception as e:
+        print(f"⚠️ No se pudo sincronizar {collection_name}/{doc_id} con el catálogo: {e}")
+
+def normalize_catalog_entry(collection_name, doc_id, entry, plan_restricted=False):
+    """Normaliza un documento del catálogo usando la caché de normalización"""
+    return normalize_content(
+        collection_name, doc_id, entry['update_time'], lambda: dict(entry['data']), plan_restricted
+    )
+
+# Cursores opacos para paginación
+def is_valid_document_id(doc_id):
+    """IDs que Firestore acepta en document(): sin '/', distintos de '.' y '..', sin forma __x__ y hasta 1500 bytes"""
+    return (
+        bool(doc_id)
+        and '/' not in doc_id
+        and doc_id not in ('.', '..')
+        and not (doc_id.startswith('__') and doc_id.endswith('__'))
+        and len(doc_id.encode('utf-8')) <= 1500
+    )
+
+def page_param_rejected():
+    """Los listados por cursor no admiten 'page' > 1: devuelve la respuesta 400 o None"""
+    page = request.args.get('page')
+    if page is None or page.strip() == '1':
+        return None
+    return jsonify({
+        "error": "Este listado se pagina por cursor: envíe 'cursor' con el 'next_cursor' de la respuesta anterior en lugar de 'page'"
+    }), 400
+
+def encode_cursor(values):
+    """Codifica una lista de valores JSON en un cursor opaco"""
+    raw = json.dumps(values, separators=(',', ':'), default=json_default).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    """Decodifica un cursor; devuelve None si es inválido"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        return json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except Exception:
+        return None
+
+# =============================================
+# ÍNDICE DE CANALES
+# =============================================
+
+CHANNEL_FILTER_FIELDS = ['category', 'country', 'status']
+CANALES_DEFAULT_LIMIT = 100
+CANALES_MAX_LIMIT = 500
+
+# [(nombre plegado, doc_id)] ordenado; cada canal aparece una vez
+channel_sorted_keys = []
+# campo -> valor plegado -> {doc_id}
+channel_filter_index = {field: defaultdict(set) for field in CHANNEL_FILTER_FIELDS}
+# doc_id -> (clave de orden, {campo: valor plegado})
+channel_index_entries = {}
+# Páginas ya construidas, válidas mientras no cambie la versión de 'canales'
+channel_listing_cache = LRUCache(256)
+
+def channel_sort_key(doc_id, data):
+    return (fold_text(data.get('name', '')), doc_id)
+
+@register_catalog_listener
+def update_channel_index(collection_name, doc_id, old_entry, new_entry):
+    """Mantiene incrementalmente el orden y los filtros de canales"""
+    if collection_name != 'canales':
+        return
+    previous = channel_index_entries.pop(doc_id, None)
+    if previous is not None:
+        sort_key, values = previous
+        position = bisect_left(channel_sorted_keys, sort_key)
+        if position < len(channel_sorted_keys) and channel_sorted_keys[position] == sort_key:
+            del channel_sorted_keys[position]
+        for field, value in values.items():
+            ids = channel_filter_index[field].get(value)
+            if ids is not None:
+                ids.discard(doc_id)
+                if not ids:
+                    del channel_filter_index[field][value]
+    if new_entry is None:
+        return
+    data = new_entry['data']
+    sort_key = channel_sort_key(doc_id, data)
+    values = {}
+    for field in CHANNEL_FILTER_FIELDS:
+        if data.get(field):
+            values[field] = fold_text(data[field])
+            channel_filter_index[field][values[field]].add(doc_id)
+    insort(channel_sorted_keys, sort_key)
+    channel_index_entries[doc_id] = (sort_key, values)
+
+def query_channel_index(filters, cursor_key, limit):
+    """Devuelve (doc_ids de la página, clave del último elemento o None, total filtrado).
+
+    limit=None devuelve todos los canales desde el cursor.
+    """
+    with catalog_lock:
+        if filters:
+            matching = None
+            for field, value in filters.items():
+                ids = channel_filter_index[field].get(value, set())
+                matching = set(ids) if matching is None else matching & ids
+            keys = sorted(channel_index_entries[doc_id][0] for doc_id in matching)
+        else:
+            keys = channel_sorted_keys
+        start = bisect_right(keys, cursor_key) if cursor_key else 0
+        end = len(keys) if limit is None else start + limit
+        page = keys[start:end]
+        has_more = end < len(keys)
+        return [doc_id for _, doc_id in page], (page[-1] if page and has_more else None), len(keys)
+
+# =============================================
+# ÍNDICE DE CONTENIDO RECIENTE
+# =============================================
+
+RECENT_COLLECTIONS = ['peliculas', 'contenido']
+RECENT_MAX_LIMIT = 100
+
+# [(-marca de tiempo, colección, doc_id)] ordenado: lo más reciente primero
+recent_sorted_keys = []
+# (colección, doc_id) -> clave en recent_sorted_keys
+recent_index_entries = {}
+
+def recency_timestamp(entry):
+    """Fecha de alta del contenido: created_at del documento o, si falta, create_time de Firestore"""
+    for value in (entry['data'].get('created_at'), entry.get('create_time')):
+        if isinstance(value, datetime):
+            return value.timestamp()
+        if isinstance(value, (int, float)):
+            return float(value)
+    return 0.0
+
+def is_recent_content(collection_name, data):
+    """Solo entra al feed el contenido marcado como agregado recientemente (add: 'yes')"""
+    if data.get('add') != 'yes':
+        return False
+    # Las series sin temporadas no se listan
+    return collection_name != 'contenido' or bool(data.get('seasons'))
+
+@register_catalog_listener
+def update_recent_index(collection_name, doc_id, old_entry, new_entry):
+    """Mantiene el feed de recientes ordenado por fecha de alta"""
+    if collection_name not in RECENT_COLLECTIONS:
+        return
+    previous = recent_index_entries.pop((collection_name, doc_id), None)
+    if previous is not None:
+        position = bisect_left(recent_sorted_keys, previous)
+        if position < len(recent_sorted_keys) and recent_sorted_keys[position] == previous:
+            del recent_sorted_keys[position]
+    if new_entry is None or not is_recent_content(collection_name, new_entry['data']):
+        return
+    key = (-recency_timestamp(new_entry), collection_name, doc_id)
+    insort(recent_sorted_keys, key)
+    recent_index_entries[(collection_name, doc_id)] = key
+
+def query_recent_index(limit):
+    """Devuelve las primeras `limit` entradas del feed como [(colección, doc_id, entry)]"""
+    with catalog_lock:
+        return [
+            (collection_name, doc_id, catalog_documents[collection_name][doc_id])
+            for _, collection_name, doc_id in recent_sorted_keys[:limit]
+        ]
+
+# =============================================
+# ÍNDICE DE FACETAS (GÉNERO, AÑO, TIPO, RATING)
+# =============================================
+
+FACET_COLLECTIONS = ['peliculas', 'contenido']
+FACET_FIELDS = ['genre', 'year', 'type', 'rating']
+
+# colección -> campo -> valor plegado -> {doc_id}  (rating se indexa por tramo entero)
+facet_postings = {name: {field: defaultdict(set) for field in FACET_FIELDS} for name in FACET_COLLECTIONS}
+# colección -> campo -> valor plegado -> etiqueta original para mostrar
+facet_labels = {name: {field: {} for field in FACET_FIELDS} for name in FACET_COLLECTIONS}
+# (colección, doc_id) -> ({campo: [valores plegados]}, rating numérico o None)
+facet_doc_values = {}
+
+def parse_rating(value):
+    """Rating numérico o None; 'nan'/'inf' no son ratings válidos"""
+    try:
+        rating = float(str(value).replace(',', '.'))
+    except (TypeError, ValueError):
+        return None
+    # ✅ NUEVO: int(nan) e int(inf) fallan en el índice y NaN rompe el orden de bisect
+    return rating if math.isfinite(rating) else None
+
+def extract_facets(data):
+    """Obtiene {campo: [(plegado, etiqueta)]} y el rating numérico de un documento crudo"""
+    details = data.get('details') or {}
+    genres = details.get('genres')
+    if not genres:
+        genres = [g for g in str(data.get('genre', '')).split(',')]
+    year = details.get('year', '') if details else data.get('year', '')
+    rating = parse_rating(details.get('rating') if details else data.get('rating'))
+    raw = {
+        'genre': [g.strip() for g in genres if g and str(g).strip()],
+        'year': [str(year).strip()] if str(year or '').strip() else [],
+        'type': [data['type'].strip()] if isinstance(data.get('type'), str) and data['type'].strip() else [],
+        'rating': [str(int(rating))] if rating is not None else []
+    }
+    return {field: [(fold_text(v), v) for v in values] for field, values in raw.items()}, rating
+
+@register_catalog_listener
+def update_facet_index(collection_name, doc_id, old_entry, new_entry):
+    """Mantiene las posting lists de cada faceta"""
+    if collection_name not in FACET_COLLECTIONS:
+        return
+    postings = facet_postings[collection_name]
+    previous = facet_doc_values.pop((collection_name, doc_id), None)
+    if previous is not None:
+        for field, values in previous[0].items():
+            for value in values:
+                ids = postings[field].get(value)
+                if ids is not None:
+                    ids.discard(doc_id)
+                    if not ids:
+                        del postings[field][value]
+    if new_entry is None:
+        return
+    data = new_entry['data']
+    # Las series sin temporadas no se listan
+    if collection_name == 'contenido' and not data.get('seasons'):
+        return
+    facets, rating = extract_facets(data)
+    values = {}
+    for field, pairs in facets.items():
+        values[field] = []
+        for folded, label in pairs:
+            postings[field][folded].add(doc_id)
+            facet_labels[collection_name][field][folded] = label
+            values[field].append(folded)
+    facet_doc_values[(collection_name, doc_id)] = (values, rating)
+
+def parse_facet_filters():
+    """Lee ?genre=, ?year=, ?type= (varios valores separados por coma) y ?rating_min="""
+    filters = {}
+    for field in ['genre', 'year', 'type']:
+        raw = request.args.get(field, '')
+        values = {fold_text(v.strip()) for v in raw.split(',') if v.strip()}
+        if values:
+            filters[field] = values
+    if request.args.get('rating_min'):
+        rating_min = parse_rating(request.args['rating_min'])
+        if rating_min is None:
+            raise ValueError("Parámetro 'rating_min' inválido")
+        filters['rating_min'] = rating_min
+    return filters
+
+def query_facet_index(collection_name, filters):
+    """Intersecta las posting lists y devuelve (doc_ids ordenados, conteos por faceta)"""
+    postings = facet_postings[collection_name]
+    with catalog_lock:
+        candidate_sets = []
+        for field in ['genre', 'year', 'type']:
+            if field in filters:
+                # OR dentro de un campo, AND entre campos
+                union = set()
+                for value in filters[field]:
+                    union |= postings[field].get(value, set())
+                candidate_sets.append(union)
+        rating_min = filters.get('rating_min')
+        if rating_min is not None:
+            union = set()
+            for bucket, ids in postings['rating'].items():
+                if int(bucket) >= int(rating_min):
+                    union |= ids
+            candidate_sets.append(union)
+        # Intersectar empezando por el conjunto más pequeño
+        candidate_sets.sort(key=len)
+        matching = set(candidate_sets[0]) if candidate_sets else set()
+        for ids in candidate_sets[1:]:
+            matching &= ids
+            if not matching:
+                break
+        if rating_min is not None:
+            # El tramo inferior puede incluir valores por debajo del mínimo exacto
+            matching = {
+                doc_id for doc_id in matching
+                if facet_doc_values[(collection_name, doc_id)][1] >= rating_min
+            }
+        counts = {field: defaultdict(int) for field in FACET_FIELDS}
+        for doc_id in matching:
+            for field, values in facet_doc_values[(collection_name, doc_id)][0].items():
+                for value in values:
+                    counts[field][value] += 1
+        labels = facet_labels[collection_name]
+        facets = {
+            field: {labels[field].get(value, value): count for value, count in sorted(values.items(), key=lambda x: (-x[1], x[0]))}
+            for field, values in counts.items()
+        }
+    return sorted(matching), facets
+
+def catalog_listing(user_data, collection_name, page_ids, total, limit):
+    """Construye la respuesta de un listado a partir de los doc_ids de una página del catálogo"""
+    restricted = is_plan_restricted(user_data)
+    with catalog_lock:
+        entries = [(doc_id, catalog_documents[collection_name].get(doc_id)) for doc_id in page_ids]
+    data = []
+    for doc_id, entry in entries:
+        if entry is not None:
+            normalized = normalize_catalog_entry(collection_name, doc_id, entry, restricted)
+            if normalized:
+                data.append(normalized)
+    return {
+        "success": True,
+        "count": len(data),
+        "total": total,
+        "limit": limit,
+        "plan_restrictions": restricted,
+        "data": data
+    }
+
+def faceted_listing(user_data, collection_name, filters, limit, offset=0, sort=None):
+    """Construye la respuesta de un listado filtrado por facetas (opcionalmente ordenado)"""
+    if offset < 0 or limit < 0:
+        raise ValueError("offset y limit no pueden ser negativos")
+    ensure_catalog_loaded(collection_name)
+    doc_ids, facets = query_facet_index(collection_name, filters)
+    if sort:
+        doc_ids = sort_doc_ids(collection_name, doc_ids, *sort)
+    response = catalog_listing(user_data, collection_name, doc_ids[offset:offset + limit], len(doc_ids), limit)
+    response["filters"] = {k: sorted(v) if isinstance(v, set) else v for k, v in filters.items()}
+    response["facets"] = facets
+    return response
+
+# =============================================
+# ÍNDICES DE ORDENAMIENTO (RATING, AÑO, TÍTULO)
+# =============================================
+
+SORT_FIELDS = ['rating', 'year', 'title']
+DEFAULT_SORT_ORDER = {'rating': 'desc', 'year': 'desc', 'title': 'asc'}
+
+# colección -> campo -> {'present': [(valor, doc_id)] ordenado, 'missing': [doc_id] ordenado}
+sort_indexes = {
+    name: {field: {'present': [], 'missing': []} for field in SORT_FIELDS}
+    for name in FACET_COLLECTIONS
+}
+# (colección, doc_id) -> {campo: clave en 'present' o None si falta el valor}
+sort_doc_keys = {}
+
+def parse_year(value):
+    match = re.match(r'\s*(\d{4})', str(value or ''))
+    return int(match.group(1)) if match else None
+
+def extract_sort_values(data):
+    """Valores de ordenamiento de un documento crudo (None si el campo falta)"""
+    details = data.get('details') or {}
+    title = fold_text(data.get('title', '')).strip()
+    return {
+        'rating': parse_rating(details.get('rating') if details else data.get('rating')),
+        'year': parse_year(details.get('year') if details else data.get('year')),
+        'title': title or None
+    }
+
+@register_catalog_listener
+def update_sort_index(collection_name, doc_id, old_entry, new_entry):
+    """Mantiene los arreglos preordenados por rating, año y título"""
+    if collection_name not in FACET_COLLECTIONS:
+        return
+    indexes = sort_indexes[collection_name]
+    previous = sort_doc_keys.pop((collection_name, doc_id), None)
+    if previous is not None:
+        for field, key in previous.items():
+            keys = indexes[field]['present'] if key is not None else indexes[field]['missing']
+            key = key if key is not None else doc_id
+            position = bisect_left(keys, key)
+            if position < len(keys) and keys[position] == key:
+                del keys[position]
+    if new_entry is None:
+        return
+    data = new_entry['data']
+    # Las series sin temporadas no se listan
+    if collection_name == 'contenido' and not data.get('seasons'):
+        return
+    keys = {}
+    for field, value in extract_sort_values(data).items():
+        if value is None:
+            insort(indexes[field]['missing'], doc_id)
+            keys[field] = None
+        else:
+            keys[field] = (value, doc_id)
+            insort(indexes[field]['present'], keys[field])
+    sort_doc_keys[(collection_name, doc_id)] = keys
+
+def parse_sort_params():
+    """Lee ?sort=rating|year|title y ?order=asc|desc; devuelve (campo, descendente) o None"""
+    field = request.args.get('sort', '').strip().lower()
+    if not field:
+        return None
+    if field not in SORT_FIELDS:
+        raise ValueError(f"Parámetro 'sort' inválido. Valores permitidos: {', '.join(SORT_FIELDS)}")
+    order = request.args.get('order', DEFAULT_SORT_ORDER[field]).strip().lower()
+    if order not in ['asc', 'desc']:
+        raise ValueError("Parámetro 'order' inválido. Valores permitidos: asc, desc")
+    return field, order == 'desc'
+
+def query_sort_index(collection_name, field, descending, offset, limit):
+    """Página de un ordenamiento en O(tamaño de página); los documentos sin valor van al final"""
+    if offset < 0 or limit < 0:
+        raise ValueError("offset y limit no pueden ser negativos")
+    with catalog_lock:
+        present = sort_indexes[collection_name][field]['present']
+        missing = sort_indexes[collection_name][field]['missing']
+        total = len(present) + len(missing)
+        page_ids = []
+        for position in range(offset, min(offset + limit, total)):
+            if position < len(present):
+                page_ids.append(present[len(present) - 1 - position if descending else position][1])
+            else:
+                page_ids.append(missing[position - len(present)])
+        return page_ids, total
+
+def sort_doc_ids(collection_name, doc_ids, field, descending):
+    """Ordena un subconjunto de documentos (p. ej. el resultado de facetas) con las claves del índice"""
+    with catalog_lock:
+        keys = [sort_doc_keys.get((collection_name, doc_id), {}).get(field) for doc_id in doc_ids]
+    present = sorted((key for key in keys if key is not None), reverse=descending)
+    missing = sorted(doc_id for doc_id, key in zip(doc_ids, keys) if key is None)
+    return [doc_id for _, doc_id in present] + missing
+
+def sorted_listing(user_data, collection_name, sort, limit, offset=0):
+    """Construye la respuesta de un listado ordenado desde el índice"""
+    ensure_catalog_loaded(collection_name)
+    field, descending = sort
+    page_ids, total = query_sort_index(collection_name, field, descending, offset, limit)
+    response = catalog_listing(user_data, collection_name, page_ids, total, limit)
+    response["sort"] = field
+    response["order"] = 'desc' if descending else 'asc'
+    return response
+
+# =============================================
+# ÍNDICE DE BÚSQUEDA DE TEXTO COMPLETO
+# =============================================
+
+# Campos indexados por colección y su peso en la relevancia
+SEARCH_FIELDS = {
+    'peliculas': {'title': 3.0, 'original_title': 2.0, 'sinopsis': 1.0},
+    'contenido': {'title': 3.0, 'original_title': 2.0, 'sinopsis': 1.0},
+    'canales': {'name': 3.0, 'category': 1.0}
+}
+SEARCH_TITLE_FIELDS = {'peliculas': 'title', 'contenido': 'title', 'canales': 'name'}
+SEARCH_TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+def tokenize(text):
+    """Tokens plegados (minúsculas y sin acentos, igual que normalize_id)"""
+    return SEARCH_TOKEN_PATTERN.findall(fold_text(text or ''))
+
+class InvertedIndex:
+    """Índice invertido token -> {(colección, doc_id): peso} (protegido por catalog_lock)"""
+
+    def __init__(self):
+        self.postings = defaultdict(dict)
+        # Vocabulario ordenado para resolver prefijos con bisect
+        self.vocabulary = []
+        # (colección, doc_id) -> (tokens del documento, título plegado)
+        self.doc_tokens = {}
+
+    def remove(self, key):
+        previous = self.doc_tokens.pop(key, None)
+        if previous is None:
+            return
+        for token in previous[0]:
+            postings = self.postings.get(token)
+            if postings is None:
+                continue
+            postings.pop(key, None)
+            if not postings:
+                del self.postings[token]
+                position = bisect_left(self.vocabulary, token)
+                if position < len(self.vocabulary) and self.vocabulary[position] == token:
+                    del self.vocabulary[position]
+
+    def add(self, key, weights, title):
+        """weights es {token: peso}; title es el título plegado usado para desempates"""
+        for token, weight in weights.items():
+            if token not in self.postings:
+                insort(self.vocabulary, token)
+            self.postings[token][key] = weight
+        self.doc_tokens[key] = (set(weights), title)
+
+    def expand_prefix(self, prefix):
+        """Tokens del vocabulario que empiezan con el prefijo"""
+        start = bisect_left(self.vocabulary, prefix)
+        end = bisect_left(self.vocabulary, prefix + '\uffff')
+        return self.vocabulary[start:end]
+
+    def search(self, tokens, collections, limit=None):
+        """Devuelve [(colección, doc_id, puntuación)] por relevancia (todos si limit es None).
+
+        Todos los términos deben aparecer (el último puede ser un prefijo). La
+        puntuación suma peso de campo x idf y premia coincidencias en el título.
+        """
+        if not tokens:
+            return []
+        with catalog_lock:
+            total_docs = max(len(self.doc_tokens), 1)
+            scores = None
+            for position, token in enumerate(tokens):
+                is_last = position == len(tokens) - 1
+                matches = self.expand_prefix(token) if is_last else ([token] if token in self.postings else [])
+                token_scores = {}
+                for match in matches:
+                    postings = self.postings[match]
+                    idf = math.log(1 + total_docs / len(postings))
+                    # Las coincidencias por prefijo valen un poco menos que las exactas
+                    factor = 1.0 if match == token else 0.8
+                    for key, weight in postings.items():
+                        if key[0] in collections:
+                            token_scores[key] = max(token_scores.get(key, 0), weight * idf * factor)
+                if scores is None:
+                    scores = token_scores
+                else:
+                    scores = {key: score + token_scores[key] for key, score in scores.items() if key in token_scores}
+                if not scores:
+                    return []
+            phrase = ' '.join(tokens)
+            for key in scores:
+                title = self.doc_tokens[key][1]
+                if title == phrase:
+                    scores[key] *= 2
+                elif title.startswith(phrase):
+                    scores[key] *= 1.5
+            order = lambda item: (-item[1], self.doc_tokens[item[0]][1], item[0])
+            if limit is None:
+                best = sorted(scores.items(), key=order)
+            else:
+                best = heapq.nsmallest(limit, scores.items(), key=order)
+        return [(collection_name, doc_id, score) for (collection_name, doc_id), score in best]
+
+search_text_index = InvertedIndex()
+
+@register_catalog_listener
+def update_search_index(collection_name, doc_id, old_entry, new_entry):
+    """Mantiene el índice invertido de títulos, títulos originales y descripciones"""
+    if collection_name not in SEARCH_FIELDS:
+        return
+    key = (collection_name, doc_id)
+    search_text_index.remove(key)
+    if new_entry is None:
+        return
+    data = new_entry['data']
+    # Las series sin temporadas no se listan
+    if collection_name == 'contenido' and not data.get('seasons'):
+        return
+    weights = defaultdict(float)
+    for field, weight in SEARCH_FIELDS[collection_name].items():
+        for token in tokenize(data.get(field)):
+            weights[token] += weight
+    title = ' '.join(tokenize(data.get(SEARCH_TITLE_FIELDS[collection_name])))
+    search_text_index.add(key, weights, title)
+
+def search_index(termino, collections, limit):
+    """Busca en títulos y descripciones: [(colección, doc_id, puntuación)] por relevancia"""
+    return search_text_index.search(tokenize(termino), collections, limit)
+
+# =============================================
+# BÚSQUEDA APROXIMADA POR TRIGRAMAS
+# =============================================
+
+FUZZY_MIN_SCORE = float(os.environ.get('FUZZY_MIN_SCORE', 0.45))
+# Máximo de candidatos que se puntúan por consulta, sin importar el tamaño del catálogo
+FUZZY_MAX_CANDIDATES = int(os.environ.get('FUZZY_MAX_CANDIDATES', 200))
+# Máximo de entradas de posting lists recorridas por consulta (los trigramas comunes se omiten)
+FUZZY_MAX_POSTINGS = int(os.environ.get('FUZZY_MAX_POSTINGS', 5000))
+
+# trigrama -> {(colección, doc_id)}
+trigram_postings = defaultdict(set)
+# (colección, doc_id) -> trigramas del título
+trigram_doc_grams = {}
+
+def title_trigrams(text):
+    """Trigramas de cada palabra plegada, con relleno como pg_trgm ('  ab', ' ab ', ...)"""
+    grams = set()
+    for token in tokenize(text):
+        padded = f'  {token} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+@register_catalog_listener
+def update_trigram_index(collection_name, doc_id, old_entry, new_entry):
+    """Mantiene el índice de trigramas de títulos y nombres de canales"""
+    if collection_name not in SEARCH_TITLE_FIELDS:
+        return
+    key = (collection_name, doc_id)
+    for gram in trigram_doc_grams.pop(key, ()):
+        ids = trigram_postings.get(gram)
+        if ids is not None:
+            ids.discard(key)
+            if not ids:
+                del trigram_postings[gram]
+    if new_entry is None:
+        return
+    data = new_entry['data']
+    # Las series sin temporadas no se listan
+    if collection_name == 'contenido' and not data.get('seasons'):
+        return
+    grams = title_trigrams(data.get(SEARCH_TITLE_FIELDS[collection_name]))
+    for gram in grams:
+        trigram_postings[gram].add(key)
+    trigram_doc_grams[key] = grams
+
+def fuzzy_search(termino, collections, limit, exclude=()):
+    """Mejores coincidencias aproximadas: [(colección, doc_id, similitud)] con similitud >= FUZZY_MIN_SCORE.
+
+    Los candidatos salen de las posting lists más selectivas, recorriendo a
+    lo sumo FUZZY_MAX_POSTINGS entradas (los trigramas frecuentes no se
+    recorren). Los FUZZY_MAX_CANDIDATES mejores se puntúan con la intersección
+    exacta de trigramas, combinando similitud de Dice y proporción del término
+    cubierta. El costo no depende del tamaño del catálogo.
+    """
+    query_grams = title_trigrams(termino)
+    if not query_grams:
+        return []
+    with catalog_lock:
+        shared = defaultdict(int)
+        budget = FUZZY_MAX_POSTINGS
+        for gram in sorted(query_grams, key=lambda g: len(trigram_postings.get(g, ()))):
+            if budget <= 0:
+                break
+            postings = trigram_postings.get(gram, ())
+            for key in islice(postings, budget):
+                if key[0] in collections and key not in exclude:
+                    shared[key] += 1
+            budget -= len(postings)
+        candidates = heapq.nlargest(FUZZY_MAX_CANDIDATES, shared.items(), key=lambda item: item[1])
+        scored = []
+        for key, _ in candidates:
+            doc_grams = trigram_doc_grams[key]
+            common = len(query_grams & doc_grams)
+            dice = 2 * common / (len(query_grams) + len(doc_grams))
+            coverage = common / len(query_grams)
+            score = (dice + coverage) / 2
+            if score >= FUZZY_MIN_SCORE:
+                scored.append((score, key))
+    best = heapq.nlargest(limit, scored, key=lambda item: item[0])
+    return [(collection_name, doc_id, score) for score, (collection_name, doc_id) in best]
+
+# =============================================
+# BÚSQUEDA POR ACTOR, DIRECTOR Y GÉNERO
+# =============================================
+
+FIELD_SEARCH_COLLECTIONS = ['peliculas', 'contenido']
+FIELD_SEARCH_FIELDS = ['actor', 'director', 'genre']
+# Prefijos aceptados en ?q=campo:valor (plegados)
+FIELD_SEARCH_ALIASES = {
+    'actor': 'actor', 'actores': 'actor', 'actriz': 'actor',
+    'director': 'director', 'directores': 'director',
+    'genre': 'genre', 'genero': 'genre', 'generos': 'genre'
+}
+FIELD_QUERY_PATTERN = re.compile(r'^\s*([^:\s]+)\s*:\s*(.+)$')
+# Máximo de nombres distintos que se expanden en una búsqueda por campo
+FIELD_SEARCH_MAX_NAMES = 20
+
+# Un índice invertido por campo cuyos "documentos" son los nombres: clave (campo, nombre plegado)
+field_name_indexes = {field: InvertedIndex() for field in FIELD_SEARCH_FIELDS}
+# campo -> nombre plegado -> {(colección, doc_id)}
+field_name_postings = {field: defaultdict(set) for field in FIELD_SEARCH_FIELDS}
+# campo -> nombre plegado -> nombre original para mostrar
+field_name_labels = {field: {} for field in FIELD_SEARCH_FIELDS}
+# (colección, doc_id) -> {campo: [nombres plegados]}
+field_doc_names = {}
+
+def extract_field_names(data):
+    """Actores, director(es) y géneros de un documento crudo: {campo: [nombres]}"""
+    details = data.get('details') or {}
+    director = details.get('director')
+    genres = details.get('genres') or [g for g in str(data.get('genre', '')).split(',')]
+    raw = {
+        'actor': details.get('actors') or [],
+        'director': director if isinstance(director, list) else [director],
+        'genre': genres
+    }
+    return {
+        field: [str(name).strip() for name in names if name and str(name).strip()]
+        for field, names in raw.items()
+    }
+
+@register_catalog_listener
+def update_field_search_index(collection_name, doc_id, old_entry, new_entry):
+    """Mantiene los índices de actores, directores y géneros"""
+    if collection_name not in FIELD_SEARCH_COLLECTIONS:
+        return
+    key = (collection_name, doc_id)
+    for field, names in field_doc_names.pop(key, {}).items():
+        for name in names:
+            ids = field_name_postings[field].get(name)
+            if ids is None:
+                continue
+            ids.discard(key)
+            if not ids:
+                del field_name_postings[field][name]
+                field_name_labels[field].pop(name, None)
+                field_name_indexes[field].remove((field, name))
+    if new_entry is None:
+        return
+    data = new_entry['data']
+    # Las series sin temporadas no se listan
+    if collection_name == 'contenido' and not data.get('seasons'):
+        return
+    doc_names = {}
+    for field, labels in extract_field_names(data).items():
+        doc_names[field] = []
+        for label in labels:
+            name = ' '.join(tokenize(label))
+            if not name or name in doc_names[field]:
+                continue
+            if name not in field_name_postings[field]:
+                field_name_indexes[field].add((field, name), {token: 1.0 for token in name.split()}, name)
+                field_name_labels[field][name] = label
+            field_name_postings[field][name].add(key)
+            doc_names[field].append(name)
+    field_doc_names[key] = doc_names
+
+def parse_field_query(termino):
+    """Detecta 'actor:...', 'director:...' o 'genre:...'; devuelve (campo, valor) o None"""
+    match = FIELD_QUERY_PATTERN.match(termino)
+    if not match:
+        return None
+    field = FIELD_SEARCH_ALIASES.get(fold_text(match.group(1)))
+    return (field, match.group(2)) if field else None
+
+def find_field_names(field, value):
+    """Nombres que coinciden con el valor: exacto si existe, si no por palabras (la última como prefijo)"""
+    tokens = tokenize(value)
+    name = ' '.join(tokens)
+    with catalog_lock:
+        if name in field_name_postings[field]:
+            return [(name, 1.0)]
+    matches = field_name_indexes[field].search(tokens, [field], FIELD_SEARCH_MAX_NAMES)
+    return [(matched_name, score) for _, matched_name, score in matches]
+
+def search_by_field(field, value, collections, limit=None):
+    """Contenido de los nombres coincidentes: ([(colección, doc_id, puntuación)], [nombres mostrados])"""
+    names = find_field_names(field, value)
+    with catalog_lock:
+        scores = {}
+        for name, score in names:
+            for key in field_name_postings[field].get(name, ()):
+                if key[0] in collections and score > scores.get(key, 0):
+                    scores[key] = score
+        labels = [field_name_labels[field].get(name, name) for name, _ in names]
+        # Mejor nombre primero; a igual puntuación, por rating y título
+        def order(item):
+            key, score = item
+            values = sort_doc_keys.get(key, {})
+            rating = values.get('rating')
+            title = values.get('title')
+            return (-score, -(rating[0] if rating else 0), title[0] if title else '', key)
+        ranked = sorted(scores.items(), key=order)
+    if limit is not None:
+        ranked = ranked[:limit]
+    return [(collection_name, doc_id, score) for (collection_name, doc_id), score in ranked], labels
+
+def browse_by_field(user_data, field, nombre):
+    """Listado paginado de todo el contenido de un actor o director, sin consultas a Firestore"""
+    firebase_check = check_firebase()
+    if firebase_check:
+        return firebase_check
+    try:
+        page = max(int(request.args.get('page', 1)), 1)
+        if user_data.get('is_admin') or user_data.get('plan_type') == 'premium':
+            limit = min(int(request.args.get('limit', 100)), 1000)
+        else:
+            limit = min(int(request.args.get('limit', 10)), 10)
+        offset = (page - 1) * limit
+        
+        allowed_collections = user_data.get('allowed_collections', FIELD_SEARCH_COLLECTIONS)
+        collections = [name for name in FIELD_SEARCH_COLLECTIONS if name in allowed_collections]
+        if not collections:
+            return jsonify({"error": "Tu token no tiene acceso a películas ni series"}), 403
+        ensure_catalogs_loaded(*collections)
+        matches, names = search_by_field(field, nombre, collections)
+        
+        restricted = is_plan_restricted(user_data)
+        contenido = []
+        for collection_name, doc_id, _ in matches[offset:offset + limit]:
+            with catalog_lock:
+                entry = catalog_documents[collection_name].get(doc_id)
+            if entry is None:
+                continue
+            data = normalize_catalog_entry(collection_name, doc_id, entry, restricted)
+            if data:
+                data['tipo'] = CONTENT_TYPES[collection_name]
+                contenido.append(data)
+        
+        return jsonify({
+            "success": True,
+            field: nombre,
+            "matched_names": names,
+            "count": len(contenido),
+            "total": len(matches),
+            "page": page,
+            "limit": limit,
+            "plan_restrictions": restricted,
+            "data": contenido
+        })
+    except ValueError:
+        return jsonify({"error": "Parámetros 'page' o 'limit' inválidos"}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# =============================================
+# CACHÉ DE RESULTADOS DE BÚSQUEDA
+# =============================================
+
+SEARCH_CACHE_SIZE = int(os.environ.get('SEARCH_CACHE_SIZE', 2000))
+SEARCH_CACHE_TTL = int(os.environ.get('SEARCH_CACHE_TTL', 300))  # 5 minutos
+
+# La clave incluye las versiones del catálogo: cualquier cambio invalida las búsquedas afectadas
+search_cache = LRUCache(SEARCH_CACHE_SIZE, ttl=SEARCH_CACHE_TTL)
+search_flights = SingleFlight()
+search_cache_stats = {'hits': 0, 'misses': 0, 'shared': 0}
+search_cache_stats_lock = threading.Lock()
+
+def execute_search(termino, collections, limit, restricted, fuzzy_enabled):
+    """Ejecuta una búsqueda contra los índices: devuelve (resultados normalizados, coincidencias aproximadas)"""
+    # ✅ NUEVO: Búsqueda por campo (actor:, director:, genre:)
+    field_query = parse_field_query(termino)
+    if field_query:
+        field, value = field_query
+        collections = [name for name in collections if name in FIELD_SEARCH_COLLECTIONS]
+        matches = [
+            (collection_name, doc_id, score, False)
+            for collection_name, doc_id, score in search_by_field(field, value, collections, limit)[0]
+        ]
+    else:
+        matches = [(collection_name, doc_id, score, False) for collection_name, doc_id, score in search_index(termino, collections, limit)]
+    
+    # ✅ NUEVO: Completar con coincidencias aproximadas (errores de tipeo, acentos)
+    fuzzy_count = 0
+    if not field_query and len(matches) < limit and fuzzy_enabled:
+        found = {(collection_name, doc_id) for collection_name, doc_id, _, _ in matches}
+        fuzzy = fuzzy_search(termino, collections, limit - len(matches), exclude=found)
+        matches += [(collection_name, doc_id, score, True) for collection_name, doc_id, score in fuzzy]
+        fuzzy_count = len(fuzzy)
+    
+    resultados = []
+    for collection_name, doc_id, score, is_fuzzy in matches:
+        with catalog_lock:
+            entry = catalog_documents[collection_name].get(doc_id)
+        if entry is None:
+            continue
+        data = normalize_catalog_entry(collection_name, doc_id, entry, restricted)
+        if data:
+            data['tipo'] = CONTENT_TYPES[collection_name]
+            # tf-idf y similitud de trigramas (0-1) no son comparables: van en campos distintos
+            if is_fuzzy:
+                data['fuzzy'] = True
+                data['similarity'] = round(score, 3)
+            else:
+                data['score'] = round(score, 3)
+            resultados.append(data)
+    return resultados, fuzzy_count
+
+def cached_search(termino, collections, limit, restricted, fuzzy_enabled):
+    """execute_search con caché LRU+TTL y de-duplicación de búsquedas idénticas simultáneas"""
+    with catalog_lock:
+        versions = tuple(catalog_versions[name] for name in collections)
+    key = (' '.join(fold_text(termino).split()), tuple(collections), limit, restricted, fuzzy_enabled, versions)
+    result = search_cache.get(key)
+    if result is not None:
+        with search_cache_stats_lock:
+            search_cache_stats['hits'] += 1
+        return result
+    
+    def load():
+        # Otro hilo pudo haberla calculado mientras esperábamos
+        cached = search_cache.get(key)
+        if cached is None:
+            cached = execute_search(termino, collections, limit, restricted, fuzzy_enabled)
+            search_cache.set(key, cached)
+        return cached
+    
+    result, shared = search_flights.do(key, load)
+    with search_cache_stats_lock:
+        search_cache_stats['shared' if shared else 'misses'] += 1
+    return result
+
+def get_search_cache_stats():
+    """Estadísticas de la caché de búsquedas"""
+    with search_cache_stats_lock:
+        stats = dict(search_cache_stats)
+    lookups = stats['hits'] + stats['misses'] + stats['shared']
+    stats['size'] = len(search_cache)
+    stats['max_size'] = SEARCH_CACHE_SIZE
+    stats['ttl_seconds'] = SEARCH_CACHE_TTL
+    stats['hit_rate'] = round((stats['hits'] + stats['shared']) / lookups, 4) if lookups else 0
+    return stats
+
+# =============================================
+# ÍNDICE DE RUTAS DE CONTENIDO (ID -> COLECCIÓN)
+# =============================================
+
+# Orden de prioridad histórico de /api/stream cuando un ID existe en varias colecciones
+CONTENT_ROUTE_ORDER = ['peliculas', 'contenido', 'canales']
+
+# doc_id -> {colecciones donde existe}
+content_routes = defaultdict(set)
+
+@register_catalog_listener
+def update_content_routes(collection_name, doc_id, old_entry, new_entry):
+    """Mantiene el mapa de ID de contenido a colección"""
+    if collection_name not in CONTENT_ROUTE_ORDER:
+        return
+    if new_entry is None:
+        routes = content_routes.get(doc_id)
+        if routes is not None:
+            routes.discard(collection_name)
+            if not routes:
+                del content_routes[doc_id]
+    else:
+        content_routes[doc_id].add(collection_name)
+
+def load_content_for_stream(content_id, collections=CONTENT_ROUTE_ORDER):
+    """Devuelve (colección, datos crudos) de un contenido o (None, None).
+
+    Resuelve desde el catálogo en memoria solo si un listener lo mantiene al
+    día; si no (recarga periódica, que puede llevar hasta
+    CATALOG_REFRESH_INTERVAL de retraso respecto a otros workers) o si el ID no
+    está, lee el documento en Firestore, empezando por la colección donde lo
+    ubica el catálogo, y sincroniza el catálogo con el resultado.
+    """
+    ensure_catalogs_loaded(*collections)
+    with catalog_lock:
+        routed = [name for name in collections if name in content_routes.get(content_id, ())]
+        if all(catalog_is_live(name) for name in collections):
+            for collection_name in routed:
+                entry = catalog_documents[collection_name].get(content_id)
+                if entry is not None:
+                    return collection_name, entry['data']
+    for collection_name in routed + [name for name in collections if name not in routed]:
+        doc = db.collection(collection_name).document(content_id).get()
+        if doc.exists:
+            catalog_upsert_snapshot(collection_name, doc)
+            return collection_name, doc.to_dict()
+        if collection_name in routed:
+            # Borrado por otro proceso desde la última recarga
+            catalog_remove(collection_name, content_id)
+    return None, None
+
+# =============================================
+# MAPA DE EPISODIOS POR SERIE
+# =============================================
+
+# doc_id -> {'seasons': {temporada}, 'episodes': {(temporada, episodio): play_links}}
+episode_index = {}
+
+def episode_number_key(value):
+    """'season-01' / '1' / 1 -> 1; valores no numéricos se comparan como texto"""
+    value = str(value).strip()
+    value = value.rsplit('-', 1)[-1] if value.startswith(('season-', 'episode-')) else value
+    return int(value) if value.isdigit() else value
+
+@register_catalog_listener
+def update_episode_index(collection_name, doc_id, old_entry, new_entry):
+    """Precalcula (temporada, episodio) -> enlaces para resolver streams sin recorrer la serie"""
+    if collection_name != 'contenido':
+        return
+    episode_index.pop(doc_id, None)
+    if new_entry is None:
+        return
+    seasons = new_entry['data'].get('seasons')
+    if not isinstance(seasons, dict) or not seasons:
+        return
+    season_keys = set()
+    episodes_map = {}
+    for season_key, season_data in seasons.items():
+        if not isinstance(season_data, dict):
+            continue
+        season_number = episode_number_key(season_key)
+        season_keys.add(season_number)
+        episodes = season_data.get('episodes')
+        if not isinstance(episodes, dict):
+            continue
+        for episode_key, episode_data in episodes.items():
+            if isinstance(episode_data, dict):
+                episodes_map[(season_number, episode_number_key(episode_key))] = episode_data.get('play_links') or []
+    episode_index[doc_id] = {'seasons': season_keys, 'episodes': episodes_map}
+
+def get_episode_links(serie_id, season, episode):
+    """Devuelve ('ok', play_links), ('no_season', None) o ('no_episode', None)"""
+    with catalog_lock:
+        series_map = episode_index.get(serie_id)
+        season_number = episode_number_key(season)
+        if series_map is None or season_number not in series_map['seasons']:
+            return 'no_season', None
+        links = series_map['episodes'].get((season_number, episode_number_key(episode)))
+    if links is None:
+        return 'no_episode', None
+    return 'ok', links
+
+# =============================================
+# TAREAS PERIÓDICAS EN SEGUNDO PLANO
+# =============================================
+
+# nombre -> {'interval', 'runs', 'last_run', 'last_duration', 'last_error'}
+background_tasks = {}
+background_tasks_lock = threading.Lock()
+
+def start_background_task(name, target, interval, initial_delay=0):
+    """Ejecuta target() cada `interval` segundos en un hilo daemon (una sola vez por nombre)"""
+    with background_tasks_lock:
+        if name in background_tasks:
+            return False
+        status = {'interval': interval, 'runs': 0, 'last_run': None, 'last_duration': None, 'last_error': None}
+        background_tasks[name] = status
+    
+    def loop():
+        time.sleep(initial_delay)
+        while True:
+            start = time.time()
+            try:
+                target()
+                status['last_error'] = None
+            except Exception as e:
+                status['last_error'] = str(e)
+                print(f"❌ Error en tarea '{name}': {e}")
+            status['runs'] += 1
+            status['last_run'] = start
+            status['last_duration'] = round(time.time() - start, 3)
+            time.sleep(interval)
+    
+    threading.Thread(target=loop, name=f'task-{name}', daemon=True).start()
+    print(f"⏱️ Tarea '{name}' programada cada {interval}s")
+    return True
+
+def get_background_tasks_status():
+    with background_tasks_lock:
+        return {name: dict(status) for name, status in background_tasks.items()}
+
+# =============================================
+# MONITOREO DE ENLACES DE STREAMING
+# =============================================
+
+# Solo verifica enlaces la instancia que lo habilita explícitamente y, dentro de
+# ella, un único proceso (el que obtiene LINK_PROBE_LOCK_FILE). Los demás
+# workers leen los enlaces caídos que ese proceso publica en Firestore.
+LINK_PROBE_ENABLED = os.environ.get('LINK_PROBE_ENABLED', 'false').lower() == 'true'
+LINK_PROBE_INTERVAL = int(os.environ.get('LINK_PROBE_INTERVAL', 300))  # 5 minutos por tramo
+LINK_PROBE_BATCH_SIZE = int(os.environ.get('LINK_PROBE_BATCH_SIZE', 400))  # enlaces por pasada
+LINK_PROBE_TIMEOUT = float(os.environ.get('LINK_PROBE_TIMEOUT', 5))
+LINK_PROBE_CONCURRENCY = int(os.environ.get('LINK_PROBE_CONCURRENCY', 16))
+LINK_PROBE_LOCK_FILE = os.environ.get('LINK_PROBE_LOCK_FILE', '/tmp/api_pelis_link_probe.lock')
+# ✅ NUEVO: solo se verifican hosts públicos; habilitar solo para pruebas locales
+LINK_PROBE_ALLOW_PRIVATE = os.environ.get('LINK_PROBE_ALLOW_PRIVATE', 'false').lower() == 'true'
+LINK_PROBE_MAX_REDIRECTS = 5
+LINK_HEALTH_DOC_ID = 'link_health'
+# Máximo de enlaces caídos publicados (el documento compartido no puede pasar de 1 MB)
+LINK_HEALTH_SHARED_MAX = 5000
+
+# url -> {'alive', 'latency_ms', 'status_code', 'checked_at', 'consecutive_failures'} (proceso verificador)
+link_health = {}
+# huella de url -> {'status_code', 'checked_at'}: caídos publicados por el proceso verificador
+shared_dead_links = {}
+link_health_lock = threading.Lock()
+# Posición del tramo rotativo y tamaño del último recorrido
+link_probe_state = {'offset': 0, 'total': 0, 'role': None}
+link_probe_lock_handle = None
+link_monitoring_lock = threading.Lock()
+
+def link_health_max_age():
+    """Un resultado más viejo que dos vueltas completas se considera desconocido"""
+    batches = max(1, math.ceil(link_probe_state['total'] / max(1, LINK_PROBE_BATCH_SIZE)))
+    return max(LINK_PROBE_INTERVAL * 3, LINK_PROBE_INTERVAL * batches * 2)
+
+def link_health_key(url):
+    return hashlib.sha1(url.encode('utf-8')).hexdigest()[:16]
+
+def is_public_probe_url(url):
+    """True si la URL es http/https y su host resuelve solo a direcciones públicas.
+
+    Evita que un enlace del catálogo haga que el servidor consulte la red
+    interna (privadas, loopback, link-local como el servidor de metadatos,
+    reservadas o multicast). La resolución se repite al conectar, así que
+    no protege contra DNS rebinding; sí contra enlaces directos a esos hosts.
+    """
+    try:
+        parts = urlsplit(url)
+        port = parts.port or (443 if parts.scheme == 'https' else 80)
+    except ValueError:
+        return False
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        return False
+    if LINK_PROBE_ALLOW_PRIVATE:
+        return True
+    try:
+        addresses = socket.getaddrinfo(parts.hostname, port, proto=socket.IPPROTO_TCP)
+    except (socket.gaierror, UnicodeError):
+        return False
+    for *_, sockaddr in addresses:
+        address = ipaddress.ip_address(sockaddr[0].split('%')[0])
+        if not address.is_global or address.is_multicast:
+            return False
+    return bool(addresses)
+
+def probe_request(method, url):
+    """HEAD/GET siguiendo redirecciones a mano para validar cada destino; None si se bloquea"""
+    for _ in range(LINK_PROBE_MAX_REDIRECTS + 1):
+        if not is_public_probe_url(url):
+            return None
+        response = requests.request(method, url, timeout=LINK_PROBE_TIMEOUT, allow_redirects=False, stream=True)
+        response.close()
+        if not response.is_redirect:
+            return response
+        url = urljoin(url, response.headers['location'])
+    return None
+
+def probe_link(url):
+    """Comprueba un enlace (HEAD y, si el servidor no lo soporta, GET sin descargar el cuerpo)"""
+    start = time.time()
+    status_code = None
+    try:
+        response = probe_request('HEAD', url)
+        if response is not None and response.status_code in (403, 405, 501):
+            response = probe_request('GET', url)
+        # Host no público o demasiadas redirecciones: se trata como caído
+        status_code = response.status_code if response is not None else None
+        alive = status_code is not None and status_code < 400
+    except requests.RequestException:
+        alive = False
+    latency_ms = round((time.time() - start) * 1000, 1)
+    with link_health_lock:
+        previous = link_health.get(url, {})
+        link_health[url] = {
+            'alive': alive,
+            'latency_ms': latency_ms,
+            'status_code': status_code,
+            'checked_at': time.time(),
+            'consecutive_failures': 0 if alive else previous.get('consecutive_failures', 0) + 1
+        }
+    return alive
+
+def probe_links(urls):
+    """Verifica una lista de enlaces con paralelismo acotado; devuelve cuántos están activos"""
+    # Pool propio para no competir con las consultas de los requests
+    with ThreadPoolExecutor(max_workers=LINK_PROBE_CONCURRENCY, thread_name_prefix='link-probe') as executor:
+        return sum(executor.map(probe_link, urls))
+
+def collect_stream_urls():
+    """URLs de reproducción de películas, episodios y canales del catálogo"""
+    urls = set()
+    with catalog_lock:
+        for data in [entry['data'] for entry in catalog_documents['peliculas'].values()]:
+            urls.update(link.get('url') for link in data.get('play_links') or [] if isinstance(link, dict))
+        for data in [entry['data'] for entry in catalog_documents['contenido'].values()]:
+            seasons = data.get('seasons') or {}
+            for season in seasons.values() if isinstance(seasons, dict) else []:
+                episodes = season.get('episodes') or {} if isinstance(season, dict) else {}
+                for episode in episodes.values() if isinstance(episodes, dict) else []:
+                    if isinstance(episode, dict):
+                        urls.update(link.get('url') for link in episode.get('play_links') or [] if isinstance(link, dict))
+        for data in [entry['data'] for entry in catalog_documents['canales'].values()]:
+            urls.update(option.get('stream_url') for option in data.get('stream_options') or [] if isinstance(option, dict))
+    return {url for url in urls if isinstance(url, str) and url.startswith(('http://', 'https://'))}
+
+def next_probe_batch(urls):
+    """Siguiente tramo rotativo de a lo sumo LINK_PROBE_BATCH_SIZE enlaces.
+
+    urls debe venir ordenada; devuelve (tramo, True si con él se completa la vuelta).
+    """
+    total = len(urls)
+    if not total:
+        link_probe_state.update(offset=0, total=0)
+        return [], True
+    start = link_probe_state['offset'] % total
+    size = min(LINK_PROBE_BATCH_SIZE, total)
+    batch = urls[start:start + size]
+    if len(batch) < size:
+        batch += urls[:size - len(batch)]
+    link_probe_state.update(offset=(start + size) % total, total=total)
+    return batch, start + size >= total
+
+def publish_link_health(batch, url_set, cycle_complete):
+    """Publica los enlaces caídos para los demás procesos (1 escritura por pasada).
+
+    Al completar una vuelta se reescribe el documento entero, lo que descarta
+    los enlaces que ya no están en el catálogo.
+    """
+    ref = db.collection(STATS_COLLECTION).document(LINK_HEALTH_DOC_ID)
+    with link_health_lock:
+        if cycle_complete:
+            dead = {
+                link_health_key(url): {'status_code': health['status_code'], 'checked_at': health['checked_at']}
+                for url, health in link_health.items() if not health['alive'] and url in url_set
+            }
+            entries = dict(list(dead.items())[:LINK_HEALTH_SHARED_MAX])
+            updates = None
+        else:
+            updates = {}
+            published = sum(1 for health in link_health.values() if not health['alive'])
+            for url in batch:
+                health = link_health.get(url)
+                if health is None:
+                    continue
+                if health['alive']:
+                    updates[link_health_key(url)] = firestore.DELETE_FIELD
+                elif published <= LINK_HEALTH_SHARED_MAX:
+                    updates[link_health_key(url)] = {
+                        'status_code': health['status_code'], 'checked_at': health['checked_at']
+                    }
+    if updates is None:
+        ref.set({'dead': entries, 'updated_at': firestore.SERVER_TIMESTAMP})
+    elif updates:
+        ref.set({'dead': updates, 'updated_at': firestore.SERVER_TIMESTAMP}, merge=True)
+
+def probe_link_slice():
+    """Verifica el siguiente tramo de enlaces del catálogo (trabajo acotado por pasada)"""
+    if not db:
+        return
+    ensure_catalogs_loaded(*CONTENT_ROUTE_ORDER)
+    urls = sorted(collect_stream_urls())
+    batch, cycle_complete = next_probe_batch(urls)
+    start = time.time()
+    alive = probe_links(batch)
+    url_set = set(urls)
+    with link_health_lock:
+        for url in [url for url in link_health if url not in url_set]:
+            del link_health[url]
+    publish_link_health(batch, url_set, cycle_complete)
+    print(f"🔗 Enlaces verificados: {alive}/{len(batch)} activos (de {len(urls)}) en {time.time() - start:.1f}s")
+
+def sync_shared_link_health():
+    """Carga los enlaces caídos publicados por el proceso verificador (1 lectura)"""
+    if not db:
+        return
+    doc = db.collection(STATS_COLLECTION).document(LINK_HEALTH_DOC_ID).get()
+    dead = ((doc.to_dict() or {}).get('dead') or {}) if doc.exists else {}
+    with link_health_lock:
+        shared_dead_links.clear()
+        shared_dead_links.update(dead)
+
+def acquire_link_probe_lock():
+    """Lock de archivo no bloqueante: solo un proceso por máquina verifica enlaces"""
+    global link_probe_lock_handle
+    try:
+        import fcntl
+    except ImportError:
+        return True
+    handle = open(LINK_PROBE_LOCK_FILE, 'a')
+    try:
+        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        handle.close()
+        return False
+    # Se mantiene abierto mientras viva el proceso
+    link_probe_lock_handle = handle
+    return True
+
+def ensure_link_monitoring_started():
+    """Arranca el monitoreo con el primer request (no al importar el módulo).
+
+    El proceso que obtiene el lock verifica enlaces; los demás sincronizan
+    los caídos publicados.
+    """
+    if link_probe_state['role'] is not None:
+        return
+    with link_monitoring_lock:
+        if link_probe_state['role'] is not None:
+            return
+        if LINK_PROBE_ENABLED and acquire_link_probe_lock():
+            link_probe_state['role'] = 'prober'
+            start_background_task('link_prober', probe_link_slice, LINK_PROBE_INTERVAL, initial_delay=60)
+        else:
+            link_probe_state['role'] = 'follower'
+            start_background_task('link_health_sync', sync_shared_link_health, LINK_PROBE_INTERVAL)
+
+def get_link_health(url):
+    """Salud conocida de un enlace o None si no hay datos recientes"""
+    max_age = link_health_max_age()
+    with link_health_lock:
+        health = link_health.get(url)
+        shared = shared_dead_links.get(link_health_key(url)) if health is None and shared_dead_links else None
+    if health is None and shared:
+        health = {
+            'alive': False,
+            'latency_ms': None,
+            'status_code': shared.get('status_code'),
+            'checked_at': shared.get('checked_at', 0),
+            'consecutive_failures': None
+        }
+    if health is None or time.time() - health['checked_at'] > max_age:
+        return None
+    return health
+
+def select_best_link(links, url_field):
+    """Elige el enlace activo más rápido; sin datos se respeta el orden original y los caídos van al final"""
+    best = None
+    for position, link in enumerate(links):
+        if not isinstance(link, dict) or not link.get(url_field):
+            continue
+        health = get_link_health(link[url_field])
+        if health is None:
+            rank = (1, 0, position)
+        elif health['alive']:
+            rank = (0, health['latency_ms'], position)
+        else:
+            rank = (2, 0, position)
+        if best is None or rank < best[0]:
+            best = (rank, link, health)
+    return (best[1], best[2]) if best else (None, None)
+
+# =============================================
+# SUGERENCIAS DE BÚSQUEDA (AUTOCOMPLETADO)
+# =============================================
+
+SUGGESTIONS_DEFAULT_LIMIT = 8
+SUGGESTIONS_MAX_LIMIT = 20
+# Longitud de los prefijos con ranking de popularidad precalculado
+SUGGESTIONS_PREFIX_CHARS = 3
+# Rango alfabético máximo que se evalúa completo para términos más largos
+SUGGESTIONS_SCAN_LIMIT = 500
+
+# [(frase plegada desde cada palabra del título, colección, doc_id)] ordenado
+suggestion_keys = []
+# (colección, doc_id) -> (claves en suggestion_keys, título original, rating)
+suggestion_docs = {}
+# (colección, doc_id) -> reproducciones servidas por /api/stream desde el arranque
+content_play_counts = defaultdict(int)
+# ✅ NUEVO: prefijo (1-3 caracteres plegados) -> [(-popularidad, colección, doc_id)] ordenado,
+# es decir, los documentos con una palabra que empieza así, del más popular al menos
+suggestion_prefix_rankings = defaultdict(list)
+# (colección, doc_id) -> (entrada en los rankings, prefijos en los que aparece)
+suggestion_ranked = {}
+
+def suggestion_popularity(key):
+    """Popularidad = rating (0-10) + bonificación logarítmica por reproducciones"""
+    rating = suggestion_docs[key][2] or 0
+    return rating + 2 * math.log1p(content_play_counts.get(key, 0))
+
+def unrank_suggestion(key):
+    """Quita el documento de los rankings por prefijo (con catalog_lock)"""
+    previous = suggestion_ranked.pop(key, None)
+    if previous is None:
+        return
+    entry, prefixes = previous
+    for prefix in prefixes:
+        ranking = suggestion_prefix_rankings[prefix]
+        position = bisect_left(ranking, entry)
+        if position < len(ranking) and ranking[position] == entry:
+            del ranking[position]
+        if not ranking:
+            del suggestion_prefix_rankings[prefix]
+
+def rank_suggestion(key):
+    """Inserta el documento en los rankings de sus prefijos (con catalog_lock)"""
+    entry = (-suggestion_popularity(key), key[0], key[1])
+    prefixes = {
+        phrase[:length]
+        for phrase, _, _ in suggestion_docs[key][0]
+        for length in range(1, min(len(phrase), SUGGESTIONS_PREFIX_CHARS) + 1)
+    }
+    for prefix in prefixes:
+        insort(suggestion_prefix_rankings[prefix], entry)
+    suggestion_ranked[key] = (entry, prefixes)
+
+def record_content_play(collection_name, doc_id):
+    """Cuenta una reproducción para la popularidad de las sugerencias"""
+    key = (collection_name, doc_id)
+    with catalog_lock:
+        content_play_counts[key] += 1
+        # La popularidad cambió: se reubica en sus rankings
+        if key in suggestion_ranked:
+            unrank_suggestion(key)
+            rank_suggestion(key)
+
+@register_catalog_listener
+def update_suggestion_index(collection_name, doc_id, old_entry, new_entry):
+    """Mantiene el arreglo ordenado de prefijos y los rankings por popularidad"""
+    if collection_name not in SEARCH_TITLE_FIELDS:
+        return
+    key = (collection_name, doc_id)
+    unrank_suggestion(key)
+    previous = suggestion_docs.pop(key, None)
+    if previous is not None:
+        for suggestion_key in previous[0]:
+            position = bisect_left(suggestion_keys, suggestion_key)
+            if position < len(suggestion_keys) and suggestion_keys[position] == suggestion_key:
+                del suggestion_keys[position]
+    if new_entry is None:
+        return
+    data = new_entry['data']
+    # Las series sin temporadas no se listan
+    if collection_name == 'contenido' and not data.get('seasons'):
+        return
+    title = data.get(SEARCH_TITLE_FIELDS[collection_name]) or ''
+    tokens = tokenize(title)
+    # Una clave por palabra: "matrix" también sugiere "The Matrix"
+    keys = sorted({(' '.join(tokens[i:]), collection_name, doc_id) for i in range(len(tokens))})
+    for suggestion_key in keys:
+        insort(suggestion_keys, suggestion_key)
+    details = data.get('details') or {}
+    rating = parse_rating(details.get('rating') if details else data.get('rating'))
+    suggestion_docs[key] = (keys, title, rating)
+    if keys:
+        rank_suggestion(key)
+
+def suggestion_matches(key, prefix):
+    """True si alguna palabra del título (con las siguientes) empieza con el prefijo"""
+    return any(phrase.startswith(prefix) for phrase, _, _ in suggestion_docs[key][0])
+
+def suggest(termino, collections, limit):
+    """Top-k por popularidad de los títulos que contienen una palabra que empieza con el término
+
+    Términos de hasta SUGGESTIONS_PREFIX_CHARS caracteres se responden leyendo el
+    ranking de su prefijo; los más largos evalúan su rango alfabético completo si
+    es pequeño, o recorren el ranking de sus 3 primeros caracteres filtrando.
+    En todos los casos el resultado es el top-k exacto.
+    """
+    prefix = ' '.join(tokenize(termino))
+    if not prefix:
+        return []
+    with catalog_lock:
+        if len(prefix) <= SUGGESTIONS_PREFIX_CHARS:
+            ranking = suggestion_prefix_rankings.get(prefix, [])
+            matches = ((collection_name, doc_id) for _, collection_name, doc_id in ranking
+                       if collection_name in collections)
+            best = list(islice(matches, limit))
+        else:
+            start = bisect_left(suggestion_keys, (prefix,))
+            end = bisect_left(suggestion_keys, (prefix + '\uffff',))
+            if end - start <= SUGGESTIONS_SCAN_LIMIT:
+                candidates = {(collection_name, doc_id)
+                              for _, collection_name, doc_id in suggestion_keys[start:end]
+                              if collection_name in collections}
+                best = sorted(candidates, key=lambda key: suggestion_ranked[key][0])[:limit]
+            else:
+                ranking = suggestion_prefix_rankings.get(prefix[:SUGGESTIONS_PREFIX_CHARS], [])
+                matches = ((collection_name, doc_id) for _, collection_name, doc_id in ranking
+                           if collection_name in collections
+                           and suggestion_matches((collection_name, doc_id), prefix))
+                best = list(islice(matches, limit))
+        return [
+            {
+                'id': doc_id,
+                'title': suggestion_docs[(collection_name, doc_id)][1],
+                'tipo': CONTENT_TYPES[collection_name]
+            }
+            for collection_name, doc_id in best
+        ]
+
+@app.route('/api/auth/register', methods=['POST'])
+def public_register():
+    """Registro público para usuarios nuevos (siempre plan FREE)"""
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({"error": "Datos JSON requeridos"}), 400
+        
+        username = data.get('username')
+        email = data.get('email')
+        password = data.get('password')  # Opcional para futura autenticación
+        
+        if not username or not email:
+            return jsonify({"error": "Username y email son requeridos"}), 400
+        
+        if not validate_username(username):
+            return jsonify({"error": "Username inválido"}), 400
+        
+        if not validate_email(email):
+            return jsonify({"error": "Email inválido"}), 400
+        
+        # Verificar si el usuario ya existe
+        users_ref = db.collection(TOKENS_COLLECTION)
+        existing_user = users_ref.where('email', '==', email).limit(1).stream()
+        if any(existing_user):
+            return jsonify({"error": "El email ya está registrado"}), 400
+        
+        # Generar token único
+        token = generate_unique_token()
+        current_time = time.time()
+        
+        # CREAR USUARIO SIEMPRE CON PLAN FREE
+        user_data = {
+            'username': username,
+            'email': email,
+            'token': token,
+            'active': True,
+            'is_admin': False,
+            'plan_type': 'free',  # SIEMPRE FREE POR DEFECTO
+            'created_at': firestore.SERVER_TIMESTAMP,
+            'last_used': None,
+            'total_usage_count': 0,
+            'daily_usage_count': 0,
+            'session_usage_count': 0,
+            'daily_streams_used': 0,
+            'total_streams_count': 0,
+            'daily_reset_timestamp': current_time,
+            'daily_streams_reset_timestamp': current_time,
+            'session_start_timestamp': current_time,
+            'max_requests_per_day': PLAN_CONFIG['free']['daily_limit'],
+            'max_requests_per_session': PLAN_CONFIG['free']['session_limit'],
+            'max_daily_streams': PLAN_CONFIG['free']['daily_streams_limit'],
+            'features': PLAN_CONFIG['free']['features'],
+            'allowed_domains': [],  # Sin restricciones iniciales
+            'is_frontend_token': False
+        }
+        
+        # Guardar usuario
+        user_ref = users_ref.document()
+        user_ref.set(user_data)
+        record_usage_stat('free', 'users')
+        
+        return jsonify({
+            "success": True,
+            "message": "Usuario registrado exitosamente",
+            "user": {
+                "user_id": user_ref.id,
+                "username": username,
+                "email": email,
+                "token": token,
+                "plan_type": "free"
+            },
+            "limits": {
+                "daily": PLAN_CONFIG['free']['daily_limit'],
+                "session": PLAN_CONFIG['free']['session_limit'],
+                "daily_streams": PLAN_CONFIG['free']['daily_streams_limit']
+            }
+        }), 201
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/auth/login', methods=['POST'])
+def public_login():
+    """Login público usando token (para app móvil)"""
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({"error": "Datos JSON requeridos"}), 400
+        
+        token = data.get('token')
+        
+        if not token:
+            return jsonify({"error": "Token requerido"}), 400
+        
+        # Verificar token en la base de datos
+        users_ref = db.collection(TOKENS_COLLECTION)
+        query = users_ref.where('token', '==', token).limit(1).stream()
+        
+        user_data = None
+        user_id = None
+        for doc in query:
+            user_data = doc.to_dict()
+            user_id = doc.id
+            break
+        
+        if not user_data:
+            return jsonify({"error": "Token inválido"}), 401
+        
+        if not user_data.get('active', True):
+            return jsonify({"error": "Cuenta desactivada"}), 401
+        
+        # Actualizar último acceso
+        users_ref.document(user_id).update({
+            'last_used': firestore.SERVER_TIMESTAMP
+        })
+        
+        # Preparar respuesta
+        user_response = {
+            "user_id": user_id,
+            "username": user_data.get('username'),
+            "email": user_data.get('email'),
+            "token": token,
+            "plan_type": user_data.get('plan_type', 'free'),
+            "is_admin": user_data.get('is_admin', False),
+            "active": user_data.get('active', True)
+        }
+        
+        return jsonify({
+            "success": True,
+            "message": "Login exitoso",
+            "user": user_response
+        })
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/auth/verify', methods=['GET'])
+def verify_token():
+    """Verificar si un token es válido"""
+    token = request.args.get('token')
+    
+    if not token:
+        return jsonify({"error": "Token requerido"}), 400
+    
+    try:
+        users_ref = db.collection(TOKENS_COLLECTION)
+        query = users_ref.where('token', '==', token).limit(1).stream()
+        
+        for doc in query:
+            user_data = doc.to_dict()
+            if user_data.get('active', True):
+                return jsonify({
+                    "success": True,
+                    "valid": True,
+                    "user": {
+                        "user_id": doc.id,
+                        "username": user_data.get('username'),
+                        "plan_type": user_data.get('plan_type', 'free')
+                    }
+                })
+        
+        return jsonify({
+            "success": True,
+            "valid": False,
+            "message": "Token inválido o cuenta inactiva"
+        })
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# =============================================
+# ENDPOINTS DE CONEXIÓN Y RECONEXIÓN
+# =============================================
+
+@app.route('/api/connection/status', methods=['GET'])
+def connection_status():
+    """Verificar estado de la conexión Firebase"""
+    try:
+        firebase_healthy = check_firebase_connection()
+        current_time = time.time()
+        
+        status_info = {
+            "success": True,
             "timestamp": current_time,
             "firebase": {
                 "connected": firebase_healthy,
@@ -1501,6 +4049,8 @@ def diagnostic():
             "firebase_status": firebase_status,
             "firestore_test": firestore_test,
             "project_id": "phdt-b9b2c",
+            "json_provider": type(app.json).__name__,
+            "background_tasks": get_background_tasks_status(),
             "environment_variables": env_vars
         },
         "security": {
@@ -1531,46 +4081,24 @@ def diagnostic():
 @app.route('/api/contenido/recientes', methods=['GET'])
 @token_required
 def get_contenido_reciente(user_data):
-    """Obtener películas y series recientemente agregadas (add: 'yes')"""
+    """Obtener películas y series recientemente agregadas (add: 'yes'), las más nuevas primero"""
     firebase_check = check_firebase()
     if firebase_check:
         return firebase_check
     
     try:
         limit = int(request.args.get('limit', 12))
-        
-        # Obtener películas recientes
-        peliculas_ref = db.collection('peliculas')
-        peliculas_query = peliculas_ref.where('add', '==', 'yes').limit(limit)
-        peliculas_docs = peliculas_query.stream()
-        
-        peliculas_recientes = []
-        for doc in peliculas_docs:
-            pelicula_data = normalize_movie_data(doc.to_dict(), doc.id)
-            pelicula_data['tipo'] = 'pelicula'
-            peliculas_recientes.append(pelicula_data)
-        
-        # Obtener series recientes
-        series_ref = db.collection('contenido')
-        series_query = series_ref.where('add', '==', 'yes').limit(limit)
-        series_docs = series_query.stream()
-        
-        series_recientes = []
-        for doc in series_docs:
-            serie_data = doc.to_dict()
-            if serie_data.get('seasons'):
-                serie_data = normalize_series_data(serie_data, doc.id)
-                serie_data['tipo'] = 'serie'
-                series_recientes.append(serie_data)
-        
-        # Combinar y ordenar por fecha (si existe)
-        contenido_reciente = peliculas_recientes + series_recientes
-        
-        # Ordenar por fecha de creación si está disponible
-        contenido_reciente.sort(key=lambda x: x.get('created_at', ''), reverse=True)
-        
-        # Limitar el resultado final
-        contenido_reciente = contenido_reciente[:limit]
+        if limit < 1 or limit > RECENT_MAX_LIMIT:
+            limit = 12
+        
+        # El feed se mantiene ordenado en memoria: solo se leen las primeras `limit` entradas
+        ensure_catalogs_loaded(*RECENT_COLLECTIONS)
+        contenido_reciente = []
+        for collection_name, doc_id, entry in query_recent_index(limit):
+            data = normalize_catalog_entry(collection_name, doc_id, entry)
+            if data:
+                data['tipo'] = CONTENT_TYPES[collection_name]
+                contenido_reciente.append(data)
         
         return jsonify({
             "success": True,
@@ -1578,6 +4106,8 @@ def get_contenido_reciente(user_data):
             "data": contenido_reciente
         })
         
+    except ValueError:
+        return jsonify({"error": "Parámetro 'limit' inválido"}), 400
     except Exception as e:
         print(f"Error obteniendo contenido reciente: {e}")
         return jsonify({"error": str(e)}), 500
@@ -1593,27 +4123,22 @@ def get_animes(user_data):
     try:
         limit = int(request.args.get('limit', 12))
         
-        # Obtener películas anime
-        peliculas_ref = db.collection('peliculas')
-        peliculas_query = peliculas_ref.where('type', '==', 'Anime').limit(limit)
-        peliculas_docs = peliculas_query.stream()
+        # Consultar películas y series anime en paralelo
+        results, degraded = run_concurrent_queries({
+            'peliculas': stream_query(db.collection('peliculas').where('type', '==', 'Anime').limit(limit)),
+            'contenido': stream_query(db.collection('contenido').where('type', '==', 'Anime').limit(limit))
+        })
         
         peliculas_anime = []
-        for doc in peliculas_docs:
-            pelicula_data = normalize_movie_data(doc.to_dict(), doc.id)
+        for doc in results.get('peliculas', []):
+            pelicula_data = normalize_snapshot('peliculas', doc)
             pelicula_data['tipo'] = 'pelicula'
             peliculas_anime.append(pelicula_data)
         
-        # Obtener series anime
-        series_ref = db.collection('contenido')
-        series_query = series_ref.where('type', '==', 'Anime').limit(limit)
-        series_docs = series_query.stream()
-        
         series_anime = []
-        for doc in series_docs:
-            serie_data = doc.to_dict()
-            if serie_data.get('seasons'):
-                serie_data = normalize_series_data(serie_data, doc.id)
+        for doc in results.get('contenido', []):
+            serie_data = normalize_snapshot('contenido', doc)
+            if serie_data:
                 serie_data['tipo'] = 'serie'
                 series_anime.append(serie_data)
         
@@ -1621,11 +4146,14 @@ def get_animes(user_data):
         animes = peliculas_anime + series_anime
         animes = animes[:limit]  # Limitar el resultado final
         
-        return jsonify({
+        response = {
             "success": True,
             "count": len(animes),
             "data": animes
-        })
+        }
+        if degraded:
+            response["degraded_collections"] = degraded
+        return jsonify(response)
         
     except Exception as e:
         print(f"Error obteniendo animes: {e}")
@@ -1739,6 +4267,7 @@ def admin_create_user(user_data):
         
         user_ref = users_ref.document()
         user_ref.set(user_data_firestore)
+        record_usage_stat(plan_type, 'users')
         
         return jsonify({
             "success": True,
@@ -1771,54 +4300,77 @@ def admin_create_user(user_data):
 @app.route('/api/admin/users', methods=['GET'])
 @token_required
 def admin_get_users(user_data):
+    """Listar usuarios con paginación por cursor y filtros del lado del servidor.
+
+    Filtros: plan, active, frontend, last_used_from, last_used_to; búsqueda
+    exacta por email o username.
+    """
     if not user_data.get('is_admin'):
         return jsonify({"error": "Se requieren privilegios de administrador"}), 403
     firebase_check = check_firebase()
     if firebase_check:
         return firebase_check
     try:
-        users_ref = db.collection(TOKENS_COLLECTION)
-        docs = users_ref.stream()
-        users = []
-        for doc in docs:
-            user_info = doc.to_dict()
-            user_info['user_id'] = doc.id
-            plan_type = user_info.get('plan_type', 'free')
-            user_info['plan_type'] = plan_type
-            user_info['plan_limits'] = {
-                'daily': PLAN_CONFIG[plan_type]['daily_limit'],
-                'session': PLAN_CONFIG[plan_type]['session_limit'],
-                'daily_streams': PLAN_CONFIG[plan_type]['daily_streams_limit']
-            }
-            current_time = time.time()
-            daily_reset = user_info.get('daily_reset_timestamp', current_time)
-            session_start = user_info.get('session_start_timestamp', current_time)
-            streams_reset = user_info.get('daily_streams_reset_timestamp', current_time)
-            daily_remaining = max(0, 86400 - (current_time - daily_reset))
-            session_remaining = max(0, SESSION_TIMEOUT - (current_time - session_start))
-            streams_remaining = max(0, 86400 - (current_time - streams_reset))
-            user_info['limits_info'] = {
-                'daily_reset_in_seconds': int(daily_remaining),
-                'session_reset_in_seconds': int(session_remaining),
-                'streams_reset_in_seconds': int(streams_remaining),
-                'daily_usage': user_info.get('daily_usage_count', 0),
-                'session_usage': user_info.get('session_usage_count', 0),
-                'daily_streams_used': user_info.get('daily_streams_used', 0),
-                'total_streams_count': user_info.get('total_streams_count', 0),
-                'daily_limit': user_info.get('max_requests_per_day', PLAN_CONFIG[plan_type]['daily_limit']),
-                'session_limit': user_info.get('max_requests_per_session', PLAN_CONFIG[plan_type]['session_limit']),
-                'daily_streams_limit': user_info.get('max_daily_streams', PLAN_CONFIG[plan_type]['daily_streams_limit'])
-            }
-            if 'token' in user_info:
-                del user_info['token']
-            users.append(user_info)
-        plan_stats = {}
-        for user in users:
-            plan = user.get('plan_type', 'free')
-            plan_stats[plan] = plan_stats.get(plan, 0) + 1
+        try:
+            limit = int(request.args.get('limit', ADMIN_USERS_DEFAULT_LIMIT))
+        except ValueError:
+            return jsonify({"error": "Parámetro 'limit' inválido"}), 400
+        if limit < 1 or limit > ADMIN_USERS_MAX_LIMIT:
+            limit = ADMIN_USERS_DEFAULT_LIMIT
+        
+        filters = {}
+        plan = request.args.get('plan', '').strip().lower()
+        if plan:
+            if plan not in PLAN_CONFIG:
+                return jsonify({"error": f"Plan no válido. Opciones: {list(PLAN_CONFIG.keys())}"}), 400
+            filters['plan_type'] = plan
+        try:
+            active = parse_bool_param('active')
+            frontend = parse_bool_param('frontend')
+            last_used_from = parse_datetime_param('last_used_from')
+            last_used_to = parse_datetime_param('last_used_to')
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        if active is not None:
+            filters['active'] = active
+        if frontend is not None:
+            filters['is_frontend_token'] = frontend
+        # Búsqueda exacta (índice de un solo campo de Firestore)
+        for field in ('email', 'username'):
+            value = request.args.get(field, '').strip()
+            if value:
+                filters[field] = value
+        
+        query, order_fields = build_admin_users_query(filters, last_used_from, last_used_to)
+        cursor = request.args.get('cursor', '')
+        if cursor:
+            position = admin_user_cursor_position(cursor, order_fields)
+            if position is None:
+                return jsonify({"error": "Cursor inválido"}), 400
+            query = query.start_after(position)
+        
+        # Se pide un documento extra para saber si hay más páginas
+        docs = list(query.select(ADMIN_USER_LIST_FIELDS).limit(limit + 1).stream())
+        has_more = len(docs) > limit
+        docs = docs[:limit]
+        users = [admin_user_info(doc) for doc in docs]
+        next_cursor = admin_user_cursor(docs[-1], order_fields) if has_more else None
+        
+        # Totales por plan desde los contadores agregados, no desde la página
+        _, usage = current_usage_stats()
+        plan_stats = {plan: values['users'] for plan, values in usage.items()}
+        
         return jsonify({
             "success": True,
             "count": len(users),
+            "limit": limit,
+            "next_cursor": next_cursor,
+            "filters": {
+                **filters,
+                "last_used_from": last_used_from,
+                "last_used_to": last_used_to
+            },
+            "total_users": sum(plan_stats.values()),
             "plan_statistics": plan_stats,
             "users": users
         })
@@ -1940,6 +4492,8 @@ def admin_change_plan(user_data):
             'plan_updated_at': firestore.SERVER_TIMESTAMP
         }
         user_ref.update(update_data)
+        user_info = user_doc.to_dict()
+        record_plan_change(user_info, user_info.get('plan_type', 'free'), new_plan)
         return jsonify({
             "success": True,
             "message": f"Plan cambiado a {new_plan} exitosamente",
@@ -2036,59 +4590,199 @@ def admin_regenerate_token(user_data):
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/admin/usage-statistics', methods=['GET'])
+@app.route('/api/admin/usage-statistics', methods=['GET'])
+@token_required
+def admin_usage_statistics(user_data):
+    if not user_data.get('is_admin'):
+        return jsonify({"error": "Se requieren privilegios de administrador"}), 403
+    firebase_check = check_firebase()
+    if firebase_check:
+        return firebase_check
+    try:
+        # Contadores agregados por plan (1 lectura) + incrementos aún no escritos
+        stored, usage = current_usage_stats()
+        
+        # Usuarios activos en 24h: conteos cacheados, en paralelo
+        active, degraded = run_concurrent_queries({
+            plan: (lambda plan=plan: get_collection_count(('active_users', plan), active_users_query(plan)))
+            for plan in PLAN_CONFIG
+        })
+        
+        stats = {}
+        stats['total'] = {field: 0 for field in USAGE_STAT_FIELDS + ['active_users']}
+        for plan in PLAN_CONFIG:
+            stats[plan] = dict(usage[plan])
+            stats[plan]['active_users'] = active.get(plan, 0)
+            for field, value in stats[plan].items():
+                stats['total'][field] += value
+        for plan in list(PLAN_CONFIG) + ['total']:
+            if stats[plan]['users'] > 0:
+                stats[plan]['avg_requests_per_user'] = stats[plan]['total_requests'] / stats[plan]['users']
+                stats[plan]['avg_streams_per_user'] = stats[plan]['total_streams'] / stats[plan]['users']
+            else:
+                stats[plan]['avg_requests_per_user'] = 0
+                stats[plan]['avg_streams_per_user'] = 0
+        response = {
+            "success": True,
+            "statistics": stats,
+            "aggregates": {
+                "reconciled_at": stored.get('reconciled_at'),
+                "initializing": usage_stats_initializing(stored),
+                "reconcile_interval_seconds": USAGE_STATS_RECONCILE_INTERVAL,
+                "flush_interval_seconds": USAGE_STATS_FLUSH_INTERVAL
+            },
+            "plan_limits": PLAN_CONFIG,
+            "timestamp": time.time()
+        }
+        if degraded:
+            response["degraded_statistics"] = [f"active_users:{plan}" for plan in degraded]
+        return jsonify(response)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/admin/usage-timeseries', methods=['GET'])
+@token_required
+def admin_usage_timeseries(user_data):
+    """Serie temporal de peticiones o streams por minuto/hora, agrupada por plan, endpoint o contenido"""
+    if not user_data.get('is_admin'):
+        return jsonify({"error": "Se requieren privilegios de administrador"}), 403
+    firebase_check = check_firebase()
+    if firebase_check:
+        return firebase_check
+    try:
+        metric = request.args.get('metric', 'requests')
+        if metric not in ROLLUP_METRICS:
+            return jsonify({"error": f"Métrica no válida. Opciones: {ROLLUP_METRICS}"}), 400
+        resolution = request.args.get('resolution', 'hour')
+        if resolution not in ROLLUP_RESOLUTIONS:
+            return jsonify({"error": f"Resolución no válida. Opciones: {list(ROLLUP_RESOLUTIONS)}"}), 400
+        group_by = request.args.get('group_by', 'plan')
+        if group_by not in ROLLUP_METRIC_DIMENSIONS[metric]:
+            return jsonify({"error": f"Agrupación no válida para '{metric}'. Opciones: {ROLLUP_METRIC_DIMENSIONS[metric]}"}), 400
+        try:
+            top = int(request.args.get('top', 20))
+            date_to = parse_datetime_param('to')
+            date_from = parse_datetime_param('from')
+        except (ValueError, OverflowError) as e:
+            return jsonify({"error": str(e)}), 400
+        
+        size = ROLLUP_RESOLUTIONS[resolution]
+        to_start = rollup_bucket_start(date_to.timestamp() if date_to else time.time(), resolution)
+        if date_from:
+            from_start = rollup_bucket_start(date_from.timestamp(), resolution)
+        else:
+            # Por defecto: última hora por minuto o últimas 24 horas por hora
+            from_start = to_start - (59 if resolution == 'minute' else 23) * size
+        points = (to_start - from_start) // size + 1
+        if points < 1:
+            return jsonify({"error": "El rango 'from' debe ser anterior a 'to'"}), 400
+        if points > ROLLUP_MAX_POINTS:
+            return jsonify({"error": f"Rango demasiado amplio: máximo {ROLLUP_MAX_POINTS} puntos por consulta"}), 400
+        
+        buckets = query_usage_rollups(metric, resolution, from_start, to_start)
+        group_field = ROLLUP_DIMENSIONS[group_by]
+        
+        # Totales del rango por grupo; la serie solo detalla los `top` principales
+        group_totals = defaultdict(int)
+        for counters in buckets.values():
+            for value, count in (counters.get(group_field) or {}).items():
+                group_totals[value] += count
+        top_groups = sorted(group_totals.items(), key=lambda item: -item[1])[:max(1, top)]
+        top_names = [value for value, _ in top_groups]
+        
+        series = []
+        for bucket_start in range(from_start, to_start + 1, size):
+            counters = buckets.get(bucket_start, {})
+            groups = counters.get(group_field) or {}
+            series.append({
+                "bucket_start": bucket_start,
+                "timestamp": datetime.fromtimestamp(bucket_start, timezone.utc),
+                "total": counters.get('total', 0),
+                "groups": {value: groups.get(value, 0) for value in top_names}
+            })
+        
+        return jsonify({
+            "success": True,
+            "metric": metric,
+            "resolution": resolution,
+            "group_by": group_by,
+            "from": datetime.fromtimestamp(from_start, timezone.utc),
+            "to": datetime.fromtimestamp(to_start + size, timezone.utc),
+            "total": sum(point['total'] for point in series),
+            "top_groups": dict(top_groups),
+            "group_count": len(group_totals),
+            "series": series,
+            "flush_interval_seconds": ROLLUP_FLUSH_INTERVAL
+        })
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/admin/usage-statistics/reconcile', methods=['POST'])
 @token_required
-def admin_usage_statistics(user_data):
+def admin_reconcile_usage_statistics(user_data):
+    """Recalcula los contadores de uso desde api_users (solo admin)"""
     if not user_data.get('is_admin'):
         return jsonify({"error": "Se requieren privilegios de administrador"}), 403
     firebase_check = check_firebase()
     if firebase_check:
         return firebase_check
     try:
-        users_ref = db.collection(TOKENS_COLLECTION)
-        docs = users_ref.stream()
-        stats = {
-            'free': {'users': 0, 'total_requests': 0, 'total_streams': 0, 'active_users': 0},
-            'premium': {'users': 0, 'total_requests': 0, 'total_streams': 0, 'active_users': 0},
-            'total': {'users': 0, 'total_requests': 0, 'total_streams': 0, 'active_users': 0}
-        }
-        current_time = time.time()
-        for doc in docs:
-            user_info = doc.to_dict()
-            plan_type = user_info.get('plan_type', 'free')
-            stats[plan_type]['users'] += 1
-            stats['total']['users'] += 1
-            total_requests = user_info.get('total_usage_count', 0)
-            total_streams = user_info.get('total_streams_count', 0)
-            stats[plan_type]['total_requests'] += total_requests
-            stats[plan_type]['total_streams'] += total_streams
-            stats['total']['total_requests'] += total_requests
-            stats['total']['total_streams'] += total_streams
-            last_used = user_info.get('last_used')
-            if last_used:
-                if hasattr(last_used, 'timestamp'):
-                    last_used_time = last_used.timestamp()
-                else:
-                    last_used_time = last_used
-                if current_time - last_used_time < 86400:
-                    stats[plan_type]['active_users'] += 1
-                    stats['total']['active_users'] += 1
-        for plan in ['free', 'premium', 'total']:
-            if stats[plan]['users'] > 0:
-                stats[plan]['avg_requests_per_user'] = stats[plan]['total_requests'] / stats[plan]['users']
-                stats[plan]['avg_streams_per_user'] = stats[plan]['total_streams'] / stats[plan]['users']
-            else:
-                stats[plan]['avg_requests_per_user'] = 0
-                stats[plan]['avg_streams_per_user'] = 0
+        # El recorrido completo de api_users no se hace dentro de la petición
+        scheduled = schedule_usage_reconcile(force=True)
         return jsonify({
             "success": True,
-            "statistics": stats,
-            "plan_limits": PLAN_CONFIG,
+            "message": "Reconciliación programada" if scheduled else "Ya hay una reconciliación en curso en este proceso",
+            "scheduled": scheduled,
             "timestamp": time.time()
-        })
+        }), 202
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/admin/cache-stats', methods=['GET'])
+@token_required
+def admin_cache_stats(user_data):
+    """Estadísticas de las cachés en memoria (solo admin)"""
+    if not user_data.get('is_admin'):
+        return jsonify({"error": "Se requieren privilegios de administrador"}), 403
+    return jsonify({
+        "success": True,
+        "caches": {
+            "normalization": get_normalization_cache_stats(),
+            "search": get_search_cache_stats()
+        },
+        "timestamp": time.time()
+    })
+
+@app.route('/api/admin/link-health', methods=['GET'])
+@token_required
+def admin_link_health(user_data):
+    """Resumen del monitoreo de enlaces de streaming (solo admin)"""
+    if not user_data.get('is_admin'):
+        return jsonify({"error": "Se requieren privilegios de administrador"}), 403
+    with link_health_lock:
+        snapshot = dict(link_health)
+        shared_dead = len(shared_dead_links)
+    dead = sorted(
+        ({"url": url, **health} for url, health in snapshot.items() if not health['alive']),
+        key=lambda item: -item['consecutive_failures']
+    )
+    return jsonify({
+        "success": True,
+        "enabled": LINK_PROBE_ENABLED,
+        "role": link_probe_state['role'],
+        "interval_seconds": LINK_PROBE_INTERVAL,
+        "batch_size": LINK_PROBE_BATCH_SIZE,
+        "private_hosts_allowed": LINK_PROBE_ALLOW_PRIVATE,
+        "rotation": {"offset": link_probe_state['offset'], "total_urls": link_probe_state['total']},
+        "shared_dead_links": shared_dead,
+        "task": get_background_tasks_status().get('link_prober') or get_background_tasks_status().get('link_health_sync'),
+        "total_links": len(snapshot),
+        "alive": len(snapshot) - len(dead),
+        "dead": len(dead),
+        "dead_links": dead[:100],
+        "timestamp": time.time()
+    })
+
 # NUEVO ENDPOINT MEJORADO: Generar token para frontend con control de colecciones
 @app.route('/api/generate-frontend-token', methods=['POST'])
 @token_required
@@ -2174,6 +4868,7 @@ def generate_frontend_token(user_data):
         # Guardar en Firebase
         user_ref = db.collection(TOKENS_COLLECTION).document()
         user_ref.set(user_data_firestore)
+        record_usage_stat(plan_type, 'users')
         
         return jsonify({
             "success": True,
@@ -2262,6 +4957,8 @@ def create_pelicula(user_data):
         # Crear documento
         doc_ref = db.collection('peliculas').document(doc_id)
         doc_ref.set(data)
+        refresh_catalog_document('peliculas', doc_id)
+        adjust_collection_count('peliculas', 1)
         
         return jsonify({
             "success": True,
@@ -2317,9 +5014,11 @@ def update_pelicula(user_data, pelicula_id):
         
         # Actualizar documento
         doc_ref.update(data)
+        invalidate_normalized_content('peliculas', pelicula_id)
         
         # Obtener datos actualizados
         updated_doc = doc_ref.get()
+        catalog_upsert_snapshot('peliculas', updated_doc)
         updated_data = normalize_movie_data(updated_doc.to_dict(), pelicula_id)
         
         return jsonify({
@@ -2359,6 +5058,9 @@ def delete_pelicula(user_data, pelicula_id):
         
         # Eliminar documento
         doc_ref.delete()
+        invalidate_normalized_content('peliculas', pelicula_id)
+        catalog_remove('peliculas', pelicula_id)
+        adjust_collection_count('peliculas', -1)
         
         return jsonify({
             "success": True,
@@ -2421,10 +5123,14 @@ def create_serie(user_data):
         data['last_updated'] = firestore.SERVER_TIMESTAMP
         data['is_active'] = True
         data['content_type'] = 'serie'
+        data['has_seasons'] = series_has_seasons(data)
         
         # Crear documento
         doc_ref = db.collection('contenido').document(doc_id)
         doc_ref.set(data)
+        refresh_catalog_document('contenido', doc_id)
+        if data['has_seasons']:
+            adjust_collection_count('contenido', 1)
         
         return jsonify({
             "success": True,
@@ -2478,12 +5184,18 @@ def update_serie(user_data, serie_id):
         data['last_updated'] = firestore.SERVER_TIMESTAMP
         data['updated_by'] = user_data.get('username', 'unknown')
         data['content_type'] = 'serie'
+        if 'seasons' in data:
+            data['has_seasons'] = series_has_seasons(data)
         
         # Actualizar documento
         doc_ref.update(data)
+        invalidate_normalized_content('contenido', serie_id)
         
         # Obtener datos actualizados
         updated_doc = doc_ref.get()
+        catalog_upsert_snapshot('contenido', updated_doc)
+        # Las temporadas pueden haber cambiado: recontar en la próxima consulta
+        invalidate_collection_count('contenido')
         updated_data = normalize_series_data(updated_doc.to_dict(), serie_id)
         
         return jsonify({
@@ -2523,6 +5235,10 @@ def delete_serie(user_data, serie_id):
         
         # Eliminar documento
         doc_ref.delete()
+        invalidate_normalized_content('contenido', serie_id)
+        catalog_remove('contenido', serie_id)
+        if doc.to_dict().get('has_seasons'):
+            adjust_collection_count('contenido', -1)
         
         return jsonify({
             "success": True,
@@ -2588,6 +5304,8 @@ def create_canal(user_data):
         # Crear documento
         doc_ref = db.collection('canales').document(doc_id)
         doc_ref.set(data)
+        refresh_catalog_document('canales', doc_id)
+        adjust_collection_count('canales', 1)
         
         return jsonify({
             "success": True,
@@ -2643,9 +5361,11 @@ def update_canal(user_data, canal_id):
         
         # Actualizar documento
         doc_ref.update(data)
+        invalidate_normalized_content('canales', canal_id)
         
         # Obtener datos actualizados
         updated_doc = doc_ref.get()
+        catalog_upsert_snapshot('canales', updated_doc)
         updated_data = normalize_channel_data(updated_doc.to_dict(), canal_id)
         
         return jsonify({
@@ -2685,6 +5405,9 @@ def delete_canal(user_data, canal_id):
         
         # Eliminar documento
         doc_ref.delete()
+        invalidate_normalized_content('canales', canal_id)
+        catalog_remove('canales', canal_id)
+        adjust_collection_count('canales', -1)
         
         return jsonify({
             "success": True,
@@ -2695,6 +5418,171 @@ def delete_canal(user_data, canal_id):
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+# =============================================
+# CONTADORES DE REPORTES
+# =============================================
+
+REPORTS_COLLECTION = 'reports'
+REPORT_STATS_DOC_ID = 'reports'
+REPORT_STATUSES = ['pending', 'reviewed', 'resolved']
+REPORT_CONTENT_TYPES = ['pelicula', 'serie', 'canal']
+REPORT_RECENT_DAYS = 7
+# Un documento por día (UTC); expires_at permite borrarlos con una política TTL de Firestore
+REPORT_DAILY_COLLECTION = 'report_daily_counts'
+REPORT_DAILY_RETENTION_DAYS = REPORT_RECENT_DAYS + 1
+
+def report_stats_ref():
+    return db.collection(STATS_COLLECTION).document(REPORT_STATS_DOC_ID)
+
+def report_day_key(timestamp):
+    """Bucket diario (UTC) de un reporte: 'AAAA-MM-DD'"""
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y-%m-%d')
+
+def report_day_ref(day):
+    return db.collection(REPORT_DAILY_COLLECTION).document(day)
+
+def report_day_document(day, count):
+    """Contenido del documento de un día; count puede ser un entero o un Increment"""
+    return {
+        'day': day,
+        'count': count,
+        'expires_at': datetime.strptime(day, '%Y-%m-%d').replace(tzinfo=timezone.utc)
+        + timedelta(days=REPORT_DAILY_RETENTION_DAYS)
+    }
+
+def report_created_increments(report_data):
+    """Incrementos del documento de contadores para un reporte nuevo"""
+    return {
+        'total': firestore.Increment(1),
+        'by_status': {report_data['status']: firestore.Increment(1)},
+        'by_content_type': {report_data['contentType']: firestore.Increment(1)},
+        'by_reason': {report_data['reason']: firestore.Increment(1)}
+    }
+
+def report_status_increments(old_status, new_status):
+    """Mueve un reporte de un estado a otro en los contadores"""
+    return {
+        'by_status': {
+            old_status: firestore.Increment(-1),
+            new_status: firestore.Increment(1)
+        }
+    }
+
+def compute_report_stats():
+    """Recorre reports completo (solo para reconciliar) y devuelve los contadores"""
+    stats = {'total': 0, 'by_status': {}, 'by_content_type': {}, 'by_reason': {}, 'daily': {}}
+    oldest_day = report_day_key(time.time() - REPORT_RECENT_DAYS * 86400)
+    fields = ['status', 'contentType', 'reason', 'timestamp']
+    for doc in db.collection(REPORTS_COLLECTION).select(fields).stream():
+        report = doc.to_dict()
+        stats['total'] += 1
+        for key, field in (('by_status', 'status'), ('by_content_type', 'contentType'), ('by_reason', 'reason')):
+            value = report.get(field)
+            if value:
+                stats[key][value] = stats[key].get(value, 0) + 1
+        if isinstance(report.get('timestamp'), (int, float)):
+            day = report_day_key(report['timestamp'])
+            # Solo se conservan los buckets de la ventana reciente
+            if day >= oldest_day:
+                stats['daily'][day] = stats['daily'].get(day, 0) + 1
+    return stats
+
+def reconcile_report_stats():
+    """Recalcula los contadores de reportes desde la colección y los sobrescribe"""
+    if not db:
+        return None
+    start = time.time()
+    stats = compute_report_stats()
+    daily = stats.pop('daily')
+    batch = db.batch()
+    batch.set(report_stats_ref(), {**stats, 'reconciled_at': firestore.SERVER_TIMESTAMP})
+    for day in recent_report_days():
+        batch.set(report_day_ref(day), report_day_document(day, daily.get(day, 0)))
+    batch.commit()
+    stats['daily'] = daily
+    print(f"📊 Contadores de reportes reconciliados en {time.time() - start:.2f}s")
+    return stats
+
+def recent_report_days():
+    """Hoy y los REPORT_RECENT_DAYS - 1 días anteriores (UTC)"""
+    now = time.time()
+    return [report_day_key(now - offset * 86400) for offset in range(REPORT_RECENT_DAYS)]
+
+@firestore.transactional
+def apply_report_update(transaction, report_ref, update_data):
+    """Actualiza un reporte y mueve su contador de estado dentro de la transacción.
+
+    Devuelve el reporte previo o None si no existe. Leer el estado anterior en
+    la misma transacción evita que dos cambios concurrentes descuenten dos
+    veces el mismo estado.
+    """
+    snapshot = report_ref.get(transaction=transaction)
+    if not snapshot.exists:
+        return None
+    current_report = snapshot.to_dict()
+    old_status = current_report.get('status', 'pending')
+    transaction.update(report_ref, update_data)
+    if 'status' in update_data and update_data['status'] != old_status:
+        transaction.set(report_stats_ref(), report_status_increments(old_status, update_data['status']), merge=True)
+    return current_report
+
+def get_report_stats():
+    """Contadores de reportes (1 lectura).
+
+    Se reconstruyen si nunca se reconciliaron: los incrementos de
+    create_report pueden haber creado el documento sin contar los reportes
+    previos.
+    """
+    stats_doc = report_stats_ref().get()
+    stored = stats_doc.to_dict() if stats_doc.exists else None
+    if not stored or 'reconciled_at' not in stored:
+        stored = reconcile_report_stats()
+    # Ventana móvil por días: un documento por día (REPORT_RECENT_DAYS lecturas en un solo get_all)
+    recent_days = recent_report_days()
+    daily = {}
+    for doc in db.get_all([report_day_ref(day) for day in recent_days]):
+        if doc.exists:
+            daily[doc.id] = (doc.to_dict() or {}).get('count', 0)
+    by_reason = stored.get('by_reason') or {}
+    return {
+        'total': stored.get('total', 0),
+        'by_status': {status: (stored.get('by_status') or {}).get(status, 0) for status in REPORT_STATUSES},
+        'by_content_type': {
+            content_type: (stored.get('by_content_type') or {}).get(content_type, 0)
+            for content_type in REPORT_CONTENT_TYPES
+        },
+        'by_reason': {reason: count for reason, count in by_reason.items() if count > 0},
+        'daily': {day: daily.get(day, 0) for day in recent_days},
+        'recent_7_days': sum(daily.get(day, 0) for day in recent_days),
+        'reconciled_at': stored.get('reconciled_at')
+    }
+
+def reports_filtered_query(status, content_type):
+    """Query de reportes con los filtros de estado y tipo de contenido"""
+    query = db.collection(REPORTS_COLLECTION)
+    if status:
+        query = query.where(filter=firestore.FieldFilter('status', '==', status))
+    if content_type:
+        query = query.where(filter=firestore.FieldFilter('contentType', '==', content_type))
+    return query
+
+def reports_filtered_total(report_stats, status, content_type):
+    """Total de reportes que cumplen los filtros.
+
+    Con un solo filtro (o ninguno) sale de los contadores; la combinación de
+    estado y tipo usa una agregación count() cacheada.
+    """
+    if status and content_type:
+        return get_collection_count(
+            ('reports', status, content_type),
+            lambda: reports_filtered_query(status, content_type)
+        )
+    if status:
+        return report_stats['by_status'].get(status, 0)
+    if content_type:
+        return report_stats['by_content_type'].get(content_type, 0)
+    return report_stats['total']
+
 # =============================================
 # ENDPOINTS PARA SISTEMA DE REPORTES
 # =============================================
@@ -2798,9 +5686,15 @@ def create_report(user_data):
             report_data['season'] = data['season']
             report_data['episode'] = data['episode']
         
-        # Guardar en Firebase
-        report_ref = db.collection('reports').document(report_id)
-        report_ref.set(report_data)
+        # Guardar en Firebase junto con los contadores (una sola escritura en lote)
+        report_ref = db.collection(REPORTS_COLLECTION).document(report_id)
+        batch = db.batch()
+        batch.set(report_ref, report_data)
+        batch.set(report_stats_ref(), report_created_increments(report_data), merge=True)
+        day = report_day_key(report_data['timestamp'])
+        batch.set(report_day_ref(day), report_day_document(day, firestore.Increment(1)), merge=True)
+        batch.commit()
+        invalidate_collection_count(('reports', report_data['status'], report_data['contentType']))
         
         # Enviar notificación por email (opcional)
         if EMAIL_CONFIG.get('admin_email'):
@@ -2932,7 +5826,7 @@ def get_reason_display(reason):
 @app.route('/api/reports', methods=['GET'])
 @token_required
 def get_reports(user_data):
-    """Obtener reportes (solo administradores)"""
+    """Obtener reportes (solo administradores) con paginación por cursor"""
     if not user_data.get('is_admin'):
         return jsonify({"error": "Se requieren privilegios de administrador"}), 403
     
@@ -2944,34 +5838,43 @@ def get_reports(user_data):
         # Parámetros de filtro
         status = request.args.get('status', '')
         content_type = request.args.get('content_type', '')
-        page = int(request.args.get('page', 1))
-        limit = int(request.args.get('limit', 20))
+        cursor = request.args.get('cursor', '')
+        page_check = page_param_rejected()
+        if page_check:
+            return page_check
+        try:
+            limit = int(request.args.get('limit', 20))
+        except ValueError:
+            return jsonify({"error": "Parámetro 'limit' inválido"}), 400
         
         # Validar parámetros
-        if page < 1:
-            page = 1
         if limit < 1 or limit > 100:
             limit = 20
         
-        offset = (page - 1) * limit
-        
-        # Construir consulta
-        reports_ref = db.collection('reports')
-        
-        # Aplicar filtros
-        if status:
-            reports_ref = reports_ref.where('status', '==', status)
-        if content_type:
-            reports_ref = reports_ref.where('contentType', '==', content_type)
-        
-        # Ordenar por fecha más reciente
-        reports_ref = reports_ref.order_by('timestamp', direction=firestore.Query.DESCENDING)
-        
-        # Aplicar paginación
-        reports_ref = reports_ref.limit(limit).offset(offset)
+        reports_query = reports_filtered_query(status, content_type)
+        
+        # Ordenar por fecha más reciente (el ID desempata reportes del mismo segundo)
+        reports_query = (
+            reports_query.order_by('timestamp', direction=firestore.Query.DESCENDING)
+            .order_by('__name__', direction=firestore.Query.DESCENDING)
+        )
+        
+        # ✅ NUEVO: Continuar desde el último reporte de la página anterior
+        if cursor:
+            position = decode_cursor(cursor)
+            if (not isinstance(position, list) or len(position) != 2
+                    or not isinstance(position[0], (int, float)) or not isinstance(position[1], str)
+                    or not is_valid_document_id(position[1])):
+                return jsonify({"error": "Cursor inválido"}), 400
+            reports_query = reports_query.start_after({
+                'timestamp': position[0],
+                '__name__': db.collection(REPORTS_COLLECTION).document(position[1])
+            })
         
-        # Ejecutar consulta
-        docs = reports_ref.stream()
+        # Se pide un documento extra para saber si hay más páginas
+        docs = list(reports_query.limit(limit + 1).stream())
+        has_more = len(docs) > limit
+        docs = docs[:limit]
         
         reports = []
         for doc in docs:
@@ -2979,31 +5882,24 @@ def get_reports(user_data):
             report_data['id'] = doc.id
             reports.append(report_data)
         
-        # Obtener total para paginación (sin filtros para contar total)
-        total_ref = db.collection('reports')
-        if status:
-            total_ref = total_ref.where('status', '==', status)
-        if content_type:
-            total_ref = total_ref.where('contentType', '==', content_type)
-        
-        total_docs = len(list(total_ref.stream()))
-        
-        # Estadísticas
-        stats = {
-            'pending': len(list(db.collection('reports').where('status', '==', 'pending').stream())),
-            'reviewed': len(list(db.collection('reports').where('status', '==', 'reviewed').stream())),
-            'resolved': len(list(db.collection('reports').where('status', '==', 'resolved').stream())),
-            'total': len(list(db.collection('reports').stream()))
-        }
+        next_cursor = None
+        if has_more:
+            next_cursor = encode_cursor([reports[-1].get('timestamp'), reports[-1]['id']])
+        
+        # Totales desde los contadores mantenidos (1 lectura)
+        report_stats = get_report_stats()
+        stats = {**report_stats['by_status'], 'total': report_stats['total']}
+        total_docs = reports_filtered_total(report_stats, status, content_type)
         
         return jsonify({
             "success": True,
             "data": reports,
             "pagination": {
-                "page": page,
                 "limit": limit,
+                "count": len(reports),
                 "total": total_docs,
-                "pages": (total_docs + limit - 1) // limit
+                "has_more": has_more,
+                "next_cursor": next_cursor
             },
             "statistics": stats,
             "filters": {
@@ -3032,11 +5928,7 @@ def update_report(user_data, report_id):
         if not data:
             return jsonify({"error": "Datos JSON requeridos"}), 400
         
-        # Verificar que el reporte existe
-        report_ref = db.collection('reports').document(report_id)
-        report_doc = report_ref.get()
-        if not report_doc.exists:
-            return jsonify({"error": "Reporte no encontrado"}), 404
+        report_ref = db.collection(REPORTS_COLLECTION).document(report_id)
         
         # Campos permitidos para actualización
         allowed_fields = ['status', 'adminNotes']
@@ -3046,13 +5938,24 @@ def update_report(user_data, report_id):
             if field in data:
                 update_data[field] = data[field]
         
+        # ✅ NUEVO: Los contadores por estado solo admiten estados conocidos
+        if 'status' in update_data and update_data['status'] not in REPORT_STATUSES:
+            return jsonify({"error": f"Estado no válido. Opciones: {REPORT_STATUSES}"}), 400
+        
         # Agregar información de resolución si el estado cambia a 'resolved'
         if 'status' in update_data and update_data['status'] == 'resolved':
             update_data['resolvedAt'] = time.time()  # ✅ CORREGIDO: usar time.time()
             update_data['resolvedBy'] = user_data.get('username', 'admin')
         
-        # Actualizar reporte
-        report_ref.update(update_data)
+        # Actualizar reporte y, si cambió el estado, los contadores en una transacción
+        current_report = apply_report_update(db.transaction(), report_ref, update_data)
+        if current_report is None:
+            return jsonify({"error": "Reporte no encontrado"}), 404
+        old_status = current_report.get('status', 'pending')
+        if 'status' in update_data and update_data['status'] != old_status:
+            content_type = current_report.get('contentType')
+            invalidate_collection_count(('reports', old_status, content_type))
+            invalidate_collection_count(('reports', update_data['status'], content_type))
         
         return jsonify({
             "success": True,
@@ -3076,49 +5979,48 @@ def get_reports_statistics(user_data):
         return firebase_check
     
     try:
-        # Estadísticas por estado
-        status_stats = {
-            'pending': len(list(db.collection('reports').where('status', '==', 'pending').stream())),
-            'reviewed': len(list(db.collection('reports').where('status', '==', 'reviewed').stream())),
-            'resolved': len(list(db.collection('reports').where('status', '==', 'resolved').stream()))
-        }
-        
-        # Estadísticas por tipo de contenido
-        content_stats = {
-            'pelicula': len(list(db.collection('reports').where('contentType', '==', 'pelicula').stream())),
-            'serie': len(list(db.collection('reports').where('contentType', '==', 'serie').stream())),
-            'canal': len(list(db.collection('reports').where('contentType', '==', 'canal').stream()))
-        }
-        
-        # Estadísticas por motivo
-        reasons = ['broken_link', 'audio_issue', 'subtitles', 'description', 'cover', 'video_quality', 'stream_down', 'wrong_episode', 'other']
-        reason_stats = {}
-        
-        for reason in reasons:
-            count = len(list(db.collection('reports').where('reason', '==', reason).stream()))
-            if count > 0:
-                reason_stats[reason] = count
-        
-        # Reportes de los últimos 7 días
-        week_ago = time.time() - (7 * 24 * 60 * 60)
-        recent_reports_ref = db.collection('reports').where('timestamp', '>=', week_ago)
-        recent_reports = len(list(recent_reports_ref.stream()))
+        # Contadores mantenidos en create_report/update_report (1 lectura)
+        report_stats = get_report_stats()
         
         return jsonify({
             "success": True,
             "statistics": {
-                "total": sum(status_stats.values()),
-                "by_status": status_stats,
-                "by_content_type": content_stats,
-                "by_reason": reason_stats,
-                "recent_7_days": recent_reports
+                "total": report_stats['total'],
+                "by_status": report_stats['by_status'],
+                "by_content_type": report_stats['by_content_type'],
+                "by_reason": report_stats['by_reason'],
+                "recent_7_days": report_stats['recent_7_days'],
+                "daily": report_stats['daily']
             },
+            "reconciled_at": report_stats['reconciled_at'],
             "timestamp": time.time()
         })
         
     except Exception as e:
         print(f"Error obteniendo estadísticas de reportes: {e}")
         return jsonify({"error": str(e)}), 500
+
+@app.route('/api/reports/statistics/reconcile', methods=['POST'])
+@token_required
+def reconcile_reports_statistics(user_data):
+    """Recalcula los contadores de reportes desde la colección (solo administradores)"""
+    if not user_data.get('is_admin'):
+        return jsonify({"error": "Se requieren privilegios de administrador"}), 403
+    
+    firebase_check = check_firebase()
+    if firebase_check:
+        return firebase_check
+    
+    try:
+        reconcile_report_stats()
+        return jsonify({
+            "success": True,
+            "message": "Contadores de reportes reconciliados",
+            "statistics": get_report_stats()
+        })
+    except Exception as e:
+        print(f"Error reconciliando estadísticas de reportes: {e}")
+        return jsonify({"error": str(e)}), 500
                 
 
 
@@ -3347,31 +6249,118 @@ def home(user_data):
             "user_info": "GET /api/user/info",
             "peliculas": "GET /api/peliculas",
             "pelicula_especifica": "GET /api/peliculas/<id>",
+            "peliculas_batch": "GET /api/peliculas/batch?ids=<id1>,<id2>",
             "series": "GET /api/series", 
             "serie_especifica": "GET /api/series/<id>",
+            "series_batch": "GET /api/series/batch?ids=<id1>,<id2>",
+            "filtros_avanzados": "GET /api/peliculas|series?genre=<g>&year=<y>&type=<t>&rating_min=<r> (premium)",
+            "ordenamiento": "GET /api/peliculas|series?sort=rating|year|title&order=asc|desc&page=<n>",
             "canales": "GET /api/canales",
             "canal_especifico": "GET /api/canales/<id>",
+            "canales_batch": "GET /api/canales/batch?ids=<id1>,<id2>",
             "buscar": "GET /api/buscar?q=<termino>",
+            "sugerencias": "GET /api/buscar/sugerencias?q=<prefijo> (no consume cuota)",
+            "buscar_por_campo": "GET /api/buscar?q=actor:<nombre>|director:<nombre>|genre:<genero>",
+            "actores": "GET /api/actores/<nombre>",
+            "directores": "GET /api/directores/<nombre>",
             "estadisticas": "GET /api/estadisticas",
-            "stream": "GET /api/stream/<id> (con límites para free)",
+            "stream": "GET /api/stream/<id> (con límites para free; header X-Stream-Ticket + token para reconexiones)",
             "connection_status": "GET /api/connection/status",
             "health": "GET /health"
         },
         "creation_endpoints": creation_endpoints,
         "admin_endpoints": {
             "create_user": "POST /api/admin/create-user",
-            "list_users": "GET /api/admin/users",
+            "list_users": "GET /api/admin/users?limit=&cursor=&plan=&active=&frontend=&last_used_from=&last_used_to=&email=&username=",
             "update_limits": "POST /api/admin/update-limits",
             "reset_limits": "POST /api/admin/reset-limits",
             "change_plan": "POST /api/admin/change-plan",
             "regenerate_token": "POST /api/admin/regenerate-token",
             "usage_statistics": "GET /api/admin/usage-statistics",
+            "reconcile_usage_statistics": "POST /api/admin/usage-statistics/reconcile",
+            "usage_timeseries": "GET /api/admin/usage-timeseries?metric=requests|streams&resolution=minute|hour&group_by=plan|endpoint (requests), plan|content (streams)&from=&to=",
+            "cache_statistics": "GET /api/admin/cache-stats",
+            "link_health": "GET /api/admin/link-health",
             "reconnect_firebase": "POST /api/connection/reconnect",
             "generate_frontend_token": "POST /api/generate-frontend-token"
         } if user_data.get('is_admin') else None,
         "instructions": "Incluya el token en el header: Authorization: Bearer {token}"
     })
 
+# Máximo de IDs por petición batch según plan
+BATCH_MAX_IDS = {
+    'free': 10,
+    'premium': 50
+}
+
+def parse_batch_ids():
+    """Lee el parámetro 'ids' (separado por comas) sin duplicados y conservando el orden"""
+    raw_ids = request.args.get('ids', '')
+    ids = []
+    seen = set()
+    for item_id in raw_ids.split(','):
+        item_id = item_id.strip()
+        if item_id and item_id not in seen:
+            seen.add(item_id)
+            ids.append(item_id)
+    return ids
+
+def batch_get_content(user_data, collection_name):
+    """Obtiene varios documentos con una sola llamada db.get_all(), en el orden solicitado"""
+    firebase_check = check_firebase()
+    if firebase_check:
+        return firebase_check
+
+    collection_check = check_collection_access(user_data, collection_name)
+    if collection_check:
+        return jsonify(collection_check[0]), collection_check[1]
+
+    try:
+        ids = parse_batch_ids()
+        if not ids:
+            return jsonify({"error": "Parámetro 'ids' requerido (separado por comas)"}), 400
+
+        plan_type = 'premium' if user_data.get('is_admin') else user_data.get('plan_type', 'free')
+        max_ids = BATCH_MAX_IDS.get(plan_type, BATCH_MAX_IDS['free'])
+        if len(ids) > max_ids:
+            return jsonify({
+                "error": f"Máximo {max_ids} IDs por petición en tu plan",
+                "requested": len(ids),
+                "limit": max_ids
+            }), 400
+
+        # Los IDs que Firestore rechazaría se informan aparte en lugar de romper la petición
+        invalid_ids = [item_id for item_id in ids if not is_valid_document_id(item_id)]
+        valid_ids = [item_id for item_id in ids if is_valid_document_id(item_id)]
+
+        # Una sola lectura batch; get_all no garantiza el orden de respuesta
+        refs = [db.collection(collection_name).document(item_id) for item_id in valid_ids]
+        snapshots = {doc.id: doc for doc in db.get_all(refs)} if refs else {}
+
+        restricted = is_plan_restricted(user_data)
+        items = []
+        not_found = []
+        for item_id in valid_ids:
+            doc = snapshots.get(item_id)
+            item = normalize_snapshot(collection_name, doc, restricted) if doc is not None and doc.exists else None
+            if item is None:
+                not_found.append(item_id)
+            else:
+                items.append(item)
+
+        return jsonify({
+            "success": True,
+            "count": len(items),
+            "requested": len(ids),
+            "plan_restrictions": restricted,
+            "not_found": not_found,
+            "invalid": invalid_ids,
+            "data": items
+        })
+    except Exception as e:
+        print(f"Error en batch de {collection_name}: {e}")
+        return jsonify({"error": str(e)}), 500
+
 # Endpoints de contenido (todos requieren token) - ACTUALIZADOS CON CONTROL DE COLECCIONES
 @app.route('/api/peliculas', methods=['GET'])
 @token_required
@@ -3386,35 +6375,53 @@ def get_peliculas(user_data):
         return jsonify(collection_check[0]), collection_check[1]
     
     try:
-        limit = int(request.args.get('limit', 1000))
-        page = int(request.args.get('page', 1))
+        limit = max(int(request.args.get('limit', 1000)), 1)
+        page = max(int(request.args.get('page', 1)), 1)
         
         # Admin y premium no tienen límites
         if user_data.get('is_admin') or user_data.get('plan_type') == 'premium':
-            max_offset = 100000
+            max_offset = None
             limit = min(limit, 10000)
         else:
             limit = min(limit, 10)
+            # Free solo accede a las primeras 50 películas, con o sin orden/filtros
             max_offset = 50
         
-        peliculas_ref = db.collection('peliculas')
         offset = (page - 1) * limit
         
-        if not user_data.get('is_admin') and user_data.get('plan_type') == 'free' and offset >= max_offset:
-            return jsonify({
-                "success": True,
-                "count": 0,
-                "message": "Límite de contenido gratuito alcanzado. Actualiza a premium para acceso completo.",
-                "data": []
-            })
-        
-        docs = peliculas_ref.limit(limit).offset(offset).stream()
+        if max_offset is not None:
+            if offset >= max_offset:
+                return jsonify({
+                    "success": True,
+                    "count": 0,
+                    "page": page,
+                    "message": "Límite de contenido gratuito alcanzado. Actualiza a premium para acceso completo.",
+                    "data": []
+                })
+            limit = min(limit, max_offset - offset)
+        
+        # ✅ NUEVO: Filtros por género/año/tipo/rating (característica del plan)
+        filters = parse_facet_filters()
+        sort = parse_sort_params()
+        if filters:
+            denied = plan_feature_denied(user_data, 'advanced_filters')
+            if denied:
+                return denied
+            response = faceted_listing(user_data, 'peliculas', filters, limit, offset, sort)
+            response["page"] = page
+            return jsonify(response)
+        
+        # ✅ NUEVO: Ordenamiento por rating/año/título desde índices preordenados
+        if sort:
+            response = sorted_listing(user_data, 'peliculas', sort, limit, offset)
+            response["page"] = page
+            return jsonify(response)
+        
+        docs = db.collection('peliculas').limit(limit).offset(offset).stream()
         peliculas = []
         for doc in docs:
-            pelicula_data = normalize_movie_data(doc.to_dict(), doc.id)
-            # ✅ MODIFICADO: Usuarios free ven los enlaces pero con límites de uso
-            if user_data.get('plan_type') == 'free' and not user_data.get('is_admin'):
-                pelicula_data = limit_content_info(pelicula_data, 'pelicula')
+            # ✅ MODIFICADO: Usuarios free ven los enlaces pero con límites de uso (vista precalculada)
+            pelicula_data = normalize_snapshot('peliculas', doc, is_plan_restricted(user_data))
             peliculas.append(pelicula_data)
         
         return jsonify({
@@ -3425,9 +6432,17 @@ def get_peliculas(user_data):
             "plan_restrictions": user_data.get('plan_type') == 'free' and not user_data.get('is_admin'),
             "data": peliculas
         })
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/peliculas/batch', methods=['GET'])
+@token_required
+def get_peliculas_batch(user_data):
+    """Obtener varias películas por ID (?ids=a,b,c) contando una sola petición"""
+    return batch_get_content(user_data, 'peliculas')
+
 @app.route('/api/peliculas/<pelicula_id>', methods=['GET'])
 @token_required
 def get_pelicula(user_data, pelicula_id):
@@ -3444,10 +6459,8 @@ def get_pelicula(user_data, pelicula_id):
         doc_ref = db.collection('peliculas').document(pelicula_id)
         doc = doc_ref.get()
         if doc.exists:
-            pelicula_data = normalize_movie_data(doc.to_dict(), doc.id)
-            # ✅ MODIFICADO: Usuarios free ven los enlaces pero con límites de uso
-            if user_data.get('plan_type') == 'free' and not user_data.get('is_admin'):
-                pelicula_data = limit_content_info(pelicula_data, 'pelicula')
+            # ✅ MODIFICADO: Usuarios free ven los enlaces pero con límites de uso (vista precalculada)
+            pelicula_data = normalize_snapshot('peliculas', doc, is_plan_restricted(user_data))
             return jsonify({
                 "success": True,
                 "data": pelicula_data
@@ -3474,24 +6487,55 @@ def get_series(user_data):
     try:
         # Límites según plan
         if user_data.get('is_admin') or user_data.get('plan_type') == 'premium':
-            limit = min(int(request.args.get('limit', 1000)), 10000)
+            limit = min(max(int(request.args.get('limit', 1000)), 1), 10000)
+            max_offset = None
         else:
-            limit = min(int(request.args.get('limit', 20)), 50)
+            limit = min(max(int(request.args.get('limit', 20)), 1), 50)
+            # Free solo accede a las primeras 50 series, con o sin paginación
+            max_offset = 50
+        
+        page = max(int(request.args.get('page', 1)), 1)
+        offset = (page - 1) * limit
+        
+        if max_offset is not None:
+            if offset >= max_offset:
+                return jsonify({
+                    "success": True,
+                    "count": 0,
+                    "page": page,
+                    "message": "Límite de contenido gratuito alcanzado. Actualiza a premium para acceso completo.",
+                    "data": []
+                })
+            limit = min(limit, max_offset - offset)
+        
+        # ✅ NUEVO: Filtros por género/año/tipo/rating (característica del plan)
+        filters = parse_facet_filters()
+        sort = parse_sort_params()
+        if filters:
+            denied = plan_feature_denied(user_data, 'advanced_filters')
+            if denied:
+                return denied
+            response = faceted_listing(user_data, 'contenido', filters, limit, offset, sort)
+            response["page"] = page
+            return jsonify(response)
+        
+        # ✅ NUEVO: Ordenamiento por rating/año/título desde índices preordenados
+        if sort:
+            response = sorted_listing(user_data, 'contenido', sort, limit, offset)
+            response["page"] = page
+            return jsonify(response)
         
         # Obtener series de la colección 'contenido'
         series_ref = db.collection('contenido')
-        docs = series_ref.limit(limit).stream()
+        docs = series_ref.limit(limit).offset(offset).stream()
         
         series = []
         for doc in docs:
             try:
-                serie_data = doc.to_dict()
                 # VERIFICAR que sea una serie válida (tiene seasons)
-                if serie_data.get('seasons'):
-                    serie_data = normalize_series_data(serie_data, doc.id)
-                    # Para usuarios free, limitar información
-                    if user_data.get('plan_type') == 'free' and not user_data.get('is_admin'):
-                        serie_data = limit_content_info(serie_data, 'serie')
+                # Para usuarios free, vista limitada precalculada
+                serie_data = normalize_snapshot('contenido', doc, is_plan_restricted(user_data))
+                if serie_data:
                     series.append(serie_data)
             except Exception as e:
                 print(f"⚠️ Error procesando serie {doc.id}: {e}")
@@ -3500,13 +6544,23 @@ def get_series(user_data):
         return jsonify({
             "success": True,
             "count": len(series),
+            "page": page,
+            "limit": limit,
             "data": series
         })
         
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         print(f"❌ Error obteniendo series: {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/series/batch', methods=['GET'])
+@token_required
+def get_series_batch(user_data):
+    """Obtener varias series por ID (?ids=a,b,c) contando una sola petición"""
+    return batch_get_content(user_data, 'contenido')
+
 @app.route('/api/series/<serie_id>', methods=['GET'])
 @token_required
 def get_serie(user_data, serie_id):
@@ -3524,14 +6578,9 @@ def get_serie(user_data, serie_id):
         doc_ref = db.collection('contenido').document(serie_id)
         doc = doc_ref.get()
         if doc.exists:
-            serie_data = doc.to_dict()
-            if serie_data.get('seasons'):
-                serie_data = normalize_series_data(serie_data, doc.id)
-       
-
-         # Para usuarios free, limitar información pero mostrar disponibilidad
-                if user_data.get('plan_type') == 'free' and not user_data.get('is_admin'):
-                    serie_data = limit_content_info(serie_data, 'serie')
+            # Para usuarios free, limitar información pero mostrar disponibilidad
+            serie_data = normalize_snapshot('contenido', doc, is_plan_restricted(user_data))
+            if serie_data:
                 return jsonify({
                     "success": True,
                     "data": serie_data
@@ -3546,6 +6595,11 @@ def get_serie(user_data, serie_id):
 @app.route('/api/canales', methods=['GET'])
 @token_required
 def get_canales(user_data):
+    """Listar canales desde el índice en memoria con paginación por cursor y filtros.
+
+    Sin 'limit' ni 'cursor' devuelve todos los canales, como antes de la
+    paginación; la paginación se activa al pasar cualquiera de los dos.
+    """
     firebase_check = check_firebase()
     if firebase_check:
         return firebase_check
@@ -3556,24 +6610,69 @@ def get_canales(user_data):
         return jsonify(collection_check[0]), collection_check[1]
     
     try:
-        canales_ref = db.collection('canales')
-        docs = canales_ref.stream()
-        canales = []
-        for doc in docs:
-            canal_data = normalize_channel_data(doc.to_dict(), doc.id)
-            # Para usuarios free, limitar información pero mostrar disponibilidad
-            if user_data.get('plan_type') == 'free' and not user_data.get('is_admin'):
-                canal_data = limit_content_info(canal_data, 'canal')
-            canales.append(canal_data)
+        cursor = request.args.get('cursor', '')
+        if 'limit' in request.args:
+            limit = int(request.args['limit'])
+            limit = CANALES_DEFAULT_LIMIT if limit < 1 else min(limit, CANALES_MAX_LIMIT)
+        else:
+            # Compatibilidad: los clientes sin paginación reciben el listado completo
+            limit = CANALES_DEFAULT_LIMIT if cursor else None
+        
+        # Filtros por categoría, país y estado (sin distinguir mayúsculas ni acentos)
+        filters = {
+            field: fold_text(request.args[field])
+            for field in CHANNEL_FILTER_FIELDS if request.args.get(field)
+        }
+        
+        cursor_key = None
+        if cursor:
+            cursor_key = decode_cursor(cursor)
+            # La clave de orden es (nombre plegado, doc_id): otros tipos romperían la comparación
+            if (not isinstance(cursor_key, list) or len(cursor_key) != 2
+                    or not all(isinstance(part, str) for part in cursor_key)):
+                return jsonify({"error": "Cursor inválido"}), 400
+            cursor_key = tuple(cursor_key)
+        
+        ensure_catalog_loaded('canales')
+        restricted = is_plan_restricted(user_data)
+        
+        # El listado se reconstruye solo cuando cambian los canales
+        cache_key = (catalog_versions['canales'], tuple(sorted(filters.items())), cursor_key, limit, restricted)
+        listing = channel_listing_cache.get(cache_key)
+        if listing is None:
+            page_ids, last_key, total = query_channel_index(filters, cursor_key, limit)
+            canales = []
+            with catalog_lock:
+                entries = [(doc_id, catalog_documents['canales'].get(doc_id)) for doc_id in page_ids]
+            for doc_id, entry in entries:
+                if entry is not None:
+                    # Para usuarios free, limitar información pero mostrar disponibilidad
+                    canales.append(normalize_catalog_entry('canales', doc_id, entry, restricted))
+            listing = (canales, encode_cursor(list(last_key)) if last_key else None, total)
+            channel_listing_cache.set(cache_key, listing)
+        canales, next_cursor, total = listing
+        
         return jsonify({
             "success": True,
             "count": len(canales),
-            "plan_restrictions": user_data.get('plan_type') == 'free' and not user_data.get('is_admin'),
+            "total": total,
+            "limit": limit,
+            "next_cursor": next_cursor,
+            "filters": filters,
+            "plan_restrictions": restricted,
             "data": canales
         })
+    except ValueError:
+        return jsonify({"error": "Parámetro 'limit' inválido"}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/canales/batch', methods=['GET'])
+@token_required
+def get_canales_batch(user_data):
+    """Obtener varios canales por ID (?ids=a,b,c) contando una sola petición"""
+    return batch_get_content(user_data, 'canales')
+
 @app.route('/api/canales/<canal_id>', methods=['GET'])
 @token_required
 def get_canal(user_data, canal_id):
@@ -3590,10 +6689,8 @@ def get_canal(user_data, canal_id):
         doc_ref = db.collection('canales').document(canal_id)
         doc = doc_ref.get()
         if doc.exists:
-            canal_data = normalize_channel_data(doc.to_dict(), doc.id)
             # Para usuarios free, limitar información pero mostrar disponibilidad
-            if user_data.get('plan_type') == 'free' and not user_data.get('is_admin'):
-                canal_data = limit_content_info(canal_data, 'canal')
+            canal_data = normalize_snapshot('canales', doc, is_plan_restricted(user_data))
             return jsonify({
                 "success": True,
                 "data": canal_data
@@ -3603,6 +6700,50 @@ def get_canal(user_data, canal_id):
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/actores/<path:nombre>', methods=['GET'])
+@token_required
+def get_contenido_por_actor(user_data, nombre):
+    """Todas las películas y series en las que participa un actor"""
+    return browse_by_field(user_data, 'actor', nombre)
+
+@app.route('/api/directores/<path:nombre>', methods=['GET'])
+@token_required
+def get_contenido_por_director(user_data, nombre):
+    """Todas las películas y series de un director"""
+    return browse_by_field(user_data, 'director', nombre)
+
+@app.route('/api/buscar/sugerencias', methods=['GET'])
+@token_required_uncharged('suggestions')
+def buscar_sugerencias(user_data):
+    """Autocompletado desde el índice en memoria (no consume cuota diaria ni de sesión)"""
+    firebase_check = check_firebase()
+    if firebase_check:
+        return firebase_check
+    try:
+        termino = request.args.get('q', '')
+        if not termino:
+            return jsonify({"error": "Término de búsqueda requerido"}), 400
+        
+        limit = int(request.args.get('limit', SUGGESTIONS_DEFAULT_LIMIT))
+        if limit < 1 or limit > SUGGESTIONS_MAX_LIMIT:
+            limit = SUGGESTIONS_DEFAULT_LIMIT
+        
+        allowed_collections = user_data.get('allowed_collections', ['peliculas', 'contenido', 'canales'])
+        collections = [name for name in SEARCH_TITLE_FIELDS if name in allowed_collections]
+        ensure_catalogs_loaded(*collections)
+        sugerencias = suggest(termino, collections, limit)
+        
+        return jsonify({
+            "success": True,
+            "termino": termino,
+            "count": len(sugerencias),
+            "data": sugerencias
+        })
+    except ValueError:
+        return jsonify({"error": "Parámetro 'limit' inválido"}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/buscar', methods=['GET'])
 @token_required
 def buscar(user_data):
@@ -3615,59 +6756,29 @@ def buscar(user_data):
             return jsonify({"error": "Término de búsqueda requerido"}), 400
         
         # Para admin y premium, búsqueda más amplia
-        if user_data.get('is_admin') or user_data.get('plan_type') == 'premium':
-            search_limit = 50
+        if user_data.get('is_admin'):
+            search_limit = PLAN_CONFIG['premium']['features']['search_limit']
         else:
-            search_limit = 5
+            search_limit = PLAN_CONFIG[user_data.get('plan_type', 'free')]['features']['search_limit']
         
         limit = min(int(request.args.get('limit', 10)), search_limit)
-        resultados = []
         
         # ✅ NUEVO: Solo buscar en colecciones permitidas para tokens web
         allowed_collections = user_data.get('allowed_collections', ['peliculas', 'contenido', 'canales'])
+        collections = [name for name in SEARCH_FIELDS if name in allowed_collections]
         
-        if 'peliculas' in allowed_collections:
-            peliculas_ref = db.collection('peliculas')
-            peliculas_query = peliculas_ref.where('title', '>=', termino).where('title', '<=', termino + '\uf8ff')
-            peliculas_docs = peliculas_query.limit(limit).stream()
-            
-            for doc in peliculas_docs:
-                data = normalize_movie_data(doc.to_dict(), doc.id)
-                data['tipo'] = 'pelicula'
-                if user_data.get('plan_type') == 'free' and not user_data.get('is_admin'):
-                    data = limit_content_info(data, 'pelicula')
-                resultados.append(data)
-        
-        # Todos los usuarios pueden buscar series ahora, si tienen acceso
-        if 'contenido' in allowed_collections:
-            series_ref = db.collection('contenido')
-            series_query = series_ref.where('title', '>=', termino).where('title', '<=', termino + '\uf8ff')
-            series_docs = series_query.limit(limit).stream()
-            for doc in series_docs:
-                data = doc.to_dict()
-                if data.get('seasons'):
-                    data = normalize_series_data(data, doc.id)
-                    data['tipo'] = 'serie'
-                    if user_data.get('plan_type') == 'free' and not user_data.get('is_admin'):
-                        data = limit_content_info(data, 'serie')
-                    resultados.append(data)
-        
-        # ✅ NUEVO: Buscar en canales si está permitido
-        if 'canales' in allowed_collections:
-            canales_ref = db.collection('canales')
-            canales_query = canales_ref.where('name', '>=', termino).where('name', '<=', termino + '\uf8ff')
-            canales_docs = canales_query.limit(limit).stream()
-            for doc in canales_docs:
-                data = normalize_channel_data(doc.to_dict(), doc.id)
-                data['tipo'] = 'canal'
-                if user_data.get('plan_type') == 'free' and not user_data.get('is_admin'):
-                    data = limit_content_info(data, 'canal')
-                resultados.append(data)
+        # Búsqueda en índices en memoria (sin lecturas a Firestore), cacheada por término/plan/colecciones
+        ensure_catalogs_loaded(*collections)
+        fuzzy_enabled = request.args.get('fuzzy', 'true').lower() != 'false'
+        resultados, fuzzy_count = cached_search(
+            termino, collections, limit, is_plan_restricted(user_data), fuzzy_enabled
+        )
         
         return jsonify({
             "success": True,
             "termino": termino,
             "count": len(resultados),
+            "fuzzy_matches": fuzzy_count,
             "search_limit": search_limit,
             "plan_type": 'premium' if user_data.get('is_admin') else user_data.get('plan_type', 'free'),
             "allowed_collections": allowed_collections if user_data.get('is_frontend_token') else "all",  # ✅ NUEVO
@@ -3676,103 +6787,218 @@ def buscar(user_data):
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+# =============================================
+# TICKETS DE STREAMING FIRMADOS
+# =============================================
+
+# Obligatorio para emitir tickets: debe ser el mismo en todos los workers/instancias,
+# si no, un ticket emitido por un proceso es rechazado por los demás
+STREAM_TICKET_SECRET = os.environ.get('STREAM_TICKET_SECRET', '')
+STREAM_TICKETS_ENABLED = bool(STREAM_TICKET_SECRET)
+STREAM_TICKET_TTL = 3600  # igual que expires_in de /api/stream
+
+if not STREAM_TICKETS_ENABLED:
+    print("⚠️⚠️⚠️ STREAM_TICKET_SECRET no configurado: los tickets de streaming están DESHABILITADOS")
+    print("   Defina STREAM_TICKET_SECRET (el mismo valor en todos los workers) para habilitarlos")
+
+def sign_ticket_payload(payload):
+    return base64.urlsafe_b64encode(
+        hmac.new(STREAM_TICKET_SECRET.encode('utf-8'), payload.encode('ascii'), hashlib.sha256).digest()
+    ).decode('ascii').rstrip('=')
+
+def ticket_token_hash(token):
+    """Huella del token que emitió el ticket (el ticket no sirve sin el mismo token)"""
+    return hmac.new(STREAM_TICKET_SECRET.encode('utf-8'), token.encode('utf-8'), hashlib.sha256).hexdigest()[:32]
+
+def issue_stream_ticket(user_data, token, content_id, season=None, episode=None):
+    """Ticket firmado (HMAC-SHA256) ligado al token, contenido y episodio; devuelve (ticket, expira).
+
+    Sin STREAM_TICKET_SECRET no se emite ticket (None).
+    """
+    expires_at = int(time.time()) + STREAM_TICKET_TTL
+    if not STREAM_TICKETS_ENABLED or not token:
+        return None, expires_at
+    claims = {
+        'u': user_data.get('user_id'),
+        'h': ticket_token_hash(token),
+        'c': content_id,
+        's': season or '',
+        'e': episode or '',
+        'x': expires_at,
+        'p': user_data.get('plan_type', 'free')
+    }
+    # Restricciones del token que deben seguir aplicándose al reutilizar el ticket
+    if user_data.get('allowed_domains'):
+        claims['d'] = user_data['allowed_domains']
+    if user_data.get('is_frontend_token'):
+        claims['f'] = True
+        claims['ac'] = user_data.get('allowed_collections', [])
+    payload = encode_cursor(claims)
+    return f"{payload}.{sign_ticket_payload(payload)}", expires_at
+
+def verify_stream_ticket(ticket, token, content_id, season=None, episode=None):
+    """Valida firma, expiración, token y contenido del ticket sin acceder a Firestore; devuelve los claims o None"""
+    if not STREAM_TICKETS_ENABLED or not token:
+        return None
+    payload, _, signature = ticket.partition('.')
+    if not payload or not signature or not hmac.compare_digest(signature, sign_ticket_payload(payload)):
+        return None
+    claims = decode_cursor(payload)
+    if not isinstance(claims, dict) or claims.get('x', 0) < time.time():
+        return None
+    if not hmac.compare_digest(str(claims.get('h', '')), ticket_token_hash(token)):
+        return None
+    if claims.get('c') != content_id or claims.get('s') != (season or '') or claims.get('e') != (episode or ''):
+        return None
+    return claims
+
+def stream_ticket_accepted(view):
+    """Autentica la vista con token_required o, si hay ticket válido, sin consumir cuota.
+
+    El ticket solo se acepta en el header X-Stream-Ticket y junto con el mismo
+    token que lo obtuvo (se compara su huella localmente, sin leer Firestore).
+    El límite de requests por minuto del plan se aplica igual (es en memoria).
+    Sin ticket, o si no es válido, sigue el flujo normal de token_required.
+    No se apila con token_required: lo aplica internamente.
+    """
+    authenticated_view = token_required(view)
+    
+    @wraps(view)
+    def decorated(*args, **kwargs):
+        ticket = request.headers.get('X-Stream-Ticket')
+        if not ticket:
+            return authenticated_view(*args, **kwargs)
+        token = get_request_token()
+        claims = verify_stream_ticket(
+            ticket, token, kwargs.get('content_id'), request.args.get('season'), request.args.get('episode')
+        )
+        if claims is None:
+            return authenticated_view(*args, **kwargs)
+        user_data = {
+            'user_id': claims['u'],
+            'plan_type': claims['p'],
+            'is_admin': False,
+            'allowed_domains': claims.get('d', []),
+            'is_frontend_token': claims.get('f', False),
+            'allowed_collections': claims.get('ac', []),
+            'stream_ticket': ticket,
+            'stream_ticket_expires_at': claims['x']
+        }
+        if not user_data['is_frontend_token']:
+            user_data.pop('allowed_collections')
+        domain_check = check_domain_restriction(user_data)
+        if domain_check:
+            return jsonify(domain_check[0]), domain_check[1]
+        # ✅ NUEVO: el ticket no consume cuota diaria, pero sí cuenta para el límite por minuto
+        limit_check = check_user_rate_limit(user_data)
+        if limit_check:
+            return jsonify(limit_check[0]), limit_check[1]
+        return view(user_data, *args, **kwargs)
+    return decorated
+
 # ENDPOINT DE STREAM ACTUALIZADO CON LÍMITES
 @app.route('/api/stream/<content_id>', methods=['GET'])
-@token_required
+@stream_ticket_accepted
 def get_stream_url(user_data, content_id):
     """Obtener URL de streaming con límites diarios para free"""
     firebase_check = check_firebase()
     if firebase_check:
         return firebase_check
     
-    # Verificar límites de streams para usuarios free
-    if not user_data.get('is_admin') and user_data.get('plan_type') == 'free':
+    # Verificar límites de streams para usuarios free (un ticket válido ya fue contado)
+    if not user_data.get('is_admin') and user_data.get('plan_type') == 'free' and not user_data.get('stream_ticket'):
         stream_limit_check = check_stream_limits(user_data)
         if stream_limit_check:
             return jsonify(stream_limit_check[0]), stream_limit_check[1]
     
     try:
-        content_ref = db.collection('peliculas').document(content_id)
-        content_doc = content_ref.get()
+        # ✅ NUEVO: Ir directo a la colección correcta (parámetro 'type' o índice de rutas en memoria)
+        content_type_param = request.args.get('type', '').strip().lower()
+        if content_type_param:
+            collection_name = CONTENT_COLLECTIONS.get(content_type_param, content_type_param)
+            if collection_name not in CONTENT_TYPES:
+                return jsonify({
+                    "error": "Parámetro 'type' inválido",
+                    "allowed_types": list(CONTENT_COLLECTIONS)
+                }), 400
+            collection_name, content_data = load_content_for_stream(content_id, [collection_name])
+        else:
+            collection_name, content_data = load_content_for_stream(content_id)
         streaming_url = None
-        content_type = "pelicula"
+        content_type = CONTENT_TYPES.get(collection_name, "pelicula")
         
-        # ✅ NUEVO: Verificar acceso a la colección para tokens web
-        if content_doc.exists:
-            collection_check = check_collection_access(user_data, 'peliculas')
+        if collection_name:
+            # ✅ NUEVO: Verificar acceso a la colección para tokens web
+            collection_check = check_collection_access(user_data, collection_name)
             if collection_check:
                 return jsonify(collection_check[0]), collection_check[1]
-            
-            content_data = normalize_movie_data(content_doc.to_dict(), content_id)
+        
+        link_status = None
+        if collection_name == 'peliculas':
             play_links = content_data.get('play_links', [])
             if play_links:
-                streaming_url = play_links[0].get('url')
-        else:
-            content_ref = db.collection('contenido').document(content_id)
-            content_doc = content_ref.get()
-            if content_doc.exists:
-                # ✅ NUEVO: Verificar acceso a la colección para tokens web
-                collection_check = check_collection_access(user_data, 'contenido')
-                if collection_check:
-                    return jsonify(collection_check[0]), collection_check[1]
-                
-                content_data = content_doc.to_dict()
-                content_type = "serie"
-                # Para series, se necesita especificar temporada y episodio
-                season = request.args.get('season')
-                episode = request.args.get('episode')
-                
-                if not season or not episode:
-                    return jsonify({
-                        "success": False,
-                        "message": "Para series, especifique temporada y episodio",
-                        "content_type": "serie",
-                        "parameters_required": {
-                            "season": "número de temporada",
-                            "episode": "número de episodio"
-                        }
-                    }), 400
-                
-                # Buscar el episodio específico
-                seasons = content_data.get('seasons', {})
-                season_key = f"season-{season}"
-                if season_key in seasons:
-                    episodes = seasons[season_key].get('episodes', {})
-                    episode_key = f"episode-{episode}"
-                    if episode_key in episodes:
-                        episode_data = episodes[episode_key]
-                        play_links = episode_data.get('play_links', [])
-                        if play_links:
-                            streaming_url = play_links[0].get('url')
-                        else:
-                            return jsonify({"error": "Episodio sin enlaces de streaming"}), 404
-                    else:
-                        return jsonify({"error": "Episodio no encontrado"}), 404
-                else:
-                    return jsonify({"error": "Temporada no encontrado"}), 404
+                # ✅ NUEVO: Elegir el enlace activo más rápido según el monitoreo
+                best_link, link_status = select_best_link(play_links, 'url')
+                streaming_url = best_link.get('url') if best_link else None
+        elif collection_name == 'contenido':
+            # Para series, se necesita especificar temporada y episodio
+            season = request.args.get('season')
+            episode = request.args.get('episode')
+            
+            if not season or not episode:
+                return jsonify({
+                    "success": False,
+                    "message": "Para series, especifique temporada y episodio",
+                    "content_type": "serie",
+                    "parameters_required": {
+                        "season": "número de temporada",
+                        "episode": "número de episodio"
+                    }
+                }), 400
+            
+            # ✅ NUEVO: Buscar el episodio en el mapa precalculado (temporada, episodio) -> enlaces
+            episode_status, play_links = get_episode_links(content_id, season, episode)
+            if episode_status == 'no_season':
+                return jsonify({"error": "Temporada no encontrado"}), 404
+            if episode_status == 'no_episode':
+                return jsonify({"error": "Episodio no encontrado"}), 404
+            if play_links:
+                best_link, link_status = select_best_link(play_links, 'url')
+                streaming_url = best_link.get('url') if best_link else None
             else:
-                content_ref = db.collection('canales').document(content_id)
-                content_doc = content_ref.get()
-                if content_doc.exists:
-                    # ✅ NUEVO: Verificar acceso a la colección para tokens web
-                    collection_check = check_collection_access(user_data, 'canales')
-                    if collection_check:
-                        return jsonify(collection_check[0]), collection_check[1]
-                    
-                    content_data = normalize_channel_data(content_doc.to_dict(), content_id)
-                    content_type = "canal"
-                    stream_options = content_data.get('stream_options', [])
-                    if stream_options:
-                        streaming_url = stream_options[0].get('stream_url')
+                return jsonify({"error": "Episodio sin enlaces de streaming"}), 404
+        elif collection_name == 'canales':
+            stream_options = content_data.get('stream_options', [])
+            if stream_options:
+                best_option, link_status = select_best_link(stream_options, 'stream_url')
+                streaming_url = best_option.get('stream_url') if best_option else None
         
         if streaming_url:
+            record_content_play(collection_name, content_id)
+            if not user_data.get('stream_ticket'):
+                record_usage_event('streams', user_data.get('plan_type', 'free'), content_id=content_id)
+            # ✅ NUEVO: Ticket para reconexiones y seeks sin consumir cuota ni contar el stream (requiere el mismo token)
+            if user_data.get('stream_ticket'):
+                ticket = user_data['stream_ticket']
+                ticket_expires_at = user_data['stream_ticket_expires_at']
+            else:
+                ticket, ticket_expires_at = issue_stream_ticket(
+                    user_data, get_request_token(), content_id, request.args.get('season'), request.args.get('episode')
+                )
             return jsonify({
                 "success": True,
                 "streaming_url": streaming_url,
                 "content_type": content_type,
-                "expires_in": 3600,
+                "expires_in": max(0, int(ticket_expires_at - time.time())),
+                "ticket": ticket,
+                "ticket_expires_at": ticket_expires_at,
                 "quality": "HD",
-                "stream_counted": True if not user_data.get('is_admin') and user_data.get('plan_type') == 'free' else False
+                "link_status": {
+                    "alive": link_status['alive'],
+                    "latency_ms": link_status['latency_ms'],
+                    "checked_at": link_status['checked_at']
+                } if link_status else None,
+                "stream_counted": True if not user_data.get('is_admin') and user_data.get('plan_type') == 'free' and not user_data.get('stream_ticket') else False
             })
         else:
             return jsonify({"error": "URL de streaming no disponible"}), 404
@@ -3789,25 +7015,18 @@ def get_estadisticas(user_data):
         # ✅ NUEVO: Solo contar colecciones permitidas para tokens web
         allowed_collections = user_data.get('allowed_collections', ['peliculas', 'contenido', 'canales'])
         
-        peliculas_count = 0
-        series_count = 0
-        canales_count = 0
-        
-        if 'peliculas' in allowed_collections:
-            peliculas_count = len(list(db.collection('peliculas').limit(1000).stream()))
-        
-        if 'contenido' in allowed_collections:
-            series_ref = db.collection('contenido')
-            series_docs = series_ref.limit(1000).stream()
-            for doc in series_docs:
-                data = doc.to_dict()
-                if data.get('seasons'):
-                    series_count += 1
+        # Conteos exactos (agregación count() cacheada), en paralelo si hay que refrescarlos
+        tasks = {
+            name: (lambda name=name: get_collection_count(name))
+            for name in ['peliculas', 'contenido', 'canales'] if name in allowed_collections
+        }
+        results, degraded = run_concurrent_queries(tasks)
         
-        if 'canales' in allowed_collections:
-            canales_count = len(list(db.collection('canales').limit(1000).stream()))
+        peliculas_count = results.get('peliculas', 0)
+        series_count = results.get('contenido', 0)
+        canales_count = results.get('canales', 0)
         
-        return jsonify({
+        response = {
             "success": True,
             "data": {
                 "total_peliculas": peliculas_count,
@@ -3816,7 +7035,10 @@ def get_estadisticas(user_data):
                 "total_contenido": peliculas_count + series_count,
                 "allowed_collections": allowed_collections if user_data.get('is_frontend_token') else "all"  # ✅ NUEVO
             }
-        })
+        }
+        if degraded:
+            response["degraded_collections"] = degraded
+        return jsonify(response)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -3912,13 +7134,20 @@ def normalize_generic_data(document_data, doc_id=None):
 def create_generic_endpoints(collection_name):
     """Crea endpoints genéricos automáticos para una colección"""
     
-    # Usar nombres de función únicos para cada colección
+    # Usar nombres de endpoint únicos para cada colección (Flask registra la
+    # ruta con el nombre de la función si no se indica endpoint=)
     endpoint_prefix = f"generic_{collection_name}"
+    count_key = ('generic', collection_name)
     
-    @app.route(f'/api/{collection_name}', methods=['GET'])
+    @app.route(f'/api/{collection_name}', methods=['GET'], endpoint=f"{endpoint_prefix}_get_collection")
     @token_required
     def get_generic_collection(user_data):
-        """Endpoint genérico GET para listar documentos"""
+        """Endpoint genérico GET para listar documentos.
+
+        Se pagina solo con 'cursor' (next_cursor de la respuesta anterior);
+        'page' > 1 devuelve 400. 'search' filtra solo los documentos de la
+        página actual; 'total' cuenta siempre la colección completa.
+        """
         firebase_check = check_firebase()
         if firebase_check:
             return firebase_check
@@ -3933,29 +7162,36 @@ def create_generic_endpoints(collection_name):
         
         try:
             # Parámetros de paginación
-            page = int(request.args.get('page', 1))
             limit = int(request.args.get('limit', 20))
             search = request.args.get('search', '')
+            cursor = request.args.get('cursor', '')
+            page_check = page_param_rejected()
+            if page_check:
+                return page_check
             
             # Validar parámetros
-            if page < 1:
-                page = 1
             if limit < 1 or limit > 100:
                 limit = 20
             
-            offset = (page - 1) * limit
-            
-            # Consulta base
-            collection_ref = db.collection(collection_name)
-            
-            # Obtener total para paginación
-            total_docs = len(list(collection_ref.stream()))
+            # Consulta base ordenada por ID para paginar con cursor
+            collection_ref = db.collection(collection_name).order_by('__name__')
+            if cursor:
+                last_id = decode_cursor(cursor)
+                # Un ID que Firestore no acepta no puede ser un documento de la colección
+                if not isinstance(last_id, str) or not is_valid_document_id(last_id):
+                    return jsonify({'error': 'Cursor inválido'}), 400
+                collection_ref = collection_ref.start_after({
+                    '__name__': db.collection(collection_name).document(last_id)
+                })
             
-            # Aplicar paginación
-            collection_ref = collection_ref.limit(limit).offset(offset)
+            # ✅ NUEVO: Total desde una agregación count() cacheada, sin leer la colección
+            total_docs = get_collection_count(count_key, lambda: db.collection(collection_name))
             
-            # Ejecutar consulta
-            docs = list(collection_ref.stream())
+            # Solo se leen los documentos de la página (+1 para saber si hay más)
+            docs = list(collection_ref.limit(limit + 1).stream())
+            has_more = len(docs) > limit
+            docs = docs[:limit]
+            next_cursor = encode_cursor(docs[-1].id) if has_more else None
             
             # Normalizar datos
             items = []
@@ -3964,7 +7200,8 @@ def create_generic_endpoints(collection_name):
                 normalized = normalize_generic_data(item_data, doc.id)
                 items.append(normalized)
             
-            # Búsqueda en memoria si se especificó
+            # Búsqueda en memoria si se especificó: filtra solo la página leída,
+            # así que 'total' sigue contando toda la colección
             if search:
                 search_lower = search.lower()
                 items = [item for item in items 
@@ -3976,10 +7213,10 @@ def create_generic_endpoints(collection_name):
                 'success': True,
                 'data': items,
                 'pagination': {
-                    'page': page,
                     'limit': limit,
                     'total': total_docs,
-                    'pages': (total_docs + limit - 1) // limit
+                    'has_more': has_more,
+                    'next_cursor': next_cursor
                 },
                 'collection': collection_name
             }), 200
@@ -3988,10 +7225,7 @@ def create_generic_endpoints(collection_name):
             print(f"Error obteniendo {collection_name}: {e}")
             return jsonify({'error': f'Error interno del servidor: {str(e)}'}), 500
 
-    # Renombrar la función para hacerla única
-    get_generic_collection.__name__ = f"{endpoint_prefix}_get_collection"
-
-    @app.route(f'/api/{collection_name}/<item_id>', methods=['GET'])
+    @app.route(f'/api/{collection_name}/<item_id>', methods=['GET'], endpoint=f"{endpoint_prefix}_get_item")
     @token_required
     def get_generic_item(user_data, item_id):
         """Endpoint genérico GET para un documento específico"""
@@ -4027,10 +7261,7 @@ def create_generic_endpoints(collection_name):
             print(f"Error obteniendo {collection_name}/{item_id}: {e}")
             return jsonify({'error': 'Error interno del servidor'}), 500
 
-    # Renombrar la función para hacerla única
-    get_generic_item.__name__ = f"{endpoint_prefix}_get_item"
-
-    @app.route(f'/api/{collection_name}', methods=['POST'])
+    @app.route(f'/api/{collection_name}', methods=['POST'], endpoint=f"{endpoint_prefix}_create_item")
     @token_required
     def create_generic_item(user_data):
         """Endpoint genérico POST para crear documento"""
@@ -4066,6 +7297,7 @@ def create_generic_endpoints(collection_name):
             
             # Crear documento
             db.collection(collection_name).document(data['id']).set(data)
+            adjust_collection_count(count_key, 1)
             
             return jsonify({
                 'success': True,
@@ -4078,10 +7310,7 @@ def create_generic_endpoints(collection_name):
             print(f"Error creando en {collection_name}: {e}")
             return jsonify({'error': 'Error interno del servidor'}), 500
 
-    # Renombrar la función para hacerla única
-    create_generic_item.__name__ = f"{endpoint_prefix}_create_item"
-
-    @app.route(f'/api/{collection_name}/<item_id>', methods=['PUT'])
+    @app.route(f'/api/{collection_name}/<item_id>', methods=['PUT'], endpoint=f"{endpoint_prefix}_update_item")
     @token_required
     def update_generic_item(user_data, item_id):
         """Endpoint genérico PUT para actualizar documento"""
@@ -4129,10 +7358,7 @@ def create_generic_endpoints(collection_name):
             print(f"Error actualizando {collection_name}/{item_id}: {e}")
             return jsonify({'error': 'Error interno del servidor'}), 500
 
-    # Renombrar la función para hacerla única
-    update_generic_item.__name__ = f"{endpoint_prefix}_update_item"
-
-    @app.route(f'/api/{collection_name}/<item_id>', methods=['DELETE'])
+    @app.route(f'/api/{collection_name}/<item_id>', methods=['DELETE'], endpoint=f"{endpoint_prefix}_delete_item")
     @token_required
     def delete_generic_item(user_data, item_id):
         """Endpoint genérico DELETE para eliminar documento"""
@@ -4157,6 +7383,7 @@ def create_generic_endpoints(collection_name):
             
             # Eliminar documento
             doc_ref.delete()
+            adjust_collection_count(count_key, -1)
             
             return jsonify({
                 'success': True,
@@ -4167,9 +7394,6 @@ def create_generic_endpoints(collection_name):
             print(f"Error eliminando de {collection_name}: {e}")
             return jsonify({'error': 'Error interno del servidor'}), 500
 
-    # Renombrar la función para hacerla única
-    delete_generic_item.__name__ = f"{endpoint_prefix}_delete_item"
-
     # Retornar los nombres de las funciones para referencia
     return {
         'get_collection': f"{endpoint_prefix}_get_collection",
@@ -4184,7 +7408,8 @@ def create_generic_endpoints(collection_name):
 # =============================================
 
 # Colecciones para las que se crearán endpoints genéricos automáticos
-collections_to_register = ['listas', 'reports', 'sagas', 'trending']
+# ('reports' tiene endpoints propios en /api/reports que mantienen sus contadores)
+collections_to_register = ['listas', 'sagas', 'trending']
 
 # Diccionario para mantener referencia a los endpoints genéricos
 generic_endpoints = {}
@@ -4226,6 +7451,16 @@ def too_large(error):
 # INICIALIZACIÓN
 # =============================================
 
+# El monitoreo de enlaces arranca con el primer request (ensure_link_monitoring_started)
+
+# Contadores de uso por plan: escritura en lote y reconciliación periódica
+# (todos los workers la programan, pero el lease del documento deja recorrer api_users a uno solo por intervalo)
+start_background_task('usage_stats_flush', flush_usage_stats, USAGE_STATS_FLUSH_INTERVAL, initial_delay=USAGE_STATS_FLUSH_INTERVAL)
+start_background_task('usage_stats_reconcile', reconcile_usage_stats, USAGE_STATS_RECONCILE_INTERVAL, initial_delay=USAGE_STATS_RECONCILE_INTERVAL)
+
+# Series temporales de uso: buckets de minuto/hora escritos en lote
+start_background_task('usage_rollups_flush', flush_usage_rollups, ROLLUP_FLUSH_INTERVAL, initial_delay=ROLLUP_FLUSH_INTERVAL)
+
 if __name__ == '__main__':
     print("🚀 Iniciando API Streaming con endpoints genéricos...")
     print(f"📊 Colecciones disponibles: {['peliculas', 'contenido', 'canales'] + collections_to_register}")
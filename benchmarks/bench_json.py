@@ -0,0 +1,189 @@
+"""Benchmark de serialización JSON: encoder estándar vs orjson.
+
+Construye respuestas con la forma de la API ya normalizada (listados de
+películas, series con temporadas/episodios, canales y usuarios con fechas de
+Firestore), mide el tiempo de serialización de cada proveedor y comprueba que
+ambos generen los mismos bytes.
+
+Uso:
+    python benchmarks/bench_json.py [--repeat 20] [--items 500]
+"""
+import argparse
+import os
+import sys
+import timeit
+from datetime import timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from google.api_core.datetime_helpers import DatetimeWithNanoseconds
+
+# Solo los proveedores: importar app inicializaría Firebase y los hilos en segundo plano
+from json_providers import FirestoreJSONProvider, OrjsonJSONProvider
+
+
+def make_movie(i):
+    """Película como la devuelve normalize_movie_data"""
+    movie = {
+        'id': f'pelicula-{i}',
+        'title': f'Película número {i}',
+        'poster': f'https://img.example.com/peliculas/{i}.jpg',
+        'description': 'Una historia de acción y aventura en la que el protagonista ' * 4,
+        'year': str(1980 + i % 45),
+        'genre': ', '.join(['Acción', 'Aventura', 'Ciencia ficción'][: 1 + i % 3]),
+        'rating': f'{5 + (i % 50) / 10:.1f}',
+        'original_title': f'Movie number {i}',
+        'actors': [f'Actor {i}-{j}' for j in range(6)],
+        'duration': '2h 15m',
+        'director': f'Director {i % 40}',
+        'play_links': [
+            {'server': f'server{j}', 'url': f'https://stream{j}.example.com/p/{i}', 'language': 'Latino'}
+            for j in range(3)
+        ],
+    }
+    if i % 7 == 0:
+        movie['type'] = 'Anime'
+    if i % 5 == 0:
+        movie['add'] = 'yes'
+    return movie
+
+
+def make_free_movie(movie):
+    """Película con la información recortada de limit_content_info (plan free)"""
+    return {
+        'id': movie['id'],
+        'title': movie['title'],
+        'year': movie['year'],
+        'genre': movie['genre'],
+        'rating': movie['rating'],
+        'poster': movie['poster'],
+        'description': movie['description'][:100] + '...',
+        'streaming_available': True,
+        'streaming_options_count': len(movie['play_links']),
+        'streaming_servers': [link['server'] for link in movie['play_links']],
+        'play_links': movie['play_links'],
+    }
+
+
+def make_series(i, seasons=4, episodes=12):
+    """Serie como la devuelve normalize_series_data (temporadas y episodios en listas)"""
+    return {
+        'id': f'serie-{i}',
+        'title': f'Serie número {i}',
+        'poster': f'https://img.example.com/series/{i}.jpg',
+        'description': 'Temporadas llenas de drama y suspenso ' * 4,
+        'year': str(2000 + i % 24),
+        'genre': 'Drama, Suspenso',
+        'rating': '8.1',
+        'total_seasons': seasons,
+        'status': 'En emisión',
+        'seasons': [
+            {
+                'season_number': s,
+                'episode_count': episodes,
+                'year': str(2000 + s),
+                'episodes': [
+                    {
+                        'episode_number': e,
+                        'title': f'Episodio {e}',
+                        'duration': '45m',
+                        'sinopsis': 'Resumen del episodio con algunos detalles.',
+                        'play_links': [
+                            {'server': 'server1', 'url': f'https://stream1.example.com/s/{i}/{s}/{e}'},
+                            {'server': 'server2', 'url': f'https://stream2.example.com/s/{i}/{s}/{e}'},
+                        ],
+                    }
+                    for e in range(1, episodes + 1)
+                ],
+            }
+            for s in range(1, seasons + 1)
+        ],
+    }
+
+
+def make_channel(i):
+    """Canal como lo devuelve normalize_channel_data"""
+    return {
+        'id': f'canal-{i}',
+        'name': f'Canal {i}',
+        'logo': f'https://img.example.com/canales/{i}.png',
+        'status': 'online',
+        'category': ['Deportes', 'Noticias', 'Infantil'][i % 3],
+        'country': ['MX', 'AR', 'ES', 'CO'][i % 4],
+        'stream_options': [
+            {'option_name': f'Opción {j}', 'stream_url': f'https://live{j}.example.com/c/{i}.m3u8'}
+            for j in range(2)
+        ],
+    }
+
+
+def make_user(i):
+    now = DatetimeWithNanoseconds.now(timezone.utc)
+    return {
+        'user_id': f'user{i}',
+        'username': f'usuario_{i}',
+        'email': f'usuario{i}@example.com',
+        'plan_type': 'free' if i % 4 else 'premium',
+        'active': True,
+        'created_at': now,
+        'last_used': now,
+        'total_usage_count': i * 13,
+        'daily_usage_count': i % 200,
+        'limits_info': {'daily_reset_in_seconds': 3600, 'session_reset_in_seconds': 60},
+    }
+
+
+def build_payloads(items):
+    movies = [make_movie(i) for i in range(items)]
+    series = [make_series(i) for i in range(max(1, items // 10))]
+    channels = [make_channel(i) for i in range(items // 2)]
+    return {
+        'peliculas (premium)': {'success': True, 'count': len(movies), 'data': movies},
+        'peliculas (free)': {
+            'success': True,
+            'count': len(movies),
+            'plan_restrictions': True,
+            'data': [make_free_movie(m) for m in movies],
+        },
+        'series (premium)': {'success': True, 'count': len(series), 'data': series},
+        'canales': {'success': True, 'count': len(channels), 'data': channels},
+        'admin users': {
+            'success': True,
+            'count': items,
+            'users': [make_user(i) for i in range(items)],
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--items', type=int, default=500)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    providers = {'stdlib': FirestoreJSONProvider(app)}
+    if OrjsonJSONProvider is not None:
+        providers['orjson'] = OrjsonJSONProvider(app)
+    else:
+        print('⚠️  orjson no está instalado: solo se mide el encoder estándar')
+
+    payloads = build_payloads(args.items)
+    print(f"{'payload':<22}{'bytes':>10}" + ''.join(f'{name + " ms":>14}' for name in providers) + f"{'speedup':>10}{'iguales':>10}")
+    with app.app_context():
+        for label, payload in payloads.items():
+            timings = {}
+            outputs = {}
+            for name, provider in providers.items():
+                outputs[name] = provider.response(payload).get_data()
+                total = timeit.timeit(lambda: provider.response(payload), number=args.repeat)
+                timings[name] = total / args.repeat * 1000
+            speedup = timings['stdlib'] / timings['orjson'] if 'orjson' in timings else 1.0
+            identical = 'sí' if len(set(outputs.values())) == 1 else 'NO'
+            size = len(outputs['stdlib'])
+            print(f'{label:<22}{size:>10}' + ''.join(f'{t:>14.3f}' for t in timings.values())
+                  + f'{speedup:>9.1f}x{identical:>10}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""Proveedores JSON de Flask para la API (encoder estándar y orjson).
+
+Módulo separado de app.py para poder usarlo (p. ej. en benchmarks) sin
+inicializar Firebase ni los hilos en segundo plano de la API.
+"""
+import math
+import uuid
+from datetime import datetime, date
+from decimal import Decimal
+
+from flask.json.provider import DefaultJSONProvider
+from firebase_admin import firestore
+
+# orjson es opcional: si no está instalado se usa el encoder estándar
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# =============================================
+# SERIALIZACIÓN JSON
+# =============================================
+
+# Tipo del centinela SERVER_TIMESTAMP (puede filtrarse en respuestas de creación)
+FIRESTORE_SENTINEL_TYPE = type(firestore.SERVER_TIMESTAMP)
+
+def json_default(o):
+    """Serializa tipos no nativos de JSON (incluye tipos de Firestore)"""
+    # datetime/date, incluido DatetimeWithNanoseconds de created_at/last_used
+    if isinstance(o, (datetime, date)):
+        return o.isoformat()
+    if isinstance(o, FIRESTORE_SENTINEL_TYPE):
+        return None
+    if isinstance(o, (set, frozenset, tuple)):
+        return list(o)
+    if isinstance(o, Decimal):
+        return float(o) if o.is_finite() else None
+    if isinstance(o, uuid.UUID):
+        return str(o)
+    # GeoPoint de Firestore
+    if hasattr(o, 'latitude') and hasattr(o, 'longitude'):
+        return {'latitude': o.latitude, 'longitude': o.longitude}
+    # DocumentReference de Firestore
+    if hasattr(o, 'path') and hasattr(o, 'id'):
+        return o.path
+    raise TypeError(f"Objeto de tipo {type(o).__name__} no serializable a JSON")
+
+def replace_non_finite(obj):
+    """Copia de obj con NaN/Infinity sustituidos por None"""
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, dict):
+        return {key: replace_non_finite(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [replace_non_finite(value) for value in obj]
+    return obj
+
+class FirestoreJSONProvider(DefaultJSONProvider):
+    """Proveedor JSON de la librería estándar con soporte para tipos de Firestore.
+
+    NaN e Infinity se escriben como null, igual que orjson (el encoder
+    estándar emitiría NaN, que no es JSON válido).
+    """
+    default = staticmethod(json_default)
+    sort_keys = False
+    ensure_ascii = False
+
+    def dumps(self, obj, **kwargs):
+        kwargs.setdefault('allow_nan', False)
+        try:
+            return super().dumps(obj, **kwargs)
+        except ValueError:
+            # Solo se recorre el objeto cuando contiene valores no finitos
+            return super().dumps(replace_non_finite(obj), **kwargs)
+
+if orjson is not None:
+    ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    class OrjsonJSONProvider(FirestoreJSONProvider):
+        """Proveedor JSON rápido basado en orjson"""
+
+        def dumps(self, obj, **kwargs):
+            return orjson.dumps(obj, default=json_default, option=ORJSON_OPTIONS).decode('utf-8')
+
+        def loads(self, s, **kwargs):
+            return orjson.loads(s)
+
+        def response(self, *args, **kwargs):
+            obj = self._prepare_response_obj(args, kwargs)
+            option = ORJSON_OPTIONS | orjson.OPT_APPEND_NEWLINE
+            if (self.compact is None and self._app.debug) or self.compact is False:
+                option |= orjson.OPT_INDENT_2
+            return self._app.response_class(
+                orjson.dumps(obj, default=json_default, option=option),
+                mimetype=self.mimetype
+            )
+else:
+    OrjsonJSONProvider = None
+
+# Proveedores disponibles: 'auto' usa orjson si está instalado
+JSON_PROVIDERS = {
+    'stdlib': FirestoreJSONProvider,
+    'orjson': OrjsonJSONProvider
+}
+
+def select_json_provider(name):
+    """Selecciona la clase de proveedor JSON según configuración"""
+    provider_class = JSON_PROVIDERS.get(name)
+    if provider_class is None:
+        if name not in ('auto', 'orjson'):
+            print(f"⚠️  Proveedor JSON desconocido '{name}', usando selección automática")
+        elif name == 'orjson':
+            print("⚠️  orjson no está instalado, usando encoder estándar")
+        provider_class = OrjsonJSONProvider or FirestoreJSONProvider
+    return provider_class
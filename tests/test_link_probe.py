@@ -0,0 +1,111 @@
+"""Monitoreo de enlaces de streaming contra un servidor HTTP local.
+
+Uso:
+    python -m pytest tests/test_link_probe.py
+"""
+import http.server
+import os
+import sys
+import threading
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app
+
+
+class LinkHandler(http.server.BaseHTTPRequestHandler):
+    """Responde 200 en /ok*, redirige /redirect a /ok y 404 en cualquier otra ruta"""
+
+    def do_HEAD(self):
+        if self.path.startswith('/redirect'):
+            self.send_response(302)
+            self.send_header('Location', '/ok')
+        else:
+            self.send_response(200 if self.path.startswith('/ok') else 404)
+        self.end_headers()
+
+    do_GET = do_HEAD
+
+    def log_message(self, *args):
+        pass
+
+
+class LinkProbeTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), LinkHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base = f'http://127.0.0.1:{cls.server.server_port}'
+        # El servidor de prueba es local: se permite solo en estas pruebas
+        app.LINK_PROBE_ALLOW_PRIVATE = True
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        app.LINK_PROBE_ALLOW_PRIVATE = False
+
+    def setUp(self):
+        app.link_health.clear()
+        app.link_probe_state.update(offset=0, total=0)
+
+    def test_probe_records_alive_and_dead_links(self):
+        ok_url, missing_url = f'{self.base}/ok', f'{self.base}/missing'
+
+        alive = app.probe_links([ok_url, missing_url])
+
+        self.assertEqual(alive, 1)
+        self.assertTrue(app.link_health[ok_url]['alive'])
+        self.assertEqual(app.link_health[ok_url]['status_code'], 200)
+        self.assertFalse(app.link_health[missing_url]['alive'])
+        self.assertEqual(app.link_health[missing_url]['status_code'], 404)
+        self.assertEqual(app.link_health[missing_url]['consecutive_failures'], 1)
+
+        app.probe_links([missing_url])
+        self.assertEqual(app.link_health[missing_url]['consecutive_failures'], 2)
+
+    def test_select_best_link_skips_dead_links(self):
+        links = [{'url': f'{self.base}/missing'}, {'url': f'{self.base}/ok'}]
+        app.probe_links([link['url'] for link in links])
+
+        best, health = app.select_best_link(links, 'url')
+
+        self.assertEqual(best['url'], f'{self.base}/ok')
+        self.assertTrue(health['alive'])
+
+    def test_batches_rotate_over_the_catalog(self):
+        urls = [f'{self.base}/ok{i}' for i in range(5)]
+        original_size = app.LINK_PROBE_BATCH_SIZE
+        app.LINK_PROBE_BATCH_SIZE = 2
+        try:
+            batches = [app.next_probe_batch(urls) for _ in range(3)]
+        finally:
+            app.LINK_PROBE_BATCH_SIZE = original_size
+
+        self.assertEqual([batch for batch, _ in batches], [urls[0:2], urls[2:4], [urls[4], urls[0]]])
+        self.assertEqual([complete for _, complete in batches], [False, False, True])
+
+    def test_private_hosts_are_not_probed(self):
+        app.LINK_PROBE_ALLOW_PRIVATE = False
+        try:
+            for url in [f'{self.base}/ok', 'http://169.254.169.254/latest/meta-data/',
+                        'http://[::1]/ok', 'ftp://example.com/ok', 'http:///ok']:
+                self.assertFalse(app.is_public_probe_url(url), url)
+            self.assertEqual(app.probe_links([f'{self.base}/ok']), 0)
+            self.assertIsNone(app.link_health[f'{self.base}/ok']['status_code'])
+        finally:
+            app.LINK_PROBE_ALLOW_PRIVATE = True
+
+    def test_redirects_are_checked_at_every_hop(self):
+        redirect_url = f'{self.base}/redirect'
+        self.assertEqual(app.probe_links([redirect_url]), 1)
+
+        # El destino de la redirección también debe ser público
+        with mock.patch.object(app, 'is_public_probe_url', side_effect=lambda url: url == redirect_url):
+            self.assertEqual(app.probe_links([redirect_url]), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+"""Paginación de /api/peliculas con page <= 0 en cada ruta del listado
+y ratings no finitos en el índice y en ?rating_min=.
+
+Uso:
+    python -m pytest tests/test_listing_pagination.py
+"""
+import os
+import sys
+import time
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app
+
+FREE_USER = {'user_id': 'u-free', 'plan_type': 'free', 'is_admin': False}
+PREMIUM_USER = {'user_id': 'u-premium', 'plan_type': 'premium', 'is_admin': False}
+
+
+class FakeSnapshot:
+    """Lo mínimo de un DocumentSnapshot que usa el catálogo"""
+
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self.exists = True
+        self.update_time = self.create_time = time.time()
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data)
+
+
+class PeliculasPageTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        for i in range(80):
+            app.catalog_upsert_snapshot('peliculas', FakeSnapshot(f'pelicula-{i:02d}', {
+                'title': f'Pelicula {i:02d}',
+                'details': {'year': '2001', 'genres': ['Drama'], 'rating': f'{i / 10:.1f}'},
+                'play_links': [{'server': 's1', 'url': f'https://example.com/{i}'}]
+            }))
+        app.catalog_loaded_at['peliculas'] = time.time()
+
+    @classmethod
+    def tearDownClass(cls):
+        for i in range(80):
+            app.catalog_remove('peliculas', f'pelicula-{i:02d}')
+        app.catalog_loaded_at['peliculas'] = 0
+
+    def list_peliculas(self, user_data, query):
+        with app.app.test_request_context(f'/api/peliculas?{query}'), \
+                mock.patch.object(app, 'check_firebase', return_value=None):
+            response = app.get_peliculas.__wrapped__(user_data)
+        if isinstance(response, tuple):
+            response, status = response
+        else:
+            status = response.status_code
+        return status, response.get_json()
+
+    def test_sorted_listing_ignores_non_positive_page(self):
+        for order in ['asc', 'desc']:
+            for page in [0, -3]:
+                status, body = self.list_peliculas(FREE_USER, f'sort=rating&order={order}&page={page}')
+                self.assertEqual(status, 200)
+                self.assertEqual(body['page'], 1)
+                first_page = self.list_peliculas(FREE_USER, f'sort=rating&order={order}&page=1')[1]
+                self.assertEqual([item['id'] for item in body['data']],
+                                 [item['id'] for item in first_page['data']])
+
+    def test_sorted_listing_stays_within_free_limit(self):
+        # Ascendente, las primeras 50 tienen rating 0.0-4.9: nada del final del catálogo
+        seen = set()
+        for page in range(-2, 8):
+            body = self.list_peliculas(FREE_USER, f'sort=rating&order=asc&page={page}&limit=10')[1]
+            seen.update(item['id'] for item in body['data'])
+        self.assertEqual(seen, {f'pelicula-{i:02d}' for i in range(50)})
+
+    def test_faceted_listing_ignores_non_positive_page(self):
+        for page in [0, -3]:
+            status, body = self.list_peliculas(PREMIUM_USER, f'genre=drama&page={page}&limit=5')
+            self.assertEqual(status, 200)
+            self.assertEqual(body['page'], 1)
+            self.assertEqual([item['id'] for item in body['data']],
+                             [f'pelicula-{i:02d}' for i in range(5)])
+
+    def test_plain_listing_never_uses_negative_offset(self):
+        fake_db = mock.MagicMock()
+        query = fake_db.collection.return_value.limit.return_value
+        query.offset.return_value.stream.return_value = []
+        with mock.patch.object(app, 'db', fake_db):
+            for page in [0, -3]:
+                status, body = self.list_peliculas(FREE_USER, f'page={page}&limit=0')
+                self.assertEqual(status, 200)
+                self.assertEqual(body['page'], 1)
+                fake_db.collection.return_value.limit.assert_called_with(1)
+                query.offset.assert_called_with(0)
+
+    def test_sort_index_rejects_negative_offset(self):
+        with self.assertRaises(ValueError):
+            app.query_sort_index('peliculas', 'rating', True, -1, 10)
+
+    def test_rating_min_rejects_non_finite_values(self):
+        for value in ['nan', 'inf', '-Infinity']:
+            status, _ = self.list_peliculas(PREMIUM_USER, f'rating_min={value}')
+            self.assertEqual(status, 400)
+
+    def test_non_finite_rating_is_indexed_without_rating(self):
+        for value in ['nan', 'inf']:
+            app.catalog_upsert_snapshot('peliculas', FakeSnapshot(f'pelicula-{value}', {
+                'title': f'Pelicula {value}',
+                'details': {'year': '2001', 'genres': ['Drama'], 'rating': value}
+            }))
+        try:
+            body = self.list_peliculas(PREMIUM_USER, 'sort=rating&order=desc&limit=100')[1]
+            ids = [item['id'] for item in body['data']]
+            # Sin rating van al final y el resto sigue ordenado
+            self.assertEqual(ids[:80], [f'pelicula-{i:02d}' for i in reversed(range(80))])
+            self.assertEqual(set(ids[80:]), {'pelicula-nan', 'pelicula-inf'})
+        finally:
+            app.catalog_remove('peliculas', 'pelicula-nan')
+            app.catalog_remove('peliculas', 'pelicula-inf')
+
+
+if __name__ == '__main__':
+    unittest.main()